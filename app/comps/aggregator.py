@@ -1,46 +1,303 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import asyncio, contextvars, functools, threading, time
+from app.config import AppConfig
+from app.comps.connectors.base import BaseConnector
+from app.comps.cache import SearchCache, CachedConnector
+from app.comps.table import CompFrame
+from app.comps.record import Comp
+from app.comps.dedup import drop_duplicates
+from app.utils import metrics
 from app.comps.connectors.sample import SampleConnector
 from app.comps.connectors.olx_stub import OLXConnector
 from app.comps.connectors.vivareal_stub import VivaRealConnector
 from app.comps.connectors.zap_stub import ZapConnector
-from app.geo.geocode import haversine_km
+from app.comps.connectors.http_portal import HTTPPortalConnector
 
-CONNECTORS = [
-    SampleConnector(),
-    OLXConnector(),
-    VivaRealConnector(),
-    ZapConnector(),
-]
+def _search_cache(cfg: AppConfig) -> SearchCache:
+    # SQLite aberto na primeira busca, não no import
+    return SearchCache(cfg.connector_cache_ttl_s, cfg.connector_cache_ttls,
+                       cfg.connector_cache_max_entries, disk_path=cfg.connector_cache_path or None)
 
-def get_comps(query: dict,
-              subject_lat: Optional[float] = None,
-              subject_lon: Optional[float] = None,
-              radius_km: Optional[float] = None) -> List[Dict[str, Any]]:
-    all_items: List[Dict[str, Any]] = []
-    for c in CONNECTORS:
+def _portal(stub: BaseConnector, cfg: AppConfig) -> BaseConnector:
+    # portal com URL em portal_urls vai por HTTP; os demais ficam no stub
+    url = cfg.portal_urls.get(stub.name)
+    return HTTPPortalConnector(stub.name, url, pool_size=cfg.portal_pool_size) if url else stub
+
+def build_connectors(cfg: AppConfig, cache: SearchCache) -> List[BaseConnector]:
+    return [
+        SampleConnector(),  # já em memória (CompStore), sem cache
+        CachedConnector(_portal(OLXConnector(), cfg), cache),
+        CachedConnector(_portal(VivaRealConnector(), cfg), cache),
+        CachedConnector(_portal(ZapConnector(), cfg), cache),
+    ]
+
+SEARCH_CACHE = _search_cache(AppConfig())
+
+CONNECTORS = build_connectors(AppConfig(), SEARCH_CACHE)
+
+# Buscas rodam em paralelo; threads de uma fonte travada ficam presas aqui
+# até ela responder, por isso o pool é folgado, cada fonte ocupa no máximo
+# `connector_max_in_flight` threads e o disjuntor corta a fonte.
+_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="connector")
+
+class CircuitBreaker:
+    """
+    Disjuntor por fonte: após `max_failures` falhas/timeouts seguidos, a fonte
+    é pulada por `reset_after_s`; depois disso uma chamada de teste decide se
+    volta ao normal (sucesso) ou reabre (falha). Também limita as chamadas em
+    andamento da fonte (`max_in_flight`, None = sem limite): cheio, a fonte é
+    pulada na hora em vez de esperar na fila atrás das próprias chamadas presas.
+    """
+
+    def __init__(self, max_failures: int = 3, reset_after_s: float = 60.0, max_in_flight: Optional[int] = None):
+        self.max_failures = max_failures
+        self.reset_after_s = reset_after_s
+        self.max_in_flight = max_in_flight
+        self.failures = 0
+        self.in_flight = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def acquire(self) -> bool:
+        # vaga para uma chamada; liberada por `release` quando ela termina de fato
+        with self._lock:
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def cancel_trial(self) -> None:
+        # chamada liberada por `allow` que não chegou a rodar: não conta como teste
+        with self._lock:
+            self._trial = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def breaker_for(name: str, cfg: Optional[AppConfig] = None) -> CircuitBreaker:
+    cfg = cfg or AppConfig()
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(cfg.breaker_max_failures, cfg.breaker_reset_s,
+                                             cfg.connector_max_in_flight)
+        return _breakers[name]
+
+def _search(c: BaseConnector, query: dict,
+            subject_lat: Optional[float], subject_lon: Optional[float],
+            radius_km: Optional[float], similar: Optional[Dict[str, Any]] = None) -> CompFrame:
+    with metrics.span(f"fetch.{c.name}", metrics.CONNECTOR_SECONDS, source=c.name):
+        if similar:
+            return c.search_similar(query, **similar)
+        # distância e raio resolvidos pelo conector (índice espacial quando houver)
+        return c.search_frame(query, subject_lat, subject_lon, radius_km)
+
+async def _asearch(c: BaseConnector, query: dict,
+                   subject_lat: Optional[float], subject_lon: Optional[float],
+                   radius_km: Optional[float], similar: Optional[Dict[str, Any]] = None) -> CompFrame:
+    with metrics.span(f"fetch.{c.name}", metrics.CONNECTOR_SECONDS, source=c.name):
+        if similar:
+            return await c.asearch_similar(query, **similar)
+        return await c.asearch_frame(query, subject_lat, subject_lon, radius_km)
+
+def _skip(c: BaseConnector, sources: Dict[str, List[str]], reason: str) -> None:
+    sources["skipped"].append(c.name)
+    metrics.CONNECTOR_RESULTS.inc(source=c.name, status=reason)
+
+def _admit(c: BaseConnector, breaker: CircuitBreaker, sources: Dict[str, List[str]]) -> bool:
+    # vaga da fonte antes do disjuntor: sem vaga, a chamada de teste não é consumida
+    if not breaker.acquire():
+        _skip(c, sources, "busy")
+        return False
+    if not breaker.allow():
+        breaker.release()
+        _skip(c, sources, "skipped")
+        return False
+    return True
+
+def _run(breaker: CircuitBreaker, started: List[float], began: threading.Event, fn, *args):
+    # no pool: marca o início de fato (o timeout da fonte conta daqui) e libera a vaga no fim
+    started.append(time.monotonic())
+    began.set()
+    try:
+        return fn(*args)
+    finally:
+        breaker.release()
+
+def _settle(c: BaseConnector, breaker: CircuitBreaker, sources: Dict[str, List[str]], status: str) -> None:
+    if status == "ok":
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+    sources[status].append(c.name)
+    metrics.CONNECTOR_RESULTS.inc(source=c.name, status=status)
+
+def fetch_frame(query: dict,
+                subject_lat: Optional[float] = None,
+                subject_lon: Optional[float] = None,
+                radius_km: Optional[float] = None,
+                connectors: Optional[List[BaseConnector]] = None,
+                cfg: Optional[AppConfig] = None,
+                similar: Optional[Dict[str, Any]] = None) -> Tuple[CompFrame, Dict[str, List[str]]]:
+    """
+    Consulta os conectores em paralelo, cada um com seu timeout (`timeout_s` do
+    conector ou `connector_timeout_s`, contado de quando a chamada começa a
+    rodar no pool) e todos dentro de `comps_deadline_s`.
+    Com `similar` ({"subject", "k", "scales"}), cada conector devolve os k
+    comps mais parecidos de cada finalidade (`search_similar`) em vez do raio.
+    Retorna (CompFrame com os comps na ordem dos conectores, sem anúncios
+    repetidos entre eles, e fontes por situação: ok / timed_out / failed /
+    skipped pelo disjuntor).
+    """
+    cfg = cfg or AppConfig()
+    connectors = CONNECTORS if connectors is None else connectors
+    sources: Dict[str, List[str]] = {"ok": [], "timed_out": [], "failed": [], "skipped": []}
+    start = time.monotonic()
+    deadline = start + cfg.comps_deadline_s
+
+    pending = []
+    for c in connectors:
+        breaker = breaker_for(c.name, cfg)
+        if not _admit(c, breaker, sources):
+            continue
+        started: List[float] = []
+        began = threading.Event()
+        # a thread herda o contexto (tempos por requisição de metrics.collect_timings)
+        fut = _EXECUTOR.submit(contextvars.copy_context().run, _run, breaker, started, began, _search,
+                               c, query, subject_lat, subject_lon, radius_km, similar)
+        pending.append((c, breaker, fut, started, began))
+
+    frames: List[CompFrame] = []
+    for c, breaker, fut, started, began in pending:
+        timeout = c.timeout_s if c.timeout_s is not None else cfg.connector_timeout_s
+        # na fila do pool até o prazo: não é culpa da fonte (nem falha no disjuntor)
+        if not began.wait(max(deadline - time.monotonic(), 0.0)) and fut.cancel():
+            breaker.release()
+            breaker.cancel_trial()
+            _skip(c, sources, "queued")
+            continue
+        began.wait()
+        remaining = min(started[0] + timeout, deadline) - time.monotonic()
         try:
-            items = c.search(query)
-            for it in items:
-                it["source"] = it.get("source") or c.name
-            all_items.extend(items)
+            frame = fut.result(timeout=max(remaining, 0.0))
+        except FutureTimeout:
+            _settle(c, breaker, sources, "timed_out")
+            continue
         except Exception:
             # conector falhou, segue o jogo
+            _settle(c, breaker, sources, "failed")
             continue
+        _settle(c, breaker, sources, "ok")
+        frames.append(frame)
 
-    # Se tiver lat/lon do assunto e do comp, calcula distância e filtra por raio
-    for it in all_items:
-        lat, lon = it.get("lat"), it.get("lon")
-        if subject_lat is not None and subject_lon is not None and lat is not None and lon is not None:
-            it["distance_km"] = haversine_km(subject_lat, subject_lon, lat, lon)
+    # o mesmo anúncio em vários portais conta uma vez só
+    return drop_duplicates(CompFrame.concat(frames)), sources
+
+def fetch_comps(query: dict,
+                subject_lat: Optional[float] = None,
+                subject_lon: Optional[float] = None,
+                radius_km: Optional[float] = None,
+                connectors: Optional[List[BaseConnector]] = None,
+                cfg: Optional[AppConfig] = None) -> Tuple[List[Comp], Dict[str, List[str]]]:
+    # como `fetch_frame`, com os comps já como registros (Comp: leitura como dict, sem cópia em dict)
+    frame, sources = fetch_frame(query, subject_lat, subject_lon, radius_km, connectors, cfg)
+    return frame.comps(), sources
+
+def _finished(breaker: CircuitBreaker, task: "asyncio.Future") -> None:
+    # fim de fato da chamada (mesmo abandonada): libera a vaga; erro já contado ou descartado
+    breaker.release()
+    if not task.cancelled():
+        task.exception()
+
+async def afetch_frame(query: dict,
+                       subject_lat: Optional[float] = None,
+                       subject_lon: Optional[float] = None,
+                       radius_km: Optional[float] = None,
+                       connectors: Optional[List[BaseConnector]] = None,
+                       cfg: Optional[AppConfig] = None,
+                       similar: Optional[Dict[str, Any]] = None) -> Tuple[CompFrame, Dict[str, List[str]]]:
+    """
+    Versão assíncrona de `fetch_frame` (mesmos timeouts, prazo e disjuntor),
+    aguardando `asearch_frame` (ou `asearch_similar`) de todos os conectores ao
+    mesmo tempo. Chamadas que passam do timeout são abandonadas, não
+    canceladas (a thread por baixo não para): a vaga da fonte só volta quando
+    terminam.
+    """
+    cfg = cfg or AppConfig()
+    connectors = CONNECTORS if connectors is None else connectors
+    sources: Dict[str, List[str]] = {"ok": [], "timed_out": [], "failed": [], "skipped": []}
+
+    allowed = []
+    for c in connectors:
+        breaker = breaker_for(c.name, cfg)
+        if not _admit(c, breaker, sources):
+            continue
+        task = asyncio.ensure_future(_asearch(c, query, subject_lat, subject_lon, radius_km, similar))
+        task.add_done_callback(functools.partial(_finished, breaker))
+        timeout = c.timeout_s if c.timeout_s is not None else cfg.connector_timeout_s
+        allowed.append((c, breaker, task, min(timeout, cfg.comps_deadline_s)))
+
+    done = await asyncio.gather(*(asyncio.wait({task}, timeout=t) for _, _, task, t in allowed))
+    frames: List[CompFrame] = []
+    for (c, breaker, task, _), (finished, _) in zip(allowed, done):
+        if not finished:
+            _settle(c, breaker, sources, "timed_out")
+        elif task.exception() is not None:
+            _settle(c, breaker, sources, "failed")
         else:
-            it["distance_km"] = None
+            _settle(c, breaker, sources, "ok")
+            frames.append(task.result())
+    # o mesmo anúncio em vários portais conta uma vez só
+    return drop_duplicates(CompFrame.concat(frames)), sources
 
-    if radius_km is not None:
-        out = []
-        for it in all_items:
-            d = it.get("distance_km")
-            if d is None or d <= radius_km:
-                out.append(it)
-        all_items = out
+async def afetch_comps(query: dict,
+                       subject_lat: Optional[float] = None,
+                       subject_lon: Optional[float] = None,
+                       radius_km: Optional[float] = None,
+                       connectors: Optional[List[BaseConnector]] = None,
+                       cfg: Optional[AppConfig] = None) -> Tuple[List[Comp], Dict[str, List[str]]]:
+    frame, sources = await afetch_frame(query, subject_lat, subject_lon, radius_km, connectors, cfg)
+    return frame.comps(), sources
 
-    return all_items
+def get_comps(query: dict,
+              subject_lat: Optional[float] = None,
+              subject_lon: Optional[float] = None,
+              radius_km: Optional[float] = None) -> List[Comp]:
+    items, _ = fetch_comps(query, subject_lat, subject_lon, radius_km)
+    return items
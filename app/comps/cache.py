@@ -0,0 +1,149 @@
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import json, threading, time
+from app.comps.connectors.base import BaseConnector, to_comp
+from app.comps.record import Comp
+from app.utils.cache import SQLiteCache
+from app.utils import metrics
+
+def normalize_query(query: dict) -> str:
+    # chave estável: campos ordenados, texto sem espaços extras e sem caixa
+    norm = {}
+    for k, v in query.items():
+        if v is None:
+            continue
+        norm[k] = " ".join(v.split()).casefold() if isinstance(v, str) else v
+    return json.dumps(norm, sort_keys=True, ensure_ascii=False)
+
+class SearchCache:
+    """
+    Cache de resultados de `search` por (fonte, consulta normalizada): LRU em
+    memória com TTL e, opcionalmente, uma camada SQLite compartilhada entre
+    processos/reinícios. TTL por fonte em `ttls` (padrão `default_ttl_s`).
+    Com `disk_path` (em vez de `disk`), o SQLite só é aberto no primeiro uso.
+    """
+
+    def __init__(self, default_ttl_s: float = 3600.0,
+                 ttls: Optional[Dict[str, float]] = None,
+                 max_entries: int = 1024,
+                 disk: Optional[SQLiteCache] = None,
+                 disk_path: Optional[str] = None):
+        self.default_ttl_s = default_ttl_s
+        self.ttls = dict(ttls or {})
+        self.max_entries = max_entries
+        self._disk = disk
+        self._disk_path = disk_path if disk is None else None
+        self._disk_lock = threading.Lock()
+        self._mem: "OrderedDict[Tuple[str, str], Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def disk(self) -> Optional[SQLiteCache]:
+        # camada SQLite aberta sob demanda (importar o módulo não cria arquivo)
+        if self._disk is None and self._disk_path is not None:
+            with self._disk_lock:
+                if self._disk is None:
+                    self._disk = SQLiteCache(self._disk_path)
+        return self._disk
+
+    def ttl_for(self, source: str) -> float:
+        return self.ttls.get(source, self.default_ttl_s)
+
+    def _count(self, source: str, kind: str) -> None:
+        s = self._stats.setdefault(source, {"hits": 0, "disk_hits": 0, "misses": 0})
+        s[kind] += 1
+        metrics.CACHE_REQUESTS.inc(cache="connector_search", result=kind)
+
+    def get(self, source: str, query: dict) -> Optional[List[Dict[str, Any]]]:
+        key = (source, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                if hit[0] > now:
+                    self._mem.move_to_end(key)
+                    self._count(source, "hits")
+                    return hit[1]
+                del self._mem[key]
+        disk = self.disk
+        if disk is not None:
+            rec = disk.get(self._disk_key(*key))
+            if rec is not None and rec["expires_at"] > now:
+                with self._lock:
+                    self._put(key, rec["expires_at"], rec["items"])
+                    self._count(source, "disk_hits")
+                return rec["items"]
+        with self._lock:
+            self._count(source, "misses")
+        return None
+
+    def set(self, source: str, query: dict, items: List[Dict[str, Any]]) -> None:
+        key = (source, normalize_query(query))
+        expires_at = time.time() + self.ttl_for(source)
+        with self._lock:
+            self._put(key, expires_at, items)
+        disk = self.disk
+        if disk is not None:
+            # em disco como JSON: Comp vira dict só aqui
+            rows = [it.to_dict() if isinstance(it, Comp) else it for it in items]
+            disk.set(self._disk_key(*key), {"expires_at": expires_at, "items": rows})
+
+    @staticmethod
+    def _disk_key(source: str, qkey: str) -> str:
+        return f"{source}\t{qkey}"
+
+    def _put(self, key, expires_at: float, items: List[Dict[str, Any]]) -> None:
+        self._mem[key] = (expires_at, items)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def invalidate(self, source: Optional[str] = None, query: Optional[dict] = None) -> int:
+        """
+        Remove entradas: todas, de uma fonte, ou de uma (fonte, consulta).
+        Retorna quantas saíram da memória.
+        """
+        qkey = normalize_query(query) if query is not None else None
+        with self._lock:
+            keys = [k for k in self._mem
+                    if (source is None or k[0] == source) and (qkey is None or k[1] == qkey)]
+            for k in keys:
+                del self._mem[k]
+        disk = self.disk
+        if disk is not None:
+            if source is None and qkey is None:
+                disk.clear()
+            elif source is None:
+                disk.delete_matching(lambda k: k.split("\t", 1)[1] == qkey)
+            elif qkey is None:
+                disk.delete_prefix(f"{source}\t")
+            else:
+                disk.delete(self._disk_key(source, qkey))
+        return len(keys)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {k: dict(v) for k, v in self._stats.items()}
+
+class CachedConnector(BaseConnector):
+    """
+    Envolve um conector e guarda os resultados de `search` em um SearchCache.
+    Os itens devolvidos são cópias em Comp (o agregador anota `source`/`distance_km`).
+    """
+
+    def __init__(self, inner: BaseConnector, cache: SearchCache):
+        self.inner = inner
+        self.cache = cache
+        self.name = inner.name
+        self.timeout_s = inner.timeout_s
+
+    def search(self, query: dict) -> List[Dict[str, Any]]:
+        items = self.cache.get(self.name, query)
+        if items is None:
+            items = self.inner.search(query)
+            self.cache.set(self.name, query, items)
+        return [to_comp(it) for it in items]
+
+    def invalidate(self, query: Optional[dict] = None) -> int:
+        return self.cache.invalidate(self.name, query)
@@ -1,24 +1,96 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 from abc import ABC, abstractmethod
-
-STANDARD_FIELDS = [
-    "id", "title", "address", "city", "state", "lat", "lon", "url", "source",
-    "property_type", "built_area_m2", "land_area_m2", "bedrooms", "bathrooms", "parking",
-    "is_rental", "price_total", "price_per_m2", "date_posted", "extras"
-]
+import asyncio
+import numpy as np
+from app.geo.geocode import haversine_km_vec
+from app.comps.table import CompFrame
+from app.comps.similarity import SimilarityIndex
+from app.comps.record import STANDARD_FIELDS, Comp
 
 class BaseConnector(ABC):
     name: str
+    timeout_s: Optional[float] = None  # None = AppConfig.connector_timeout_s
 
     @abstractmethod
     def search(self, query: dict) -> List[Dict[str, Any]]:
         """
-        Retorna lista de dicionários padronizados (campos em STANDARD_FIELDS).
+        Retorna lista de Comp (ou de dicionários padronizados, campos em
+        STANDARD_FIELDS).
         """
         pass
 
+    def search_near(self, query: dict, lat: float, lon: float,
+                    radius_km: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Como `search`, mas com `distance_km` preenchido e filtrado pelo raio
+        (comps sem lat/lon ficam, com distância None). Conectores com índice
+        espacial devem sobrescrever; o padrão calcula as distâncias em lote.
+        """
+        items = self.search(query)
+        if not items:
+            return items
+        lats = np.array([np.nan if it.get("lat") is None else it["lat"] for it in items], dtype=float)
+        lons = np.array([np.nan if it.get("lon") is None else it["lon"] for it in items], dtype=float)
+        dists = haversine_km_vec(lat, lon, lats, lons)
+        out = []
+        for it, d in zip(items, dists):
+            if np.isnan(d):
+                it["distance_km"] = None
+            elif radius_km is not None and d > radius_km:
+                continue
+            else:
+                it["distance_km"] = float(d)
+            out.append(it)
+        return out
+
+    async def asearch(self, query: dict) -> List[Dict[str, Any]]:
+        # variante assíncrona; conectores com cliente HTTP assíncrono sobrescrevem
+        return await asyncio.to_thread(self.search, query)
+
+    async def asearch_near(self, query: dict, lat: float, lon: float,
+                           radius_km: Optional[float] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.search_near, query, lat, lon, radius_km)
+
+    def search_frame(self, query: dict, lat: Optional[float] = None, lon: Optional[float] = None,
+                     radius_km: Optional[float] = None) -> CompFrame:
+        """
+        Resultado de `search_near` (com assunto) ou `search` como CompFrame.
+        Conectores que já guardam os dados em colunas (CompTable) sobrescrevem
+        e devolvem o frame sem passar por dicts.
+        """
+        if lat is not None and lon is not None:
+            return CompFrame.from_records(self.search_near(query, lat, lon, radius_km), self.name)
+        return CompFrame.from_records(self.search(query), self.name, has_subject=False)
+
+    async def asearch_frame(self, query: dict, lat: Optional[float] = None, lon: Optional[float] = None,
+                            radius_km: Optional[float] = None) -> CompFrame:
+        if lat is not None and lon is not None:
+            return CompFrame.from_records(await self.asearch_near(query, lat, lon, radius_km), self.name)
+        return CompFrame.from_records(await self.asearch(query), self.name, has_subject=False)
+
+    def search_similar(self, query: dict, subject: Dict[str, Any], k: int,
+                       scales: Optional[Dict[str, float]] = None) -> CompFrame:
+        """
+        Os k comps com preço mais parecidos com `subject` (dict de PropertyInput
+        com "lat"/"lon") de cada finalidade, com `distance_km`. Conectores com
+        store local sobrescrevem com o índice pronto; o padrão busca tudo e
+        seleciona entre os do tipo pedido.
+        """
+        frame = self.search_frame(query, subject.get("lat"), subject.get("lon"))
+        if query.get("property_type"):
+            frame = frame.take(np.flatnonzero(frame.category_mask("property_type", query["property_type"])))
+        return SimilarityIndex(frame, scales).select(subject, k)
+
+    async def asearch_similar(self, query: dict, subject: Dict[str, Any], k: int,
+                              scales: Optional[Dict[str, float]] = None) -> CompFrame:
+        return await asyncio.to_thread(self.search_similar, query, subject, k, scales)
+
 def normalize_record(rec: Dict[str, Any]) -> Dict[str, Any]:
     # Garante presença de campos padrão
     for k in STANDARD_FIELDS:
         rec.setdefault(k, None)
     return rec
+
+def to_comp(rec: Union[Comp, Dict[str, Any]]) -> Comp:
+    # registro de conector (Comp ou dict) como Comp próprio (cópia rasa)
+    return Comp.of(rec)
@@ -0,0 +1,47 @@
+# Conector HTTP genérico para a busca de um portal (OLX, Viva Real, Zap) que
+# já devolve anúncios no formato de STANDARD_FIELDS: {"listings": [...]}.
+# Hoje aponta para os substitutos locais de benchmarks/standin.py (teste de
+# carga); uma integração real troca `_params`/`_parse` pelo formato do portal.
+
+from typing import List, Dict, Any, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from app.config import AppConfig
+from app.comps.connectors.base import BaseConnector, to_comp
+from app.comps.record import Comp
+
+# campos da consulta repassados ao portal
+QUERY_PARAMS = ("city", "state", "property_type")
+
+class HTTPPortalConnector(BaseConnector):
+    """
+    Busca por GET {base_url}/search numa sessão requests com pool de conexões
+    keep-alive (até `pool_size` abertas, compartilhadas pelas threads do
+    agregador). Resposta fora de 2xx ou corpo inválido levantam exceção: o
+    agregador conta como falha (e o disjuntor corta a fonte).
+    """
+
+    def __init__(self, name: str, base_url: str, timeout_s: Optional[float] = None, pool_size: int = 32):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout_s = timeout_s
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _params(self, query: dict) -> Dict[str, Any]:
+        return {k: query[k] for k in QUERY_PARAMS if query.get(k)}
+
+    def _parse(self, body: Dict[str, Any]) -> List[Comp]:
+        return [to_comp(dict(it, source=self.name)) for it in body["listings"]]
+
+    def search(self, query: dict) -> List[Comp]:
+        # o agregador abandona a espera no timeout; o da requisição libera a thread
+        timeout = self.timeout_s if self.timeout_s is not None else AppConfig().connector_timeout_s
+        resp = self.session.get(f"{self.base_url}/search", params=self._params(query), timeout=timeout)
+        resp.raise_for_status()
+        return self._parse(resp.json())
+
+    def close(self) -> None:
+        self.session.close()
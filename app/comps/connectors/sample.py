@@ -1,6 +1,8 @@
-from typing import List, Dict, Any
-import json, os, datetime
-from app.comps.connectors.base import BaseConnector, normalize_record
+from typing import List, Dict, Any, Optional
+import asyncio, os
+from app.comps.connectors.base import BaseConnector
+from app.comps.store import load_store
+from app.comps.table import CompFrame
 
 DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "..", "data", "sample_listings.json")
 DATA_PATH = os.path.abspath(DATA_PATH)
@@ -8,14 +10,36 @@ DATA_PATH = os.path.abspath(DATA_PATH)
 class SampleConnector(BaseConnector):
     name = "sample"
 
+    def __init__(self, path: str = DATA_PATH):
+        # JSON de anúncios ou diretório de snapshot colunar (ver store.write_snapshot)
+        self.path = path
+
     def search(self, query: dict) -> List[Dict[str, Any]]:
         # Ignora o query para o MVP: retorna dados estáticos e filtra por tipo
-        with open(DATA_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        items = []
-        ptype = query.get("property_type")
-        for rec in data:
-            if ptype and rec.get("property_type") != ptype:
-                continue
-            items.append(normalize_record(rec))
-        return items
+        store = load_store(self.path)
+        return store.rows(store.indices(query.get("property_type")))
+
+    def search_near(self, query: dict, lat: float, lon: float,
+                    radius_km: Optional[float] = None) -> List[Dict[str, Any]]:
+        store = load_store(self.path)
+        idx, dist = store.query_radius(lat, lon, radius_km, query.get("property_type"))
+        return store.rows(idx, dist)
+
+    def search_frame(self, query: dict, lat: Optional[float] = None, lon: Optional[float] = None,
+                     radius_km: Optional[float] = None) -> CompFrame:
+        store = load_store(self.path)
+        if lat is not None and lon is not None:
+            idx, dist = store.query_radius(lat, lon, radius_km, query.get("property_type"))
+            return store.frame(idx, dist, self.name)
+        return store.frame(store.indices(query.get("property_type")), None, self.name)
+
+    async def asearch_frame(self, query: dict, lat: Optional[float] = None, lon: Optional[float] = None,
+                            radius_km: Optional[float] = None) -> CompFrame:
+        return await asyncio.to_thread(self.search_frame, query, lat, lon, radius_km)
+
+    def search_similar(self, query: dict, subject: Dict[str, Any], k: int,
+                       scales: Optional[Dict[str, float]] = None) -> CompFrame:
+        # índice de semelhança do store (montado uma vez por versão do snapshot)
+        store = load_store(self.path)
+        frame = store.similarity(query.get("property_type"), scales).select(subject, k)
+        return CompFrame(frame.tables, [self.name], frame.part, frame.row, frame.distance_km)
@@ -0,0 +1,221 @@
+from typing import List, Dict, Any, Optional, Tuple
+import math, re, zlib
+import numpy as np
+from app.geo.gazetteer import normalize
+from app.geo.geocode import haversine_km
+from app.comps.table import CompFrame
+
+# primo de Mersenne 2^31 - 1 para o hash universal (a·x + b) mod P
+_P = np.uint64((1 << 31) - 1)
+_MIX = np.uint64(0x100000001B3)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_NO_TEXT = np.uint32(0xFFFFFFFF)
+
+def listing_text(rec: Dict[str, Any]) -> str:
+    # endereço normalizado (logradouro por extenso); o título, que cada portal
+    # reescreve, só quando não há endereço
+    return normalize(rec.get("address"), street=True) or normalize(rec.get("title"))
+
+def house_number(rec: Dict[str, Any]) -> int:
+    # número depois da vírgula ("Av. X, 1234 - galpão 2" -> 1234); 0 = sem número
+    parts = re.split(r"[,;]", rec.get("address") or "", maxsplit=1)
+    m = re.search(r"\d+", parts[1]) if len(parts) > 1 else None
+    return int(m.group()) % (1 << 31) if m else 0
+
+def block_key(rec: Dict[str, Any]) -> int:
+    # o mesmo anúncio em dois portais tem mesmo tipo, finalidade e cidade
+    return zlib.crc32(f"{rec.get('property_type')}|{rec.get('is_rental')}|{normalize(rec.get('city'))}".encode())
+
+def _float(v) -> float:
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else math.nan
+
+class Deduplicator:
+    """
+    Detecta o mesmo imóvel anunciado em vários portais. O texto (endereço ou,
+    sem ele, título) vira uma assinatura MinHash de trigramas; LSH em `bands` faixas
+    acha candidatos por tabela hash de tamanho fixo (2^table_bits posições por
+    faixa, o último anúncio da posição fica). Candidato é duplicata se tem o
+    mesmo tipo/finalidade/cidade, similaridade estimada >= min_similarity, área
+    a até `area_tol` (relativa), o mesmo número no logradouro e, quando ambos
+    têm coordenadas, está a até `max_km` (dado ausente em um dos dois não
+    elimina o par). Guarda por anúncio único só assinatura, número, elos das
+    listas e lat/lon/área (float32): ~190 bytes.
+    """
+
+    def __init__(self, num_perm: int = 32, bands: int = 8, table_bits: int = 21,
+                 max_km: float = 0.3, area_tol: float = 0.05, min_similarity: float = 0.5,
+                 max_chain: int = 16, seed: int = 0):
+        if num_perm % bands:
+            raise ValueError("num_perm deve ser múltiplo de bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.table_bits = table_bits
+        self.max_km = max_km
+        self.area_tol = area_tol
+        self.min_similarity = min_similarity
+        self.max_chain = max_chain
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_P), num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_P), num_perm, dtype=np.uint64)
+        self._buckets = np.full((bands, 1 << table_bits), -1, dtype=np.int32)
+        self._band_ids = np.arange(bands)
+        self.n = 0
+        self._sig = np.empty((0, num_perm), dtype=np.uint32)
+        self._block = np.empty(0, dtype=np.uint32)
+        self._geo = np.empty((0, 3), dtype=np.float32)  # lat, lon, área
+        self._num = np.empty(0, dtype=np.int32)
+        self._next = np.empty((0, bands), dtype=np.int32)  # anterior na mesma posição, por faixa
+
+    def params(self) -> Dict[str, Any]:
+        # o que precisa bater para reaproveitar assinaturas gravadas
+        return {"num_perm": self.num_perm, "a": self._a.tolist(), "b": self._b.tolist()}
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """
+        MinHash [len(texts), num_perm] dos trigramas de cada texto (já
+        normalizado, só ASCII: o trigrama é o próprio inteiro de 24 bits).
+        Texto vazio recebe a assinatura _NO_TEXT (não entra no LSH).
+        """
+        sig = np.full((len(texts), self.num_perm), _NO_TEXT, dtype=np.uint32)
+        padded = [f" {t} ".encode("ascii", "ignore") if t else b"" for t in texts]
+        lens = np.fromiter((max(len(p) - 2, 0) for p in padded), dtype=np.int64, count=len(padded))
+        has = np.flatnonzero(lens > 0)
+        if not len(has):
+            return sig
+        buf = np.frombuffer(b"".join(padded[i] for i in has), dtype=np.uint8).astype(np.uint64)
+        n_grams = lens[has]
+        starts = np.concatenate([[0], np.cumsum(n_grams + 2)[:-1]])
+        seg = np.concatenate([[0], np.cumsum(n_grams)[:-1]])
+        # posições de início de trigrama no buffer (não atravessam textos)
+        pos = np.arange(int(n_grams.sum())) + np.repeat(starts - seg, n_grams)
+        grams = (buf[pos] << np.uint64(16)) | (buf[pos + 1] << np.uint64(8)) | buf[pos + 2]
+        # uma permutação por vez: memória O(trigramas do lote)
+        for p in range(self.num_perm):
+            h = (self._a[p] * grams + self._b[p]) % _P
+            sig[has, p] = np.minimum.reduceat(h, seg)
+        return sig
+
+    def _slots(self, sig: np.ndarray, block: np.ndarray) -> np.ndarray:
+        # posição de cada faixa na tabela: hash(bloco, valores da faixa) [n, bands]
+        rows = self.num_perm // self.bands
+        v = sig.reshape(len(sig), self.bands, rows).astype(np.uint64)
+        h = np.broadcast_to(block.astype(np.uint64)[:, None], (len(sig), self.bands)).copy()
+        for r in range(rows):
+            h = (h * _MIX) ^ v[:, :, r]
+        return ((h * _GOLDEN) >> np.uint64(64 - self.table_bits)).astype(np.int64)
+
+    def _grow(self, extra: int) -> None:
+        need = self.n + extra
+        if need <= len(self._block):
+            return
+        cap = max(need, 2 * len(self._block), 1024)
+        for name in ("_sig", "_block", "_geo", "_num", "_next"):
+            old = getattr(self, name)
+            new = np.empty((cap,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def _register(self, row: int, sig: np.ndarray, block: int, geo: Tuple[float, float, float],
+                  num: int, slots: Optional[np.ndarray]) -> None:
+        self._sig[row], self._block[row], self._geo[row], self._num[row] = sig, block, geo, num
+        self._next[row] = -1
+        if slots is not None:
+            self._next[row] = self._buckets[self._band_ids, slots]
+            self._buckets[self._band_ids, slots] = row
+
+    def _same(self, sig: np.ndarray, block: int, geo: Tuple[float, float, float], num: int, j: int) -> bool:
+        if int(self._block[j]) != block:
+            return False
+        num2 = int(self._num[j])
+        if num and num2 and num != num2:
+            return False
+        lat, lon, area = geo
+        lat2, lon2, area2 = (float(x) for x in self._geo[j])
+        # área/coordenadas ausentes em qualquer um dos dois não eliminam o par
+        if not (math.isnan(area) or math.isnan(area2)) and abs(area - area2) > self.area_tol * max(area, area2):
+            return False
+        if not any(math.isnan(x) for x in (lat, lon, lat2, lon2)) \
+                and haversine_km(lat, lon, lat2, lon2) > self.max_km:
+            return False
+        return np.count_nonzero(self._sig[j] == sig) >= self.min_similarity * self.num_perm
+
+    def _find(self, sig: np.ndarray, block: int, geo: Tuple[float, float, float], num: int,
+              slots: np.ndarray) -> int:
+        # primeira duplicata nas listas das faixas (mais recentes primeiro), ou -1
+        seen = set()
+        for b, j in enumerate(self._buckets[self._band_ids, slots].tolist()):
+            steps = 0
+            while j >= 0 and steps < self.max_chain:
+                if j not in seen:
+                    if self._same(sig, block, geo, num, j):
+                        return j
+                    seen.add(j)
+                j = int(self._next[j, b])
+                steps += 1
+        return -1
+
+    def add(self, records: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Registra os anúncios, em ordem; devolve, para cada um, a linha do
+        anúncio já visto de que é duplicata (-1 = novo, registrado com a
+        próxima linha, self.n - 1 após ele). Duplicatas dentro do próprio lote
+        também são detectadas.
+        """
+        k = self.keys(records)
+        sig, block, nums = k["sig"], k["block"], k["num"].tolist()
+        slots = self._slots(sig, block)
+        has_text = sig[:, 0] != _NO_TEXT
+        dup_of = np.full(len(records), -1, dtype=np.int64)
+        self._grow(len(records))
+        for i, r in enumerate(records):
+            geo = (_float(r.get("lat")), _float(r.get("lon")), _float(r.get("built_area_m2")))
+            num = nums[i]
+            if has_text[i]:
+                dup_of[i] = self._find(sig[i], int(block[i]), geo, num, slots[i])
+            if dup_of[i] < 0:
+                self._register(self.n, sig[i], int(block[i]), geo, num, slots[i] if has_text[i] else None)
+                self.n += 1
+        return dup_of
+
+    def seed(self, state: Dict[str, np.ndarray], lat: np.ndarray, lon: np.ndarray, area: np.ndarray) -> None:
+        # anúncios já aceitos (ex.: snapshot anterior), sem checar duplicatas entre eles
+        sig, block = state["sig"], state["block"]
+        k = len(block)
+        self._grow(k)
+        rows = np.arange(self.n, self.n + k)
+        self._sig[rows], self._block[rows], self._num[rows] = sig, block, state["num"]
+        self._geo[rows] = np.column_stack([lat, lon, area])
+        self._next[rows] = -1
+        has = np.flatnonzero(sig[:, 0] != _NO_TEXT)
+        slots = self._slots(sig[has], block[has])
+        for b in range(self.bands):
+            # mesmas listas que `add` montaria registrando as linhas em ordem
+            order = np.lexsort((rows[has], slots[:, b]))
+            sl, rw = slots[order, b], rows[has][order]
+            first = np.r_[True, sl[1:] != sl[:-1]]
+            self._next[rw, b] = np.where(first, self._buckets[b, sl], np.r_[-1, rw[:-1]])
+            self._buckets[b, sl] = rw
+        self.n += k
+
+    def keys(self, records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        # assinatura, bloco e número de cada anúncio (o que `seed` recebe)
+        return {
+            "sig": self.signatures([listing_text(r) for r in records]),
+            "block": np.fromiter((block_key(r) for r in records), dtype=np.uint32, count=len(records)),
+            "num": np.fromiter((house_number(r) for r in records), dtype=np.int32, count=len(records)),
+        }
+
+    def state(self) -> Dict[str, np.ndarray]:
+        # o estado das linhas registradas (sem lat/lon/área, que estão no snapshot)
+        return {"sig": self._sig[:self.n], "block": self._block[:self.n], "num": self._num[:self.n]}
+
+def drop_duplicates(frame: CompFrame) -> CompFrame:
+    """
+    Tira do frame os anúncios repetidos (ex.: o mesmo galpão na OLX e no Zap),
+    mantendo a primeira ocorrência (ordem dos conectores). Frames de uma só
+    tabela (um conector) passam direto.
+    """
+    if len(frame.tables) < 2:
+        return frame
+    dup_of = Deduplicator(table_bits=12).add(frame.comps())
+    return frame.take(np.flatnonzero(dup_of < 0))
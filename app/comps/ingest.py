@@ -0,0 +1,165 @@
+"""
+Ingestão de dumps de anúncios (JSONL, um anúncio por linha; .gz aceito) para
+um snapshot colunar do CompStore, com deduplicação entre portais e os
+agregados de mercado por célula H3 (app/model/market.py) atualizados junto.
+
+Os arquivos são lidos linha a linha (gerador) e processados em lotes de
+`chunk_size`: a memória não depende do tamanho dos dumps, só do número de
+anúncios únicos (colunas + ~150 bytes de estado de deduplicação por anúncio).
+Com `--base`, o snapshot existente entra primeiro e os novos anúncios são
+deduplicados contra ele (assinaturas gravadas no próprio snapshot).
+
+Uso:
+  python -m app.comps.ingest dumps/olx.jsonl dumps/zap.jsonl.gz --out data/snapshot
+  python -m app.comps.ingest dumps/vivareal_2025-09.jsonl --base data/snapshot --out data/snapshot
+"""
+from typing import Iterable, Iterator, List, Dict, Any, Optional
+from collections import Counter
+import argparse, gzip, itertools, json, os, time
+import numpy as np
+from app.comps.connectors.base import normalize_record
+from app.comps.dedup import Deduplicator
+from app.comps.table import CompTable, SnapshotWriter
+from app.model.market import MarketAggregates, STATE_PREFIX as MARKET_PREFIX
+
+# estado da deduplicação gravado junto do snapshot (dedup_sig.npy, ...)
+STATE_PREFIX = "dedup_"
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+def iter_jsonl(paths: Iterable[str], source: Optional[str] = None,
+               errors: Optional[Counter] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Anúncios normalizados (`normalize_record`) dos arquivos, um por vez.
+    Sem `source` no registro, usa `source` ou o nome do arquivo
+    ("olx.jsonl.gz" -> "olx"). Linhas inválidas são puladas (contadas em
+    `errors[caminho]`).
+    """
+    for path in paths:
+        default = source or os.path.basename(path).split(".")[0]
+        with _open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    rec = None
+                if not isinstance(rec, dict):
+                    if errors is not None:
+                        errors[path] += 1
+                    continue
+                rec = normalize_record(rec)
+                rec["source"] = rec["source"] or default
+                yield rec
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _seed_from(dedup: Deduplicator, table: CompTable, path: str, chunk_size: int) -> None:
+    # estado gravado pelo ingest anterior (se compatível) ou recalculado dos registros
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        params = json.load(f).get("dedup")
+    files = {k: os.path.join(path, f"{STATE_PREFIX}{k}.npy") for k in ("sig", "block", "num")}
+    if params == dedup.params() and all(os.path.exists(p) for p in files.values()):
+        state = {k: np.load(p, mmap_mode="r") for k, p in files.items()}
+    else:
+        parts = [dedup.keys([table.record(i) for i in range(a, min(a + chunk_size, len(table)))])
+                 for a in range(0, len(table), chunk_size)]
+        state = {k: np.concatenate([p[k] for p in parts]) for k in files} if parts else dedup.keys([])
+    dedup.seed({k: np.asarray(v) for k, v in state.items()}, table["lat"], table["lon"], table["built_area_m2"])
+
+def _market_from(market: MarketAggregates, table: CompTable, path: str) -> None:
+    # agregados gravados pelo ingest anterior (se compatíveis) ou recontados da tabela
+    if MarketAggregates.exists(path):
+        saved = MarketAggregates.open(path)
+        if saved.params() == market.params():
+            market.merge(saved)
+            return
+    market.add_table(table)
+
+def ingest(paths: List[str], out_dir: str, base: Optional[str] = None,
+           chunk_size: int = 20_000, dedup: Optional[Deduplicator] = None,
+           market: Optional[MarketAggregates] = None) -> Dict[str, Any]:
+    """
+    Lê os dumps, descarta duplicatas (entre portais, dentro de um mesmo dump
+    e contra `base`) e grava o snapshot em `out_dir` (pode ser o próprio
+    `base`: o diretório é trocado no fim; `load_store` recarrega pelo mtime),
+    com os agregados de mercado dos anúncios gravados (`load_market(out_dir)`).
+    Retorna estatísticas: lidos, gravados, duplicatas por par de fontes.
+    """
+    dedup = dedup or Deduplicator()
+    market = MarketAggregates() if market is None else market
+    writer = SnapshotWriter(out_dir)
+    errors: Counter = Counter()
+    pairs: Counter = Counter()
+    # fonte de cada linha aceita, como código (para as estatísticas de pares)
+    names: Dict[Optional[str], int] = {}
+    row_source: List[int] = []
+    stats = {"read": 0, "written": 0, "duplicates": 0, "base": 0}
+    t0 = time.perf_counter()
+    try:
+        if base:
+            table = CompTable.open(base)
+            writer.add_table(table)
+            _seed_from(dedup, table, base, chunk_size)
+            _market_from(market, table, base)
+            vocab = table.vocab.get("source", [])
+            codes = [names.setdefault(v, len(names)) for v in vocab] + [names.setdefault(None, len(names))]
+            row_source.extend(codes[c] for c in np.asarray(table["source"]).tolist())
+            stats["base"] = len(table)
+        for chunk in chunked(iter_jsonl(paths, errors=errors), chunk_size):
+            dup_of = dedup.add(chunk).tolist()
+            kept = []
+            for rec, j in zip(chunk, dup_of):
+                if j < 0:
+                    kept.append(rec)
+                    row_source.append(names.setdefault(rec["source"], len(names)))
+                else:
+                    pairs[(rec["source"], row_source[j])] += 1
+            if kept:
+                table = CompTable.from_records(kept, keep_objects=False)
+                writer.add_table(table)
+                market.add_table(table)
+            stats["read"] += len(chunk)
+            stats["written"] += len(kept)
+            stats["duplicates"] += len(chunk) - len(kept)
+        state = {f"{STATE_PREFIX}{k}": v for k, v in dedup.state().items()}
+        state.update({f"{MARKET_PREFIX}{k}": v for k, v in market.state().items()})
+        writer.close(state, {"dedup": dedup.params()})
+    except BaseException:
+        writer.abort()
+        raise
+    by_code = {c: n for n, c in names.items()}
+    stats.update({"total": writer.n, "invalid_lines": dict(errors),
+                  "duplicate_pairs": {f"{s}->{by_code[c]}": k for (s, c), k in pairs.items()},
+                  "seconds": time.perf_counter() - t0})
+    return stats
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="+", help="dumps JSONL (.jsonl ou .jsonl.gz)")
+    ap.add_argument("--out", required=True, help="diretório do snapshot gerado")
+    ap.add_argument("--base", help="snapshot existente a atualizar (pode ser igual a --out)")
+    ap.add_argument("--chunk-size", type=int, default=20_000)
+    ap.add_argument("--max-km", type=float, default=0.3, help="distância máxima entre duplicatas")
+    ap.add_argument("--area-tol", type=float, default=0.05, help="diferença relativa máxima de área")
+    ap.add_argument("--min-similarity", type=float, default=0.5, help="similaridade mínima de texto (Jaccard)")
+    args = ap.parse_args()
+    dedup = Deduplicator(max_km=args.max_km, area_tol=args.area_tol, min_similarity=args.min_similarity)
+    stats = ingest(args.paths, args.out, args.base, args.chunk_size, dedup)
+    rate = stats["read"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    print(f"{stats['read']} lidos, {stats['duplicates']} duplicatas, {stats['total']} no snapshot "
+          f"({rate:,.0f} anúncios/s)")
+
+if __name__ == "__main__":
+    main()
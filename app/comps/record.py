@@ -0,0 +1,142 @@
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
+import math
+
+STANDARD_FIELDS = [
+    "id", "title", "address", "city", "state", "lat", "lon", "url", "source",
+    "property_type", "built_area_m2", "land_area_m2", "bedrooms", "bathrooms", "parking",
+    "is_rental", "price_total", "price_per_m2", "date_posted", "extras"
+]
+# anotações do pipeline (distância, peso, meses): têm posição fixa, mas só
+# existem como chave depois de atribuídas
+ANNOTATIONS = ["distance_km", "weight", "months_since"]
+_NAMES = STANDARD_FIELDS + ANNOTATIONS
+_INDEX = {k: i for i, k in enumerate(_NAMES)}
+_N = len(STANDARD_FIELDS)
+_UNSET = object()
+# atributos industriais: campo próprio (imóvel avaliado) ou nomes em `extras` (anúncios)
+INDUSTRIAL = {
+    "ceiling_height_m": ("ceiling_height_m", "ceiling"),
+    "energy_capacity_kva": ("energy_capacity_kva", "kva", "energy_kva"),
+    "dock_doors": ("dock_doors", "docks"),
+}
+
+def to_float(v) -> float:
+    # número ou NaN (None, bool e texto não numérico)
+    if v is None or isinstance(v, bool):
+        return math.nan
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return math.nan
+
+def industrial(rec: Dict[str, Any]) -> Tuple[float, float, float]:
+    # atributos industriais do registro (campo próprio primeiro, depois `extras`); NaN = ausente
+    extras = rec.get("extras") if isinstance(rec.get("extras"), dict) else {}
+    out = []
+    for field, names in INDUSTRIAL.items():
+        v = rec.get(field)
+        for name in names:
+            if v is not None:
+                break
+            v = extras.get(name)
+        out.append(to_float(v))
+    return tuple(out)
+
+class Comp:
+    """
+    Anúncio comparável com os valores numa lista de posição fixa
+    (STANDARD_FIELDS + ANNOTATIONS) em vez de um dict por anúncio: metade da
+    memória e cópia barata. Campos fora do padrão vão para um dict à parte,
+    criado só quando aparecem. Aceita o acesso de dict (`c["x"]`, `c.get("x")`,
+    `dict(c)`), então o código que lê dicts lê Comp; vira dict de fato em
+    `to_dict`, na saída (API/relatório).
+    """
+
+    __slots__ = ("_values", "_more")
+
+    def __init__(self, **fields: Any):
+        self._values: List[Any] = [fields.pop(k, None) for k in STANDARD_FIELDS] \
+            + [fields.pop(k, _UNSET) for k in ANNOTATIONS]
+        self._more: Optional[Dict[str, Any]] = fields or None
+
+    @classmethod
+    def of(cls, rec: Union["Comp", Dict[str, Any]]) -> "Comp":
+        # cópia rasa (de Comp ou de dict; campos padrão ausentes = None)
+        if isinstance(rec, Comp):
+            c = cls.__new__(cls)
+            c._values = rec._values.copy()
+            c._more = dict(rec._more) if rec._more else None
+            return c
+        return cls(**rec)
+
+    def to_dict(self) -> Dict[str, Any]:
+        v = self._values
+        d = dict(zip(STANDARD_FIELDS, v))
+        for i in range(_N, len(_NAMES)):
+            if v[i] is not _UNSET:
+                d[_NAMES[i]] = v[i]
+        if self._more:
+            d.update(self._more)
+        return d
+
+    def keys(self) -> List[str]:
+        v = self._values
+        return STANDARD_FIELDS + [_NAMES[i] for i in range(_N, len(_NAMES)) if v[i] is not _UNSET] \
+            + list(self._more or ())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __contains__(self, key: str) -> bool:
+        i = _INDEX.get(key)
+        if i is not None:
+            return self._values[i] is not _UNSET
+        return bool(self._more and key in self._more)
+
+    def __getitem__(self, key: str) -> Any:
+        i = _INDEX.get(key)
+        if i is not None:
+            v = self._values[i]
+            if v is not _UNSET:
+                return v
+        elif self._more and key in self._more:
+            return self._more[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        i = _INDEX.get(key)
+        if i is not None:
+            self._values[i] = value
+        else:
+            if self._more is None:
+                self._more = {}
+            self._more[key] = value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        i = _INDEX.get(key)
+        if i is not None:
+            v = self._values[i]
+            return default if v is _UNSET else v
+        return self._more.get(key, default) if self._more else default
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (Comp, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Comp(id={self['id']!r}, source={self['source']!r}, price_per_m2={self['price_per_m2']!r})"
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return self.to_dict()
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(**state)
@@ -0,0 +1,162 @@
+"""
+Seleção de comps por semelhança: os k anúncios com preço mais parecidos com
+o imóvel (por finalidade) num espaço de atributos normalizados, em vez da
+faixa de área 0,5x–2x e da ampliação do raio. Cada atributo entra com uma
+escala (distância por unidade: km, razão de áreas em log, metro de
+pé-direito, doca, mês); o KD-tree é montado uma vez por conjunto de
+atributos que o imóvel informa (os que ele não tem ficam de fora da conta).
+Anúncio sem um atributo usado recebe a mediana dos anúncios; sem
+coordenadas, fica de fora quando o imóvel tem posição.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import math, threading
+import numpy as np
+from sklearn.neighbors import KDTree
+from app.comps.table import CompFrame
+from app.comps.record import industrial, to_float
+from app.geo.geocode import haversine_km_vec
+from app.model.hedonic import ppm2_columns
+
+EARTH_RADIUS_KM = 6371.0
+KINDS = ("rental", "sale")
+# escala de cada atributo: o que vale 1 na distância de semelhança
+DEFAULT_SCALES = {
+    "geo": 1 / 8.0,                  # 8 km
+    "area": 1.0,                     # razão e:1 de área construída
+    "land": 0.5,                     # razão e²:1 de terreno
+    "ceiling_height_m": 1 / 3.0,     # 3 m de pé-direito
+    "energy_capacity_kva": 0.5,      # razão e²:1 de potência
+    "dock_doors": 1 / 8.0,           # 8 docas
+    "recency": 1 / 12.0,             # 12 meses
+}
+# colunas da matriz de atributos e a escala de cada uma
+_COLUMNS = ("geo", "geo", "area", "land", "ceiling_height_m", "energy_capacity_kva", "dock_doors", "recency")
+_OPTIONAL = (3, 4, 5, 6)
+
+def _log(v: np.ndarray) -> np.ndarray:
+    v = np.asarray(v, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(v > 0, np.log(v), np.nan)
+
+def _months(when: np.ndarray) -> np.ndarray:
+    # meses (de 30 dias) desde 1970, como months_since_dates; NaT = NaN
+    when = np.asarray(when, dtype="datetime64[us]")
+    days = (when - np.datetime64(0, "us")) / np.timedelta64(1, "D")
+    return np.where(np.isnat(when), np.nan, days / 30.0)
+
+class SimilarityIndex:
+    """
+    Índice de semelhança sobre os comps com preço de um CompFrame (por
+    exemplo, todos os anúncios de um tipo no CompStore). Montado uma vez;
+    consultas em tempo logarítmico. Posições devolvidas são do frame.
+    """
+
+    def __init__(self, frame: CompFrame, scales: Optional[Dict[str, float]] = None):
+        self.frame = frame
+        self.scales = dict(DEFAULT_SCALES, **(scales or {}))
+        n = len(frame)
+        lat, lon = frame.column("lat"), frame.column("lon")
+        area = frame.column("built_area_m2")
+        # projeção equirretangular na latitude mediana (km)
+        self.lat0 = float(np.nanmedian(lat)) if n and not np.isnan(lat).all() else 0.0
+        raw = np.full((n, len(_COLUMNS)), np.nan)
+        raw[:, 0] = np.radians(lon) * EARTH_RADIUS_KM * math.cos(math.radians(self.lat0))
+        raw[:, 1] = np.radians(lat) * EARTH_RADIUS_KM
+        raw[:, 2] = _log(area)
+        raw[:, 3] = _log(frame.column("land_area_m2"))
+        if n:
+            ind = np.array([industrial(r) for r in frame.comps()], dtype=float).reshape(n, 3)
+            raw[:, 4], raw[:, 5], raw[:, 6] = ind[:, 0], _log(ind[:, 1]), ind[:, 2]
+        raw[:, 7] = _months(frame.column("posted_at"))
+        ppm2 = ppm2_columns(frame.column("price_per_m2"), frame.column("price_total"), area)
+        priced = ~np.isnan(ppm2) & (ppm2 != 0)
+        rental = frame.column("is_rental")
+        self._has_geo = ~(np.isnan(raw[:, 0]) | np.isnan(raw[:, 1]))
+        self._rows = {"rental": np.flatnonzero(priced & (rental == 1)),
+                      "sale": np.flatnonzero(priced & (rental == 0))}
+        # atributo ausente no anúncio = mediana dos anúncios com preço
+        med = np.zeros(raw.shape[1])
+        for j in range(raw.shape[1]):
+            col = raw[priced, j]
+            col = col[~np.isnan(col)]
+            if len(col):
+                med[j] = np.median(col)
+        self._filled = np.where(np.isnan(raw), med, raw)
+        self._weights = np.array([self.scales[c] for c in _COLUMNS], dtype=float)
+        self._trees: Dict[Tuple[str, Tuple[int, ...]], Tuple[Optional[KDTree], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def vector(self, subject: Dict[str, Any], now: Optional[datetime] = None) -> Tuple[np.ndarray, Tuple[int, ...]]:
+        """
+        Atributos do imóvel (dict no formato de PropertyInput, com "lat"/"lon")
+        e as colunas que ele informa.
+        """
+        v = np.full(len(_COLUMNS), np.nan)
+        lat, lon = to_float(subject.get("lat")), to_float(subject.get("lon"))
+        v[0] = math.radians(lon) * EARTH_RADIUS_KM * math.cos(math.radians(self.lat0))
+        v[1] = math.radians(lat) * EARTH_RADIUS_KM
+        v[2] = _log(to_float(subject.get("built_area_m2")))
+        v[3] = _log(to_float(subject.get("land_area_m2")))
+        ceiling, kva, docks = industrial(subject)
+        v[4], v[5], v[6] = ceiling, _log(kva), docks
+        v[7] = _months(np.datetime64(now or datetime.now(), "us"))
+        return v, tuple(int(j) for j in np.flatnonzero(~np.isnan(v)))
+
+    def _tree(self, kind: str, cols: Tuple[int, ...]) -> Tuple[Optional[KDTree], np.ndarray]:
+        # KD-tree dos comps da finalidade nas colunas informadas (montado uma vez)
+        key = (kind, cols)
+        hit = self._trees.get(key)
+        if hit is not None:
+            return hit
+        with self._lock:
+            if key not in self._trees:
+                rows = self._rows[kind]
+                if 0 in cols:
+                    rows = rows[self._has_geo[rows]]
+                c = list(cols)
+                tree = KDTree(self._filled[np.ix_(rows, c)] * self._weights[c]) if len(rows) and c else None
+                self._trees[key] = (tree, rows)
+            return self._trees[key]
+
+    def select_many(self, subjects: List[Dict[str, Any]], k: int,
+                    now: Optional[datetime] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Para cada imóvel, (posições no frame, distância de semelhança) dos k
+        comps mais parecidos de cada finalidade (aluguel, depois venda), em
+        ordem de semelhança. Imóveis com as mesmas colunas são consultados
+        juntos, numa chamada por KD-tree.
+        """
+        now = now or datetime.now()
+        vecs = [self.vector(s, now) for s in subjects]
+        parts: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in subjects]
+        by_cols: Dict[Tuple[int, ...], List[int]] = {}
+        for i, (_, cols) in enumerate(vecs):
+            by_cols.setdefault(cols, []).append(i)
+        for kind in KINDS:
+            for cols, members in by_cols.items():
+                tree, rows = self._tree(kind, cols)
+                if tree is None or k <= 0:
+                    for i in members:
+                        parts[i].append((np.empty(0, np.intp), np.empty(0)))
+                    continue
+                c = list(cols)
+                Q = np.array([vecs[i][0][c] for i in members]) * self._weights[c]
+                dist, ind = tree.query(Q, k=min(k, len(rows)))
+                for j, i in enumerate(members):
+                    parts[i].append((rows[ind[j]], dist[j]))
+        return [(np.concatenate([p for p, _ in ps]), np.concatenate([d for _, d in ps])) for ps in parts]
+
+    def select(self, subject: Dict[str, Any], k: int, now: Optional[datetime] = None) -> CompFrame:
+        # frame com os k mais parecidos de cada finalidade e a distância (km) ao imóvel
+        pos, _ = self.select_many([subject], k, now)[0]
+        return with_distances(self.frame.take(pos), subject)
+
+def with_distances(frame: CompFrame, subject: Dict[str, Any]) -> CompFrame:
+    # distância (km) de cada comp ao imóvel; NaN sem coordenadas de um dos lados
+    lat, lon = to_float(subject.get("lat")), to_float(subject.get("lon"))
+    if math.isnan(lat) or math.isnan(lon):
+        dist = np.full(len(frame), np.nan)
+    else:
+        dist = haversine_km_vec(lat, lon, frame.column("lat"), frame.column("lon"))
+    return CompFrame(frame.tables, frame.sources, frame.part, frame.row, np.asarray(dist, dtype=float))
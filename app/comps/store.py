@@ -0,0 +1,170 @@
+from typing import List, Dict, Any, Optional, Tuple
+import json, os, threading
+import numpy as np
+from sklearn.neighbors import BallTree
+from app.comps.connectors.base import normalize_record
+from app.comps.table import CompTable, CompFrame
+from app.comps.record import Comp
+from app.comps.similarity import SimilarityIndex
+
+EARTH_RADIUS_KM = 6371.0
+
+class CompStore:
+    """
+    Comparáveis em uma CompTable (em memória ou snapshot com mmap), com um
+    índice espacial (BallTree, métrica haversine) por tipo de imóvel,
+    construído no primeiro uso de cada tipo, e índices de semelhança
+    (`similarity`) pelo mesmo critério.
+    """
+
+    def __init__(self, table: CompTable):
+        self.table = table
+        self.lat = table["lat"]
+        self.lon = table["lon"]
+        self._has_geo = ~(np.isnan(self.lat) | np.isnan(self.lon))
+        # índices por tipo (None = todos os tipos)
+        self._geo_idx: Dict[Optional[str], np.ndarray] = {}
+        self._nogeo_idx: Dict[Optional[str], np.ndarray] = {}
+        self._trees: Dict[Optional[str], BallTree] = {}
+        self._similar: Dict[Tuple, SimilarityIndex] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "CompStore":
+        return cls(CompTable.from_records([normalize_record(r) for r in records]))
+
+    @classmethod
+    def from_json(cls, path: str) -> "CompStore":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_records(json.load(f))
+
+    @classmethod
+    def open(cls, path: str) -> "CompStore":
+        # snapshot gravado por `write_snapshot`
+        return cls(CompTable.open(path))
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _type_key(self, property_type: Optional[str]) -> Optional[str]:
+        return property_type if property_type else None
+
+    def _index(self, key: Optional[str]) -> bool:
+        # prepara (uma vez) os índices do tipo; False se o tipo não existe
+        if key in self._geo_idx:
+            return True
+        with self._lock:
+            if key in self._geo_idx:
+                return True
+            if key is None:
+                sel = np.ones(len(self.table), dtype=bool)
+            else:
+                code = self.table.code("property_type", key)
+                if code < 0:
+                    return False
+                sel = self.table["property_type"] == code
+            geo = np.flatnonzero(sel & self._has_geo)
+            if len(geo):
+                pts = np.radians(np.column_stack([self.lat[geo], self.lon[geo]]))
+                self._trees[key] = BallTree(pts, metric="haversine")
+            self._nogeo_idx[key] = np.flatnonzero(sel & ~self._has_geo)
+            self._geo_idx[key] = geo
+        return True
+
+    def indices(self, property_type: Optional[str] = None) -> np.ndarray:
+        key = self._type_key(property_type)
+        if not self._index(key):
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate([self._geo_idx[key], self._nogeo_idx[key]]))
+
+    def query_radius(self, lat: float, lon: float,
+                     radius_km: Optional[float] = None,
+                     property_type: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Comps do tipo dentro do raio, ordenados por distância (empates pela ordem
+        de carga). Comps sem lat/lon entram no fim com distância NaN.
+        Retorna (índices, distâncias_km).
+        """
+        key = self._type_key(property_type)
+        if not self._index(key):
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        geo = self._geo_idx[key]
+        tree = self._trees.get(key)
+        if tree is None:
+            ind, dist = np.empty(0, dtype=np.intp), np.empty(0)
+        else:
+            q = np.radians([[lat, lon]])
+            if radius_km is None:
+                # sem raio: distância para todos (consulta k = n)
+                dist, ind = tree.query(q, k=len(geo))
+            else:
+                ind, dist = tree.query_radius(q, r=radius_km / EARTH_RADIUS_KM, return_distance=True)
+            ind, dist = geo[ind[0]], dist[0] * EARTH_RADIUS_KM
+            order = np.lexsort((ind, dist))
+            ind, dist = ind[order], dist[order]
+        nogeo = self._nogeo_idx[key]
+        return (np.concatenate([ind, nogeo]),
+                np.concatenate([dist, np.full(len(nogeo), np.nan)]))
+
+    def similarity(self, property_type: Optional[str] = None,
+                   scales: Optional[Dict[str, float]] = None) -> SimilarityIndex:
+        """
+        Índice de semelhança (ver app/comps/similarity.py) sobre os comps do
+        tipo, montado uma vez por store: recarregar o store (novo snapshot)
+        recomeça os índices.
+        """
+        key = (self._type_key(property_type), tuple(sorted((scales or {}).items())))
+        index = self._similar.get(key)
+        if index is None:
+            # fora do lock: montar o índice lê os registros (pode demorar)
+            index = SimilarityIndex(self.frame(self.indices(property_type)), scales)
+            with self._lock:
+                index = self._similar.setdefault(key, index)
+        return index
+
+    def frame(self, idx, distances=None, source: Optional[str] = None) -> CompFrame:
+        # sem cópia: só os índices (e distâncias) apontando para a tabela
+        return CompFrame.of(self.table, idx, distances, source)
+
+    def rows(self, idx, distances=None) -> List[Comp]:
+        # cópias: quem consome pode anotar campos sem afetar o store
+        out = []
+        for j, i in enumerate(idx):
+            rec = self.table.comp(i)
+            if distances is not None:
+                d = distances[j]
+                rec["distance_km"] = None if np.isnan(d) else float(d)
+            out.append(rec)
+        return out
+
+def write_snapshot(json_path: str, out_dir: str) -> CompStore:
+    """
+    Converte um JSON de anúncios em snapshot colunar (diretório) que
+    `load_store` abre com mmap.
+    """
+    store = CompStore.from_json(json_path)
+    store.table.save(out_dir)
+    return CompStore.open(out_dir)
+
+_stores: Dict[str, Tuple[float, CompStore]] = {}
+_lock = threading.Lock()
+
+def store_mtime(path: str) -> float:
+    # versão do store: mtime do JSON ou do meta.json do snapshot (regravado por último)
+    path = os.path.abspath(path)
+    return os.path.getmtime(os.path.join(path, "meta.json") if os.path.isdir(path) else path)
+
+def load_store(path: str) -> CompStore:
+    """
+    Store do arquivo JSON ou do diretório de snapshot, carregado uma vez por
+    processo e recarregado só se o arquivo mudar (mtime).
+    """
+    path = os.path.abspath(path)
+    is_snapshot = os.path.isdir(path)
+    mtime = store_mtime(path)
+    with _lock:
+        hit = _stores.get(path)
+        if hit is None or hit[0] != mtime:
+            hit = (mtime, CompStore.open(path) if is_snapshot else CompStore.from_json(path))
+            _stores[path] = hit
+        return hit[1]
@@ -0,0 +1,395 @@
+from typing import List, Dict, Any, Optional, Sequence
+from datetime import datetime
+import json, os, shutil, uuid
+import numpy as np
+from app.comps.record import Comp
+
+# colunas numéricas (float64, NaN = ausente)
+NUMERIC_FIELDS = ("lat", "lon", "built_area_m2", "land_area_m2", "price_total", "price_per_m2")
+# colunas categóricas (códigos int32 + vocabulário; -1 = ausente)
+CATEGORY_FIELDS = ("property_type", "source")
+SNAPSHOT_VERSION = 1
+# dtype das colunas não float (para frames vazios)
+_DTYPES = {"is_rental": np.int8, "posted_at": "datetime64[us]", "property_type": np.int32, "source": np.int32}
+
+def _float(v) -> float:
+    if v is None or isinstance(v, bool):
+        return np.nan
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _posted_at(v) -> np.datetime64:
+    # mesma interpretação de hedonic._months_since; inválida/ausente = NaT
+    if not v:
+        return np.datetime64("NaT")
+    try:
+        d = datetime.fromisoformat(v)
+    except Exception:
+        try:
+            d = datetime.strptime(v, "%Y-%m-%d")
+        except Exception:
+            return np.datetime64("NaT")
+    if d.tzinfo is not None:
+        return np.datetime64("NaT")
+    return np.datetime64(d, "us")
+
+class _JsonRows:
+    """
+    Registros originais serializados (JSON por linha) num único buffer com
+    offsets; com mmap só as linhas lidas saem do disco.
+    """
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(self.blob[a:b].tobytes())
+
+    def take(self, idx: np.ndarray) -> "_JsonRows":
+        # cópia em memória só das linhas `idx`, ainda em JSON
+        parts = [self.blob[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes() for i in idx]
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in parts], out=offsets[1:])
+        return _JsonRows(offsets, np.frombuffer(b"".join(parts), dtype=np.uint8))
+
+    @classmethod
+    def encode(cls, records: Sequence[Dict[str, Any]]) -> "_JsonRows":
+        parts = [json.dumps(r.to_dict() if isinstance(r, Comp) else r, ensure_ascii=False, default=str).encode("utf-8")
+                 for r in records]
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in parts], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(parts), dtype=np.uint8))
+
+class CompTable:
+    """
+    Comps em colunas NumPy: numéricas, categóricas (códigos), `is_rental`
+    (1/0/-1) e `posted_at` (datetime64, NaT = sem data). Os registros
+    completos ficam como Comp (slots) ou JSON e só viram dicts em `record`
+    (ex.: para `comps_used`).
+    Gravada em disco como snapshot (diretório com .npy + registros em JSON),
+    é aberta com mmap: carga imediata e só as páginas usadas vão para a memória.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocab: Dict[str, List[str]], rows,
+                 path: Optional[str] = None, generation: Optional[str] = None):
+        self.columns = columns
+        self.vocab = vocab
+        self._codes = {k: {v: i for i, v in enumerate(vs)} for k, vs in vocab.items()}
+        self._rows = rows  # lista de Comp ou _JsonRows
+        self.path = path
+        self.generation = generation  # id do snapshot aberto (meta.json), muda a cada gravação
+
+    @classmethod
+    def from_records(cls, records: Sequence[Any], keep_objects: bool = True) -> "CompTable":
+        # records: dicts ou Comp; com keep_objects=False os registros vão direto para JSON
+        n = len(records)
+        columns = {f: np.fromiter((_float(r.get(f)) for r in records), dtype=float, count=n)
+                   for f in NUMERIC_FIELDS}
+        columns["is_rental"] = np.fromiter(
+            (1 if r.get("is_rental") is True else 0 if r.get("is_rental") is False else -1 for r in records),
+            dtype=np.int8, count=n)
+        # datas repetem muito: cada texto distinto é interpretado uma vez
+        memo: Dict[Any, np.datetime64] = {}
+        dates = [r.get("date_posted") for r in records]
+        for d in dates:
+            if d not in memo:
+                memo[d] = _posted_at(d)
+        columns["posted_at"] = np.array([memo[d] for d in dates], dtype="datetime64[us]").reshape(n)
+        vocab: Dict[str, List[str]] = {}
+        for f in CATEGORY_FIELDS:
+            codes: Dict[str, int] = {}
+            col = np.empty(n, dtype=np.int32)
+            for i, r in enumerate(records):
+                v = r.get(f)
+                col[i] = -1 if v is None else codes.setdefault(str(v), len(codes))
+            columns[f] = col
+            vocab[f] = list(codes)
+        rows = [Comp.of(r) for r in records] if keep_objects else _JsonRows.encode(records)
+        return cls(columns, vocab, rows)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name, col in self.columns.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(col))
+        rows = self._rows if isinstance(self._rows, _JsonRows) else _JsonRows.encode(self._rows)
+        np.save(os.path.join(path, "rows_offsets.npy"), rows.offsets)
+        with open(os.path.join(path, "rows.bin"), "wb") as f:
+            f.write(rows.blob.tobytes())
+        meta = {"version": SNAPSHOT_VERSION, "n": len(self), "columns": list(self.columns), "vocab": self.vocab,
+                "generation": uuid.uuid4().hex}
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    @classmethod
+    def open(cls, path: str, mmap: bool = True) -> "CompTable":
+        path = os.path.abspath(path)
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot {path}: versão {meta.get('version')} não suportada")
+        mode = "r" if mmap else None
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in meta["columns"]}
+        offsets = np.load(os.path.join(path, "rows_offsets.npy"), mmap_mode=mode)
+        blob_path = os.path.join(path, "rows.bin")
+        if os.path.getsize(blob_path) == 0:
+            blob = np.empty(0, dtype=np.uint8)
+        elif mmap:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            blob = np.fromfile(blob_path, dtype=np.uint8)
+        return cls(columns, meta["vocab"], _JsonRows(offsets, blob), path=path if mmap else None,
+                   generation=meta.get("generation"))
+
+    def __reduce__(self):
+        # snapshot em disco viaja por caminho (o outro processo reabre com mmap),
+        # preso à geração aberta aqui: se o diretório foi trocado, erro em vez de outras linhas
+        if self.path is not None:
+            return (_reopen, (self.path, self.generation))
+        return (CompTable, (self.columns, self.vocab, self._rows))
+
+    def __len__(self) -> int:
+        return len(self.columns["is_rental"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def code(self, field: str, value: Optional[str]) -> int:
+        # código de `value` na coluna categórica (-2 se não existe: nunca casa)
+        if value is None:
+            return -1
+        return self._codes[field].get(str(value), -2)
+
+    def record(self, i: int) -> Dict[str, Any]:
+        r = self._rows[int(i)]
+        return r.to_dict() if isinstance(r, Comp) else r
+
+    def comp(self, i: int) -> Comp:
+        r = self._rows[int(i)]
+        return Comp.of(r)
+
+    def subset(self, idx: np.ndarray) -> "CompTable":
+        # cópia em memória só das linhas `idx` (mesmo vocabulário)
+        columns = {k: np.asarray(v[idx]) for k, v in self.columns.items()}
+        if isinstance(self._rows, list):
+            rows = [self._rows[int(i)] for i in idx]
+        else:
+            rows = self._rows.take(idx)
+        return CompTable(columns, self.vocab, rows)
+
+def _reopen(path: str, generation: Optional[str]) -> CompTable:
+    table = CompTable.open(path)
+    if table.generation != generation:
+        raise ValueError(f"Snapshot {path}: trocado desde que a tabela foi enviada")
+    return table
+
+class SnapshotWriter:
+    """
+    Grava um snapshot (mesmo formato de CompTable.save) aos poucos: tabelas
+    são acrescentadas em pedaços (códigos categóricos remapeados para um
+    vocabulário único, registros JSON direto no arquivo). Só as colunas ficam
+    na memória até `close`. O diretório final é trocado de uma vez no fim.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._tmp = f"{self.path}.tmp{os.getpid()}"
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        os.makedirs(self._tmp)
+        self._blob = open(os.path.join(self._tmp, "rows.bin"), "wb")
+        self._blob_size = 0
+        self._columns: Dict[str, List[np.ndarray]] = {}
+        self._offsets: List[np.ndarray] = [np.zeros(1, dtype=np.int64)]
+        self._codes: Dict[str, Dict[str, int]] = {f: {} for f in CATEGORY_FIELDS}
+        self.n = 0
+
+    def add_table(self, table: CompTable, chunk: int = 100_000) -> None:
+        # cópia de `table` (em memória ou snapshot) em pedaços de `chunk` linhas
+        remap = {f: np.array([self._codes[f].setdefault(v, len(self._codes[f])) for v in table.vocab.get(f, [])]
+                             + [-1], dtype=np.int32) for f in CATEGORY_FIELDS}
+        for a in range(0, len(table), chunk):
+            b = min(a + chunk, len(table))
+            for name, col in table.columns.items():
+                part = np.array(col[a:b])
+                if name in remap:
+                    # -1 (ausente) indexa o -1 do fim do remapeamento
+                    part = remap[name][part]
+                self._columns.setdefault(name, []).append(part)
+            rows = table._rows
+            if isinstance(rows, _JsonRows):
+                lo, hi = int(rows.offsets[a]), int(rows.offsets[b])
+                self._blob.write(rows.blob[lo:hi].tobytes())
+                offsets = np.asarray(rows.offsets[a + 1:b + 1], dtype=np.int64) - lo
+            else:
+                enc = _JsonRows.encode(rows[a:b])
+                self._blob.write(enc.blob.tobytes())
+                offsets = enc.offsets[1:]
+            self._offsets.append(offsets + self._blob_size)
+            self._blob_size += int(offsets[-1]) if len(offsets) else 0
+            self.n += b - a
+
+    def add(self, records: Sequence[Dict[str, Any]]) -> None:
+        if records:
+            self.add_table(CompTable.from_records(records, keep_objects=False))
+
+    def close(self, extra: Optional[Dict[str, np.ndarray]] = None,
+              meta_extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Grava colunas e meta.json (mais arquivos `extra` {nome: array} e
+        campos `meta_extra`) e troca o diretório final. Retorna o caminho.
+        """
+        self._blob.close()
+        names = list(self._columns) or list(NUMERIC_FIELDS) + ["is_rental", "posted_at"] + list(CATEGORY_FIELDS)
+        for name in names:
+            parts = self._columns.get(name) or [np.empty(0, dtype=_DTYPES.get(name, float))]
+            np.save(os.path.join(self._tmp, f"{name}.npy"), np.concatenate(parts))
+        np.save(os.path.join(self._tmp, "rows_offsets.npy"), np.concatenate(self._offsets))
+        for name, arr in (extra or {}).items():
+            np.save(os.path.join(self._tmp, f"{name}.npy"), arr)
+        meta = {"version": SNAPSHOT_VERSION, "n": self.n, "columns": names,
+                "vocab": {f: list(c) for f, c in self._codes.items()}, "generation": uuid.uuid4().hex}
+        meta.update(meta_extra or {})
+        with open(os.path.join(self._tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        if os.path.exists(self.path):
+            # leitores com mmap do snapshot antigo seguem válidos (arquivos só saem do diretório)
+            old = f"{self.path}.old{os.getpid()}"
+            os.rename(self.path, old)
+            os.rename(self._tmp, self.path)
+            shutil.rmtree(old)
+        else:
+            os.rename(self._tmp, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self._blob.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+class CompFrame:
+    """
+    Conjunto de comps candidatos como referências (tabela, linha) mais a
+    distância ao assunto (NaN = sem distância). Ordenar, filtrar e cortar
+    mexe só nesses índices; as colunas são lidas das tabelas de origem e os
+    dicts são montados apenas em `records`.
+    """
+
+    def __init__(self, tables: List[CompTable], sources: List[Optional[str]],
+                 part: np.ndarray, row: np.ndarray, distance_km: np.ndarray):
+        self.tables = tables
+        self.sources = sources  # fonte padrão por tabela (nome do conector)
+        self.part = part
+        self.row = row
+        self.distance_km = distance_km
+
+    @classmethod
+    def empty(cls) -> "CompFrame":
+        return cls([], [], np.empty(0, np.int32), np.empty(0, np.intp), np.empty(0))
+
+    @classmethod
+    def of(cls, table: CompTable, idx: Optional[np.ndarray] = None,
+           distance_km: Optional[np.ndarray] = None, source: Optional[str] = None) -> "CompFrame":
+        idx = np.arange(len(table)) if idx is None else np.asarray(idx, dtype=np.intp)
+        dist = np.full(len(idx), np.nan) if distance_km is None else np.asarray(distance_km, dtype=float)
+        return cls([table], [source], np.zeros(len(idx), np.int32), idx, dist)
+
+    @classmethod
+    def from_records(cls, items: List[Dict[str, Any]], source: Optional[str] = None,
+                     has_subject: bool = True) -> "CompFrame":
+        # itens de conectores (dicts): distância vem de `distance_km`, se houver assunto
+        dist = np.fromiter((_float(it.get("distance_km")) if has_subject else np.nan for it in items),
+                           dtype=float, count=len(items))
+        return cls.of(CompTable.from_records(items), None, dist, source)
+
+    @classmethod
+    def concat(cls, frames: List["CompFrame"]) -> "CompFrame":
+        frames = [f for f in frames if len(f)]
+        if not frames:
+            return cls.empty()
+        tables, sources, parts = [], [], []
+        for f in frames:
+            parts.append(f.part + len(tables))
+            tables.extend(f.tables)
+            sources.extend(f.sources)
+        return cls(tables, sources, np.concatenate(parts),
+                   np.concatenate([f.row for f in frames]),
+                   np.concatenate([f.distance_km for f in frames]))
+
+    def __len__(self) -> int:
+        return len(self.row)
+
+    def take(self, idx) -> "CompFrame":
+        return CompFrame(self.tables, self.sources, self.part[idx], self.row[idx], self.distance_km[idx])
+
+    def column(self, name: str) -> np.ndarray:
+        if not self.tables:
+            return np.empty(0, dtype=_DTYPES.get(name, float))
+        if len(self.tables) == 1:
+            return np.asarray(self.tables[0][name][self.row])
+        out = np.empty(len(self), dtype=self.tables[0][name].dtype)
+        for p, t in enumerate(self.tables):
+            m = self.part == p
+            out[m] = t[name][self.row[m]]
+        return out
+
+    def category_mask(self, field: str, value: Optional[str]) -> np.ndarray:
+        out = np.zeros(len(self), dtype=bool)
+        for p, t in enumerate(self.tables):
+            m = self.part == p
+            out[m] = t[field][self.row[m]] == t.code(field, value)
+        return out
+
+    def distance_order(self) -> np.ndarray:
+        # por distância, sem distância no fim; empates na ordem atual
+        missing = np.isnan(self.distance_km)
+        return np.lexsort((np.where(missing, 0.0, self.distance_km), missing))
+
+    def compact(self) -> "CompFrame":
+        """
+        Frame autocontido com só as linhas referenciadas (para mandar a outro
+        processo). Vale também para snapshots em disco: o diretório pode ser
+        trocado por uma ingestão antes de o outro processo reabri-lo.
+        """
+        tables, part, row = [], np.empty(len(self), np.int32), np.empty(len(self), np.intp)
+        for p, t in enumerate(self.tables):
+            m = self.part == p
+            rows, inv = np.unique(self.row[m], return_inverse=True)
+            tables.append(t.subset(rows))
+            row[m] = inv
+            part[m] = p
+        return CompFrame(tables, list(self.sources), part, row, self.distance_km.copy())
+
+    def comps(self, idx: Optional[np.ndarray] = None) -> List[Comp]:
+        # como `records`, mas em Comp (dict só quando alguém pedir `to_dict`)
+        idx = np.arange(len(self)) if idx is None else np.asarray(idx, dtype=np.int64)
+        dist = self.distance_km[idx]
+        out = []
+        for p, r, d in zip(self.part[idx].tolist(), self.row[idx].tolist(),
+                           np.where(np.isnan(dist), None, dist).tolist()):
+            c = self.tables[p].comp(r)
+            c["distance_km"] = d
+            if not c["source"]:
+                c["source"] = self.sources[p]
+            out.append(c)
+        return out
+
+    def records(self, idx: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Dicts das linhas (todas ou `idx`), com `source` (do registro ou do
+        conector) e `distance_km` (None quando NaN) anotados.
+        """
+        idx = range(len(self)) if idx is None else idx
+        out = []
+        for j in idx:
+            p = int(self.part[j])
+            rec = self.tables[p].record(self.row[j])
+            d = self.distance_km[j]
+            rec["distance_km"] = None if np.isnan(d) else float(d)
+            rec["source"] = rec.get("source") or self.sources[p]
+            out.append(rec)
+        return out
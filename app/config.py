@@ -1,4 +1,10 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import os
+
+# Diretório de caches locais (scores de fotos, buscas dos conectores)
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".cache"))
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
 
 @dataclass
 class AppConfig:
@@ -11,6 +17,78 @@ class AppConfig:
     alpha_distance: float = 0.12   # quanto maior, mais penaliza distância
     alpha_recency: float = 0.10    # por mês
     alpha_area_diff: float = 1.0   # por fração de diferença relativa
+    # Seleção dos comps: "band" = mesmo tipo, área entre 0,5x e 2x e raio ampliado
+    # até min_comps; "knn" = os knn_k mais parecidos de cada finalidade num espaço
+    # de atributos (posição, áreas, pé-direito, kVA, docas, data), por índice
+    # montado uma vez por versão do store (ver app/comps/similarity.py).
+    # knn_scales sobrescreve escalas de similarity.DEFAULT_SCALES
+    comp_selection: str = "band"
+    knn_k: int = 30
+    knn_scales: Dict[str, float] = field(default_factory=dict)
+    # Conectores: consultas em paralelo, timeout por fonte, prazo global e disjuntor
+    connector_timeout_s: float = 8.0
+    comps_deadline_s: float = 12.0
+    breaker_max_failures: int = 3
+    breaker_reset_s: float = 60.0
+    # chamadas em andamento por fonte (somadas, abaixo das 32 threads do pool do agregador)
+    connector_max_in_flight: int = 6
+    # Cache das buscas dos conectores: LRU+TTL em memória e camada SQLite opcional
+    connector_cache_ttl_s: float = 3600.0
+    connector_cache_ttls: Dict[str, float] = field(default_factory=dict)  # TTL por fonte
+    connector_cache_max_entries: int = 1024
+    connector_cache_path: Optional[str] = os.path.join(CACHE_DIR, "connector_search.sqlite")
+    # Portais por HTTP (nome do conector -> URL base, ex. {"olx": "http://127.0.0.1:8900/olx"},
+    # como os substitutos de benchmarks/standin.py); fonte fora daqui usa o stub.
+    # portal_pool_size = conexões keep-alive por portal
+    portal_urls: Dict[str, str] = field(default_factory=dict)
+    portal_pool_size: int = 32
+    # API assíncrona: limites de concorrência/fila (429 acima disso) e pool de CPU
+    max_concurrent_assessments: int = 8
+    max_queued_assessments: int = 32
+    batch_max_items: int = 1000  # itens por pedido em /assess/batch e /report/batch (422 acima)
+    cpu_workers: int = min(os.cpu_count() or 1, 4)
+    cpu_offload_min_comps: int = 2000  # abaixo disso a estimativa roda no próprio loop
+    # Cache de resultados de /assess e /report por impressão digital do pedido
+    # (pedidos iguais simultâneos dividem um cálculo); esvaziado quando o store,
+    # os agregados ou o modelo mudam (TTL 0 = só junta os simultâneos)
+    result_cache_ttl_s: float = 300.0
+    result_cache_max_entries: int = 1024
+    # Bandas de confiança das faixas (bootstrap ponderado): opt-in por requisição
+    # (uncertainty=True) ou aqui, para todas
+    uncertainty: bool = False
+    bootstrap_resamples: int = 10_000
+    bootstrap_level: float = 0.90
+    bootstrap_seed: int = 0
+    # Agregados de mercado por célula H3 (diretório com market_*.npy: snapshot do
+    # ingest ou `python -m app.model.market`): com menos de min_comps comps de
+    # um tipo, a faixa é combinada com a da célula (None/ausente = desligado)
+    market_path: Optional[str] = os.path.join(DATA_DIR, "market")
+    market_months: int = 12
+    # Modelo hedônico treinado (`python -m app.model.regression`): faixa final =
+    # model_weight·modelo + (1 - model_weight)·comps; só o modelo quando não há
+    # comps nem agregados de mercado (None/ausente = só comps)
+    model_path: Optional[str] = os.path.join(DATA_DIR, "hedonic_model.joblib")
+    model_weight: float = 0.5
+    # Sensibilidade (what-if): pontos máximos por grade
+    whatif_max_points: int = 10_000
+    # Fotos: processos para scoring em lote e cache persistente por hash do conteúdo
+    photo_workers: int = min(os.cpu_count() or 1, 4)
+    photo_cache_path: str = os.path.join(CACHE_DIR, "photo_scores.sqlite")
+    photo_cache_max_entries: int = 50_000
+    # Fotos remotas (PhotoInput.url): downloads simultâneos (total e por host),
+    # tamanho máximo por foto e cache dos bytes por URL, revalidado por
+    # ETag/Last-Modified depois de photo_fetch_ttl_s (None = sem cache). As URLs
+    # vêm do cliente: com photo_fetch_allowed_hosts (ex. ["*.olxcdn.com"]) só
+    # esses hosts; vazio = qualquer host que resolva só para endereços públicos
+    photo_fetch_workers: int = 16
+    photo_fetch_per_host: int = 4
+    photo_fetch_allowed_hosts: List[str] = field(default_factory=list)
+    photo_fetch_timeout_s: float = 10.0
+    photo_max_bytes: int = 15 * 1024 * 1024
+    photo_fetch_ttl_s: float = 86400.0
+    photo_fetch_cache_path: Optional[str] = os.path.join(CACHE_DIR, "photo_bytes.sqlite")
+    photo_fetch_cache_max_entries: int = 5_000
+    photo_fetch_cache_max_bytes: int = 2 * 1024 ** 3
 
 # Centros aproximados (latitude, longitude) para fallback por cidade
 CITY_CENTERS = {
@@ -0,0 +1,178 @@
+from typing import List, Dict, Any, Optional, Tuple
+from bisect import bisect_left
+from collections import defaultdict
+import csv, os, re, threading, unicodedata
+import numpy as np
+
+GAZETTEER_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data", "gazetteer.csv"))
+
+# abreviações comuns de logradouro (primeira palavra)
+_STREET_ABBREV = {
+    "av": "avenida", "avn": "avenida", "r": "rua", "rod": "rodovia", "al": "alameda",
+    "pc": "praca", "pca": "praca", "est": "estrada", "estr": "estrada", "tv": "travessa",
+    "trav": "travessa", "lg": "largo", "vl": "vila",
+}
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+def normalize(text: Optional[str], street: bool = False) -> str:
+    # sem acentos, sem caixa, só letras/dígitos separados por um espaço
+    s = unicodedata.normalize("NFKD", text or "")
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).casefold()
+    tokens = _NON_ALNUM.sub(" ", s).split()
+    if street and tokens:
+        tokens[0] = _STREET_ABBREV.get(tokens[0], tokens[0])
+    return " ".join(tokens)
+
+def street_key(address: Optional[str]) -> str:
+    # logradouro sem número/complemento ("Av. X, 123 - galpão 2" -> "avenida x")
+    return normalize(re.split(r"[,;]", address or "", maxsplit=1)[0], street=True)
+
+def trigrams(s: str) -> List[str]:
+    p = f"  {s} "
+    return sorted({p[i:i + 3] for i in range(len(p) - 2)})
+
+class NameIndex:
+    """
+    Índice de nomes já normalizados: exato (dict), prefixo (lista ordenada +
+    bisect) e trigramas (listas invertidas) para busca aproximada.
+    """
+
+    def __init__(self, names: List[str]):
+        self.names = names
+        self._exact: Dict[str, List[int]] = defaultdict(list)
+        postings: Dict[str, List[int]] = defaultdict(list)
+        self._ngrams = np.empty(len(names), dtype=np.int32)
+        for i, n in enumerate(names):
+            self._exact[n].append(i)
+            grams = trigrams(n)
+            self._ngrams[i] = len(grams)
+            for g in grams:
+                postings[g].append(i)
+        self._postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+        self._sorted = sorted(names)
+        self._sorted_ids = [i for _, i in sorted((n, i) for i, n in enumerate(names))]
+
+    def exact(self, name: str) -> List[int]:
+        return self._exact.get(name, [])
+
+    def prefix(self, prefix: str, limit: int = 10, allowed: Optional[np.ndarray] = None) -> List[int]:
+        # allowed: máscara booleana por id (ex.: cidades de um estado)
+        a = bisect_left(self._sorted, prefix)
+        out = []
+        while a < len(self._sorted) and len(out) < limit and self._sorted[a].startswith(prefix):
+            if allowed is None or allowed[self._sorted_ids[a]]:
+                out.append(self._sorted_ids[a])
+            a += 1
+        return out
+
+    def fuzzy(self, name: str, min_score: float = 0.6, limit: int = 5,
+              allowed: Optional[np.ndarray] = None) -> List[Tuple[float, int]]:
+        """
+        Candidatos por similaridade de trigramas (Dice), do mais parecido ao
+        menos. Só percorre as listas dos trigramas da consulta.
+        """
+        grams = trigrams(name)
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            return []
+        ids, common = np.unique(np.concatenate(hits), return_counts=True)
+        if allowed is not None:
+            ids, common = ids[allowed[ids]], common[allowed[ids]]
+        score = 2.0 * common / (len(grams) + self._ngrams[ids])
+        keep = score >= min_score
+        ids, score = ids[keep], score[keep]
+        top = np.lexsort((ids, -score))[:limit]
+        return [(float(score[k]), int(ids[k])) for k in top]
+
+    def lookup(self, name: str, min_score: float = 0.6,
+               allowed: Optional[np.ndarray] = None) -> List[Tuple[float, int]]:
+        # exato (1.0) > prefixo único (fração do nome casada) > aproximado; só ids em `allowed`
+        if not name:
+            return []
+        ids = [i for i in self.exact(name) if allowed is None or allowed[i]]
+        if ids:
+            return [(1.0, i) for i in ids]
+        ids = self.prefix(name, limit=2, allowed=allowed)
+        if len(ids) == 1 and len(name) >= 3:
+            return [(len(name) / len(self.names[ids[0]]), ids[0])]
+        return self.fuzzy(name, min_score, allowed=allowed)
+
+class Gazetteer:
+    """
+    Gazetteer offline: municípios (com apelidos, ex. "BH") e pontos de
+    logradouro por município. Logradouros são indexados por cidade, então a
+    busca aproximada de rua só olha as ruas do município resolvido.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        cities = [r for r in rows if r["kind"] == "city"]
+        self.cities = cities
+        self._city_index = NameIndex([normalize(r["name"]) for r in cities])
+        states = np.array([r["state"].upper() for r in cities])
+        self._city_states = {st: states == st for st in set(states.tolist())}
+        by_city: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+        for r in rows:
+            if r["kind"] == "street":
+                by_city[(normalize(r["city"]), r["state"].upper())].append(r)
+        self.streets = dict(by_city)
+        self._street_index = {k: NameIndex([street_key(r["name"]) for r in v]) for k, v in by_city.items()}
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Gazetteer":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = [{**r, "lat": float(r["lat"]), "lon": float(r["lon"])} for r in csv.DictReader(f)]
+        return cls(rows)
+
+    def resolve_city(self, city: str, state: Optional[str] = None) -> Optional[Tuple[float, Dict[str, Any]]]:
+        # com estado, só cidades dele: "Sao Paulo"/MG não vira São Paulo/SP
+        allowed = None
+        if state:
+            allowed = self._city_states.get(state.strip().upper())
+            if allowed is None:
+                return None
+        hits = self._city_index.lookup(normalize(city), allowed=allowed)
+        if not hits:
+            return None
+        score, i = hits[0]
+        return score, self.cities[i]
+
+    def resolve(self, address: Optional[str], city: str, state: Optional[str] = None,
+                min_street_score: float = 0.75) -> Optional[Dict[str, Any]]:
+        """
+        Resolve o endereço: ponto do logradouro quando houver no município,
+        senão o centro do município. Retorna {lat, lon, level ("street" ou
+        "city"), name, city, state, score} ou None.
+        """
+        found = self.resolve_city(city, state)
+        if found is None:
+            return None
+        city_score, c = found
+        canon = (normalize(c["city"]), c["state"].upper())
+        index = self._street_index.get(canon)
+        key = street_key(address)
+        if index is not None and key:
+            hits = index.lookup(key, min_street_score)
+            if hits:
+                score, j = hits[0]
+                s = self.streets[canon][j]
+                return {"lat": s["lat"], "lon": s["lon"], "level": "street", "name": s["name"],
+                        "city": c["city"], "state": c["state"], "score": min(score, city_score)}
+        return {"lat": c["lat"], "lon": c["lon"], "level": "city", "name": c["city"],
+                "city": c["city"], "state": c["state"], "score": city_score}
+
+_gazetteers: Dict[str, Tuple[float, Gazetteer]] = {}
+_lock = threading.Lock()
+
+def load_gazetteer(path: str = GAZETTEER_PATH) -> Gazetteer:
+    """
+    Gazetteer do arquivo CSV, carregado uma vez por processo e recarregado só
+    se o arquivo mudar (mtime).
+    """
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    with _lock:
+        hit = _gazetteers.get(path)
+        if hit is None or hit[0] != mtime:
+            hit = (mtime, Gazetteer.from_csv(path))
+            _gazetteers[path] = hit
+        return hit[1]
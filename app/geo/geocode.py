@@ -1,16 +1,43 @@
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Dict, Any
+from functools import lru_cache
 from app.config import CITY_CENTERS
-import math
+from app.geo.gazetteer import GAZETTEER_PATH, load_gazetteer, normalize, street_key
+import math, os
+import numpy as np
 
-def geocode(address: str, city: str, state: str, country: str) -> Optional[Tuple[float, float]]:
+_BRAZIL = {"", "br", "bra", "brasil", "brazil"}
+
+@lru_cache(maxsize=65536)
+def _resolve(path: str, mtime: float, street: str, city: str, state: str) -> Optional[Tuple[Tuple[str, Any], ...]]:
+    # memo pela versão do arquivo (caminho, mtime), não pelo objeto: um gazetteer
+    # trocado não fica preso no cache; match imutável, quem chama recebe um dict novo
+    match = load_gazetteer(path).resolve(street, city, state or None)
+    return tuple(match.items()) if match else None
+
+def geocode_match(address: str, city: str, state: str, country: str) -> Optional[Dict[str, Any]]:
     """
-    Geocodificação simplificada: tenta *match* de cidade.
-    Em produção, substitua por Nominatim/OSM ou Google Geocoding API.
+    Geocodificação offline pelo gazetteer local (data/gazetteer.csv): ponto do
+    logradouro quando conhecido, senão centro do município; nomes sem acento,
+    caixa ou abreviação ("Av.", "R.") e com tolerância a erros de digitação.
+    Retorna o match (ver `Gazetteer.resolve`) ou None.
     """
-    if city in CITY_CENTERS:
-        return CITY_CENTERS[city]
-    # fallback trivial: retorna None se não souber
-    return None
+    if normalize(country) not in _BRAZIL:
+        return None
+    try:
+        mtime = os.path.getmtime(GAZETTEER_PATH)
+    except OSError:
+        # sem arquivo: só os centros de cidade da configuração
+        if city in CITY_CENTERS:
+            lat, lon = CITY_CENTERS[city]
+            return {"lat": lat, "lon": lon, "level": "city", "name": city,
+                    "city": city, "state": state, "score": 1.0}
+        return None
+    match = _resolve(GAZETTEER_PATH, mtime, street_key(address), normalize(city), (state or "").strip().upper())
+    return dict(match) if match else None
+
+def geocode(address: str, city: str, state: str, country: str) -> Optional[Tuple[float, float]]:
+    match = geocode_match(address, city, state, country)
+    return (match["lat"], match["lon"]) if match else None
 
 def haversine_km(lat1, lon1, lat2, lon2):
     R = 6371.0
@@ -20,3 +47,12 @@ def haversine_km(lat1, lon1, lat2, lon2):
     a = (math.sin(dphi/2)**2 +
          math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2)
     return 2 * R * math.asin(math.sqrt(a))
+
+def haversine_km_vec(lat1, lon1, lat2, lon2):
+    # versão NumPy (arrays ou escalares); NaN onde faltar coordenada
+    R = 6371.0
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(np.subtract(lat2, lat1))
+    dlambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi/2)**2 + np.cos(phi1)*np.cos(phi2)*np.sin(dlambda/2)**2
+    return 2 * R * np.arcsin(np.sqrt(a))
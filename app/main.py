@@ -1,10 +1,196 @@
-from fastapi import FastAPI
-from app.schemas import PropertyInput, AssessmentResult
-from app.pricing.assessor import assess
+from typing import Optional, Dict, Any, Awaitable, Callable, Iterator, List, Tuple, Union, Annotated
+import asyncio
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool
+from app.config import AppConfig
+from app.schemas import (PropertyInput, PropertyFields, AssessmentResult, BatchAssessRequest, BatchAssessResult,
+                         WhatIfRequest, WhatIfResult, MarketHeatmap, PropertyType)
+from app.pricing.assessor import assess_async
+from app.pricing.batch import assess_batch
+from app.pricing.whatif import sweep
+from app.pricing.result_cache import ResultCache, fingerprint, data_version, with_subject
+from app.model.market import load_market
+from app.report.html import render_html_stream, report_context, zip_reports
+from app.utils.concurrency import AdmissionGate, Saturated
+from app.utils import metrics
 
 app = FastAPI(title="Avaliador de Imóveis — MVP", version="0.1.0")
 
+_cfg = AppConfig()
+gate = AdmissionGate(_cfg.max_concurrent_assessments, _cfg.max_queued_assessments)
+results = ResultCache(_cfg.result_cache_ttl_s, _cfg.result_cache_max_entries)
+
+def _saturated(route: str, e: Saturated) -> HTTPException:
+    metrics.ASSESSMENTS.inc(route=route, status="rejected")
+    return HTTPException(status_code=429, detail=f"Avaliações saturadas ({e}); tente novamente.",
+                         headers={"Retry-After": "1"})
+
+async def _assess_admitted(payload: Dict[str, Any], route: str,
+                           run: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]] = assess_async
+                           ) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    # avaliação sob o limite de concorrência (429 quando saturado), com métricas
+    try:
+        async with gate:
+            with metrics.collect_timings() as timings:
+                with metrics.span("total"):
+                    result = await run(payload)
+    except Saturated as e:
+        raise _saturated(route, e)
+    except Exception:
+        metrics.ASSESSMENTS.inc(route=route, status="error")
+        raise
+    metrics.ASSESSMENTS.inc(route=route, status="ok")
+    return result, timings
+
+async def _assess_cached(subject: PropertyFields, route: str, uncertainty: Optional[bool] = None
+                         ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Avaliação pelo cache de resultados: pedidos iguais (impressão digital)
+    dividem o cálculo em andamento e reaproveitam o pronto até o TTL ou até os
+    dados mudarem. Devolve também os cabeçalhos X-Cache (HIT/MISS/COALESCED) e Age.
+    """
+    flag = _cfg.uncertainty if uncertainty is None else uncertainty
+    # com fotos, a impressão digital lê os arquivos: fora do event loop
+    if getattr(subject, "photos", None):
+        key = await asyncio.to_thread(fingerprint, subject, flag)
+    else:
+        key = fingerprint(subject, flag)
+
+    async def compute() -> Dict[str, Any]:
+        result, _ = await _assess_admitted(subject.model_dump(), route, lambda p: assess_async(p, uncertainty))
+        return result
+
+    result, status, age = await results.get_or_compute(key, data_version(_cfg), compute)
+    return with_subject(result, subject), {"X-Cache": status.upper(), "Age": str(int(age))}
+
 @app.post("/assess", response_model=AssessmentResult)
-def post_assess(payload: PropertyInput):
-    result = assess(payload.model_dump())
+async def post_assess(payload: PropertyInput, response: Response, debug: Optional[str] = None,
+                      uncertainty: Optional[bool] = None):
+    # uncertainty=true: bandas de confiança (bootstrap) em rental/sale["confidence"]
+    if debug == "timings":
+        # tempos de um cálculo de fato: passa por fora do cache
+        result, timings = await _assess_admitted(payload.model_dump(), "assess",
+                                                 lambda p: assess_async(p, uncertainty))
+        result["explainability"]["timings_ms"] = {k: round(v * 1000, 3) for k, v in timings.items()}
+        response.headers["X-Cache"] = "BYPASS"
+        return result
+    result, headers = await _assess_cached(payload, "assess", uncertainty)
+    response.headers.update(headers)
     return result
+
+def _check_batch(payload: BatchAssessRequest) -> None:
+    if len(payload.items) > _cfg.batch_max_items:
+        raise HTTPException(status_code=422,
+                            detail=f"Lote com {len(payload.items)} itens; máximo {_cfg.batch_max_items}")
+
+@app.post("/assess/batch", response_model=BatchAssessResult)
+async def post_assess_batch(payload: BatchAssessRequest):
+    # o lote ocupa uma vaga do limite de avaliações (429 se saturado), numa thread
+    _check_batch(payload)
+    try:
+        async with gate:
+            with metrics.span("batch.total"):
+                results = await asyncio.to_thread(assess_batch, payload.items, include_comps=payload.include_comps,
+                                                  uncertainty=payload.uncertainty)
+    except Saturated as e:
+        raise _saturated("assess_batch", e)
+    for r in results:
+        metrics.ASSESSMENTS.inc(route="assess_batch", status="ok" if r["ok"] else "error")
+    return {"results": results}
+
+@app.post("/assess/whatif", response_model=WhatIfResult)
+async def post_whatif(payload: WhatIfRequest):
+    # comps buscados uma vez; a grade inteira é calculada em lote (numa thread)
+    def run(subject: Dict[str, Any]):
+        return asyncio.to_thread(sweep, subject, payload.alpha_distance, payload.alpha_recency,
+                                 payload.alpha_area_diff, payload.built_area_m2)
+    try:
+        result, _ = await _assess_admitted(payload.subject.model_dump(), "whatif", run)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return result
+
+@app.get("/market/heatmap", response_model=MarketHeatmap)
+def get_market_heatmap(property_type: PropertyType = "galpao", is_rental: bool = False,
+                       resolution: Optional[int] = None, months: Optional[int] = None, min_count: int = 1):
+    # R$/m² por célula H3 direto dos agregados de mercado (sem varrer anúncios)
+    market = load_market(_cfg.market_path) if _cfg.market_path else None
+    if market is None:
+        raise HTTPException(status_code=404, detail="Agregados de mercado indisponíveis (ver AppConfig.market_path).")
+    months = months or _cfg.market_months
+    resolution = market.resolutions[0] if resolution is None else resolution
+    try:
+        cells = market.heatmap(property_type, is_rental, resolution, months, min_count)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"property_type": property_type, "is_rental": is_rental, "resolution": resolution,
+            "months": months, "cells": cells}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # formato texto do Prometheus
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+def _report_response(payload: PropertyFields, result: Dict[str, Any], headers: Dict[str, str]) -> StreamingResponse:
+    ctx = report_context(result, payload.property_type, payload.built_area_m2)
+    return StreamingResponse(render_html_stream(ctx), media_type="text/html; charset=utf-8", headers=headers)
+
+@app.get("/report")
+async def get_report(payload: Annotated[PropertyFields, Query()]):
+    # mesmos campos de /assess (sem fotos) na query string
+    result, headers = await _assess_cached(payload, "report")
+    return _report_response(payload, result, headers)
+
+@app.post("/report")
+async def post_report(payload: PropertyInput):
+    result, headers = await _assess_cached(payload, "report")
+    return _report_response(payload, result, headers)
+
+# itens avaliados por vez no zip (limita a memória com lotes grandes)
+REPORT_ZIP_CHUNK = 200
+
+def _report_entries(items: List[Dict[str, Any]]) -> Iterator[Tuple[str, Union[Dict[str, Any], str]]]:
+    for a in range(0, len(items), REPORT_ZIP_CHUNK):
+        chunk = items[a:a + REPORT_ZIP_CHUNK]
+        for r in assess_batch(chunk, include_comps=True):
+            i = a + r["index"]
+            metrics.ASSESSMENTS.inc(route="report_batch", status="ok" if r["ok"] else "error")
+            if r["ok"]:
+                item = chunk[r["index"]]
+                yield (f"relatorio_{i:05d}.html",
+                       report_context(r["result"], item.get("property_type", "galpao"), item["built_area_m2"]))
+            else:
+                yield f"erro_{i:05d}.txt", r["error"]
+
+@app.post("/report/batch")
+async def post_report_batch(payload: BatchAssessRequest):
+    """
+    Zip com um relatório por item (ou o erro de validação), gerado em fluxo.
+    O lote ocupa uma vaga do limite de avaliações até o fim do zip (429 se
+    saturado), como qualquer avaliação.
+    """
+    _check_batch(payload)
+    try:
+        await gate.__aenter__()
+    except Saturated as e:
+        raise _saturated("report_batch", e)
+    released = False
+
+    async def release() -> None:
+        # uma vez só: no fim do fluxo, em erro ou quando o cliente desiste
+        nonlocal released
+        if not released:
+            released = True
+            await gate.__aexit__(None, None, None)
+
+    async def stream():
+        try:
+            async for chunk in iterate_in_threadpool(zip_reports(_report_entries(payload.items))):
+                yield chunk
+        finally:
+            await release()
+
+    return StreamingResponse(stream(), media_type="application/zip", background=BackgroundTask(release),
+                             headers={"Content-Disposition": 'attachment; filename="relatorios.zip"'})
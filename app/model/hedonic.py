@@ -1,8 +1,11 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Sequence
 from datetime import datetime
-import math
+import numpy as np
+from app.comps.record import Comp
 
-def _months_since(date_str: str) -> float:
+QUANTILES = (0.25, 0.5, 0.75)
+
+def _months_since(date_str: str, now: Optional[datetime] = None) -> float:
     if not date_str:
         return 1.0
     try:
@@ -13,81 +16,292 @@ def _months_since(date_str: str) -> float:
             d = datetime.strptime(date_str, "%Y-%m-%d")
         except Exception:
             return 1.0
-    delta = datetime.now() - d
+    delta = (now or datetime.now()) - d
     return max(delta.days / 30.0, 0.0)
 
-def _weighted_quantile(values, weights, q):
-    # Quantil ponderado (q em [0,1])
-    # Ordena por valor
-    pairs = sorted(zip(values, weights), key=lambda x: x[0])
-    cum_w = 0.0
-    total_w = sum(weights)
+def months_since_many(dates: Sequence[Any], now: Optional[datetime] = None) -> np.ndarray:
+    # cada data distinta é interpretada uma vez (anúncios repetem muito as datas)
+    now = now or datetime.now()
+    memo = {d: _months_since(d, now) for d in set(dates)}
+    return np.fromiter((memo[d] for d in dates), dtype=float, count=len(dates))
+
+def months_since_dates(posted_at: np.ndarray, now: Optional[datetime] = None) -> np.ndarray:
+    # mesma conta de _months_since sobre datetime64 (NaT = sem data = 1 mês)
+    posted_at = np.asarray(posted_at, dtype="datetime64[us]")
+    missing = np.isnat(posted_at)
+    now64 = np.datetime64(now or datetime.now(), "us")
+    days = (now64 - np.where(missing, now64, posted_at)) // np.timedelta64(1, "D")
+    return np.where(missing, 1.0, np.maximum(days / 30.0, 0.0))
+
+def weighted_quantiles(values, weights, qs: Sequence[float] = QUANTILES) -> np.ndarray:
+    """
+    Quantis ponderados (q em [0,1]) com uma única ordenação e uma única soma
+    acumulada: para cada q, o menor valor cuja massa acumulada atinge q·Σw.
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    qs = np.asarray(qs, dtype=float)
+    if values.size == 0:
+        return np.zeros(qs.shape)
+    order = np.argsort(values, kind="stable")
+    cum_w = np.cumsum(weights[order])
+    total_w = cum_w[-1]
     if total_w <= 0:
         total_w = 1.0
-    threshold = q * total_w
-    for v, w in pairs:
-        cum_w += w
-        if cum_w >= threshold:
-            return v
-    return pairs[-1][0] if pairs else 0.0
+    idx = np.searchsorted(cum_w, qs * total_w, side="left")
+    return values[order][np.minimum(idx, values.size - 1)]
+
+def weighted_quantiles_rows(values, weights, qs: Sequence[float] = QUANTILES,
+                            max_cells: int = 4_000_000) -> np.ndarray:
+    """
+    `weighted_quantiles` para cada linha de `weights` [n_linhas, n] sobre os
+    mesmos `values` (ex.: várias combinações de alphas): uma ordenação só e
+    somas acumuladas por linha, em blocos de até `max_cells` células.
+    Retorna quantis[n_linhas, len(qs)].
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    qs = np.asarray(qs, dtype=float)
+    out = np.zeros((weights.shape[0], qs.size))
+    if values.size == 0:
+        return out
+    order = np.argsort(values, kind="stable")
+    v = values[order]
+    rows = max(1, max_cells // (values.size * qs.size))
+    for a in range(0, weights.shape[0], rows):
+        cum_w = np.cumsum(weights[a:a + rows, order], axis=1)
+        total_w = cum_w[:, -1]
+        total_w = np.where(total_w <= 0, 1.0, total_w)
+        # searchsorted(side="left") por linha: quantos acumulados ficam abaixo do alvo
+        idx = (cum_w[:, None, :] < (qs[None, :] * total_w[:, None])[:, :, None]).sum(axis=2)
+        out[a:a + rows] = v[np.minimum(idx, values.size - 1)]
+    return out
+
+def grouped_weighted_quantiles(values, weights, groups, qs: Sequence[float] = QUANTILES,
+                               max_cells: int = 4_000_000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `weighted_quantiles` para muitos grupos de uma vez (ex.: um grupo por assunto).
+    `groups` deve vir em ordem não decrescente; dentro de cada grupo a ordem de
+    entrada desempata valores iguais, como em `weighted_quantiles`. As somas
+    acumuladas são feitas por grupo (linhas de uma matriz preenchida com zeros),
+    em blocos de até `max_cells` células.
+    Retorna (ids_dos_grupos, quantis[n_grupos, len(qs)]).
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    groups = np.asarray(groups)
+    qs = np.asarray(qs, dtype=float)
+    if values.size == 0:
+        return groups[:0], np.zeros((0, qs.size))
+    order = np.lexsort((values, groups))
+    v, w, g = values[order], weights[order], groups[order]
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    lens = np.diff(np.r_[starts, v.size])
+    out = np.empty((starts.size, qs.size))
+    rows = max(1, max_cells // int(lens.max()))
+    for a in range(0, starts.size, rows):
+        st, ln = starts[a:a + rows], lens[a:a + rows]
+        width = int(ln.max())
+        pos = np.arange(width)
+        valid = pos[None, :] < ln[:, None]
+        src = np.where(valid, st[:, None] + pos[None, :], 0)
+        cum_w = np.cumsum(np.where(valid, w[src], 0.0), axis=1)
+        total_w = cum_w[np.arange(st.size), ln - 1]
+        total_w = np.where(total_w <= 0, 1.0, total_w)
+        hit = valid[:, None, :] & (cum_w[:, None, :] >= (qs[None, :] * total_w[:, None])[:, :, None])
+        idx = np.where(hit.any(axis=2), hit.argmax(axis=2), (ln - 1)[:, None])
+        out[a:a + rows] = v[st[:, None] + idx]
+    return g[starts], out
+
+def bootstrap_bands(values, weights, qs: Sequence[float] = QUANTILES, resamples: int = 10_000,
+                    level: float = 0.90, seed: int = 0, max_cells: int = 4_000_000) -> np.ndarray:
+    """
+    Intervalo de confiança (bootstrap ponderado) de cada quantil de
+    `weighted_quantiles`: `resamples` reamostragens dos comps com reposição
+    (matriz de índices [reamostragens, n], RNG com `seed`), cada comp com o
+    seu peso. Em blocos de até `max_cells` células.
+    Retorna [len(qs), 2] com os percentis (1-level)/2 e (1+level)/2 dos quantis.
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    qs = np.asarray(qs, dtype=float)
+    n = values.size
+    if n == 0 or resamples <= 0:
+        return np.zeros((qs.size, 2))
+    order = np.argsort(values, kind="stable")
+    v, w = values[order], weights[order]
+    rng = np.random.default_rng(seed)
+    stats = np.empty((resamples, qs.size))
+    rows = max(1, max_cells // n)
+    for a in range(0, resamples, rows):
+        b = min(rows, resamples - a)
+        r = np.arange(b)[:, None]
+        # índices sorteados (posições na ordem dos valores) -> contagem por comp
+        idx = rng.integers(0, n, size=(b, n))
+        counts = np.bincount((idx + r * n).ravel(), minlength=b * n).reshape(b, n)
+        cum_w = np.cumsum(counts * w[None, :], axis=1)
+        total_w = cum_w[:, -1:]
+        total_w = np.where(total_w <= 0, 1.0, total_w)
+        # massa acumulada normalizada + nº da linha: um só vetor crescente,
+        # e o searchsorted(side="left") de todas as linhas sai de uma vez
+        flat = (cum_w / total_w + r).ravel()
+        pos = np.searchsorted(flat, (qs[None, :] + r).ravel(), side="left").reshape(b, qs.size) - r * n
+        stats[a:a + b] = v[np.clip(pos, 0, n - 1)]
+    tail = (1.0 - level) / 2.0
+    return np.quantile(stats, [tail, 1.0 - tail], axis=0).T
+
+def _with_bands(ranges: Dict[str, Any], ppm2: np.ndarray, weights: np.ndarray, bootstrap: Optional[Dict[str, Any]]):
+    # bootstrap = {"resamples", "level", "seed"} (None = sem bandas)
+    if bootstrap and bootstrap.get("resamples", 0) > 0:
+        b = bootstrap_bands(ppm2, weights, QUANTILES, **bootstrap).tolist()
+        ranges["bands"] = dict(zip(("low", "p50", "high"), b))
+    return ranges
+
+def _weighted_quantile(values, weights, q):
+    # Quantil ponderado (q em [0,1])
+    return float(weighted_quantiles(values, weights, [q])[0])
+
+def comp_ppm2(c: Dict[str, Any]) -> Optional[float]:
+    # preço por m² do comp; se não veio, tenta inferir por total/área
+    ppm2 = c.get("price_per_m2")
+    if not ppm2:
+        total = c.get("price_total")
+        area = c.get("built_area_m2")
+        if total and area:
+            ppm2 = total / max(area, 1.0)
+    return ppm2 or None
+
+def comp_arrays(comps: List[Dict[str, Any]],
+                now: Optional[datetime] = None) -> Tuple[List[Dict[str, Any]], Dict[str, np.ndarray]]:
+    """
+    Extrai, numa passada, as colunas usadas pelo modelo. Comps sem preço por m²
+    (nem inferível por total/área) ficam de fora.
+    Retorna (comps_usados, {"ppm2", "distance_km", "months", "area"}).
+    """
+    kept, ppm2s, dists, dates, areas = [], [], [], [], []
+    for c in comps:
+        ppm2 = comp_ppm2(c)
+        if ppm2 is None:
+            continue
+        kept.append(c)
+        ppm2s.append(ppm2)
+        dists.append(c.get("distance_km") or 0.0)
+        dates.append(c.get("date_posted"))
+        areas.append(c.get("built_area_m2") or 0.0)
+    return kept, {
+        "ppm2": np.asarray(ppm2s, dtype=float),
+        "distance_km": np.asarray(dists, dtype=float),
+        "months": months_since_many(dates, now),
+        "area": np.asarray(areas, dtype=float),
+    }
+
+def ppm2_columns(price_m2: np.ndarray, total: np.ndarray, area: np.ndarray) -> np.ndarray:
+    # `comp_ppm2` sobre colunas (NaN = sem preço nem como inferir)
+    has_m2 = ~np.isnan(price_m2) & (price_m2 != 0)
+    # sem preço por m²: total/área quando ambos existem e não são zero
+    can_infer = ~np.isnan(total) & (total != 0) & ~np.isnan(area) & (area != 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        inferred = np.where(can_infer, total / np.maximum(np.nan_to_num(area, nan=1.0), 1.0), np.nan)
+    return np.where(has_m2, price_m2, inferred)
+
+def frame_arrays(frame, now: Optional[datetime] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    `comp_arrays` sobre um CompFrame, direto das colunas (sem dicts).
+    Retorna (posições_usadas_no_frame, {"ppm2", "distance_km", "months", "area"}).
+    """
+    area = frame.column("built_area_m2")
+    ppm2 = ppm2_columns(frame.column("price_per_m2"), frame.column("price_total"), area)
+    kept = np.flatnonzero(~np.isnan(ppm2) & (ppm2 != 0))
+    return kept, {
+        "ppm2": ppm2[kept],
+        "distance_km": np.nan_to_num(frame.distance_km[kept], nan=0.0),
+        "months": months_since_dates(frame.column("posted_at")[kept], now),
+        "area": np.nan_to_num(area[kept], nan=0.0),
+    }
+
+def comp_weights(dist: np.ndarray, months: np.ndarray, area: np.ndarray, built,
+                 alpha_distance: float, alpha_recency: float, alpha_area_diff: float) -> np.ndarray:
+    # w = exp(-(αd·dist + αt·meses + αa·|Δárea_rel|)); área ausente não penaliza.
+    # `built` pode ser escalar ou array (um assunto por elemento).
+    a_rel = np.where(area > 0, np.abs(area - built) / np.maximum(built, 1.0), 0.0)
+    return np.exp(-(alpha_distance * dist + alpha_recency * months + alpha_area_diff * a_rel))
 
 def estimate_from_comps(subject: Dict[str, Any],
                         comps: List[Dict[str, Any]],
                         alpha_distance: float,
                         alpha_recency: float,
-                        alpha_area_diff: float) -> Tuple[Dict[str, float], List[Dict[str, Any]]]:
+                        alpha_area_diff: float,
+                        bootstrap: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     """
-    Calcula faixas (p25/p50/p75) de preço por m² e total, com pesos:
+    Calcula faixas (p25/p50/p75) de preço por m² e total (mais "n": nº de
+    comps com preço), com pesos:
       w = exp(-αd * dist) * exp(-αt * meses) * exp(-αa * |Δárea_rel|)
-    Retorna (faixas, comps_ponderados).
+    Com `bootstrap` ({"resamples", "level", "seed"}), as faixas trazem também
+    "bands": intervalo de confiança de cada quantil (ver `bootstrap_bands`).
+    Retorna (faixas, comps_ponderados), cópias do mesmo tipo dos comps (dict ou Comp).
     """
     built = subject.get("built_area_m2") or 1.0
-    price_per_m2_vals = []
-    weights = []
+    kept, cols = comp_arrays(comps)
+    weights = comp_weights(cols["distance_km"], cols["months"], cols["area"], built,
+                           alpha_distance, alpha_recency, alpha_area_diff)
+
     comps_out = []
+    for c, w, m in zip(kept, weights.tolist(), cols["months"].tolist()):
+        c2 = Comp.of(c) if isinstance(c, Comp) else dict(c)
+        c2["weight"] = w
+        c2["months_since"] = m
+        comps_out.append(c2)
 
-    for c in comps:
-        ppm2 = c.get("price_per_m2")
-        total = c.get("price_total")
-        area = c.get("built_area_m2")
-        if not ppm2:
-            # se não veio por m², tenta inferir
-            if total and area:
-                ppm2 = total / max(area, 1.0)
-        if not ppm2:
-            continue
+    if not comps_out:
+        # fallback defensivo
+        return {"low": 0.0, "p50": 0.0, "high": 0.0, "total_low": 0.0, "total_p50": 0.0, "total_high": 0.0,
+                "n": 0}, comps_out
 
-        # Pesos
-        dist = c.get("distance_km") or 0.0
-        months = _months_since(c.get("date_posted"))
-        # diferença relativa de área
-        a_rel = 0.0
-        if area and built:
-            a_rel = abs(area - built) / max(built, 1.0)
+    p25, p50, p75 = weighted_quantiles(cols["ppm2"], weights, QUANTILES).tolist()
 
-        w = math.exp(-alpha_distance * dist) * math.exp(-alpha_recency * months) * math.exp(-alpha_area_diff * a_rel)
+    return _with_bands({
+        "low": p25,
+        "p50": p50,
+        "high": p75,
+        "total_low": p25 * built,
+        "total_p50": p50 * built,
+        "total_high": p75 * built,
+        "n": len(comps_out),
+    }, cols["ppm2"], weights, bootstrap), comps_out
 
-        price_per_m2_vals.append(ppm2)
-        weights.append(w)
+def estimate_from_frame(subject: Dict[str, Any],
+                        frame,
+                        alpha_distance: float,
+                        alpha_recency: float,
+                        alpha_area_diff: float,
+                        bootstrap: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    `estimate_from_comps` sobre um CompFrame: pesos e quantis calculados nas
+    colunas; só os comps usados viram dicts (com `weight` e `months_since`).
+    """
+    built = subject.get("built_area_m2") or 1.0
+    kept, cols = frame_arrays(frame)
+    weights = comp_weights(cols["distance_km"], cols["months"], cols["area"], built,
+                           alpha_distance, alpha_recency, alpha_area_diff)
 
-        c2 = dict(c)
+    comps_out = frame.records(kept)
+    for c2, w, m in zip(comps_out, weights.tolist(), cols["months"].tolist()):
         c2["weight"] = w
-        c2["months_since"] = months
-        comps_out.append(c2)
+        c2["months_since"] = m
 
-    if not price_per_m2_vals:
+    if not comps_out:
         # fallback defensivo
-        return {"low": 0.0, "p50": 0.0, "high": 0.0, "total_low": 0.0, "total_p50": 0.0, "total_high": 0.0}, comps_out
+        return {"low": 0.0, "p50": 0.0, "high": 0.0, "total_low": 0.0, "total_p50": 0.0, "total_high": 0.0,
+                "n": 0}, comps_out
 
-    p25 = _weighted_quantile(price_per_m2_vals, weights, 0.25)
-    p50 = _weighted_quantile(price_per_m2_vals, weights, 0.5)
-    p75 = _weighted_quantile(price_per_m2_vals, weights, 0.75)
+    p25, p50, p75 = weighted_quantiles(cols["ppm2"], weights, QUANTILES).tolist()
 
-    return {
+    return _with_bands({
         "low": p25,
         "p50": p50,
         "high": p75,
         "total_low": p25 * built,
         "total_p50": p50 * built,
         "total_high": p75 * built,
-    }, comps_out
+        "n": len(comps_out),
+    }, cols["ppm2"], weights, bootstrap), comps_out
@@ -0,0 +1,320 @@
+"""
+Agregados de mercado por célula H3: para cada célula (em várias resoluções),
+tipo de imóvel, finalidade (aluguel/venda) e mês de publicação, um sketch de
+quantis do R$/m² — histograma em faixas logarítmicas (estilo DDSketch: erro
+relativo <= rel_accuracy em qualquer quantil). Sketches se juntam somando
+contagens, então a camada é atualizada aos poucos (`add_table` a cada lote
+do ingest) e janelas de meses e células mais grossas saem de somas, sem
+reler anúncios. Consulta por imóvel (`estimate`) e mapa de calor (`heatmap`).
+
+Uso:
+  python -m app.model.market data/sample_listings.json --out data/market
+  python -m app.model.market data/snapshot --out data/market --resolutions 8,7,6,5
+"""
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from datetime import datetime
+import argparse, json, math, os, threading
+import numpy as np
+import h3
+from app.comps.store import CompStore
+from app.comps.table import CompTable
+from app.model.hedonic import ppm2_columns, weighted_quantiles, grouped_weighted_quantiles, QUANTILES
+
+# arquivos do estado (market_cell.npy, ...): num diretório próprio ou no snapshot do ingest
+STATE_PREFIX = "market_"
+_STATE = ("cell", "group", "month", "bin", "count", "types", "params")
+_KEYS = ("cell", "group", "month", "bin")
+
+def month_index(when: Optional[datetime] = None) -> int:
+    # meses desde 1970-01 (mesma conta de datetime64[M])
+    when = when or datetime.now()
+    return (when.year - 1970) * 12 + when.month - 1
+
+def cell_resolution(cells: np.ndarray) -> np.ndarray:
+    # resolução gravada no próprio índice H3 (bits 52-55)
+    return ((np.asarray(cells, dtype=np.uint64) >> np.uint64(52)) & np.uint64(0xF)).astype(np.int64)
+
+class MarketAggregates:
+    """
+    Contagens por (célula, grupo, mês, faixa), em colunas ordenadas; grupo =
+    código do tipo·2 + finalidade (1 = aluguel). Lotes novos ficam pendentes e
+    são consolidados na próxima consulta. Consultar uma célula é uma busca num
+    dict (célula, grupo) -> trecho das colunas: não depende do nº de anúncios.
+    Colunas e índice são trocados juntos (`_data`); consultas leem o par uma
+    vez, sem lock, enquanto outro thread consolida.
+    """
+
+    def __init__(self, resolutions: Sequence[int] = (7, 6, 5, 4), rel_accuracy: float = 0.02):
+        if not 0 < rel_accuracy < 1:
+            raise ValueError("rel_accuracy deve estar em (0, 1)")
+        self.resolutions = tuple(sorted({int(r) for r in resolutions}, reverse=True))
+        self.rel_accuracy = rel_accuracy
+        self._gamma = (1 + rel_accuracy) / (1 - rel_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.types: List[str] = []
+        self._codes: Dict[str, int] = {}
+        cols: Dict[str, np.ndarray] = {
+            "cell": np.empty(0, np.uint64), "group": np.empty(0, np.int32), "month": np.empty(0, np.int32),
+            "bin": np.empty(0, np.int32), "count": np.empty(0, np.int64)}
+        # (colunas, índice (célula, grupo) -> trecho): sempre substituído inteiro
+        self._data: Tuple[Dict[str, np.ndarray], Dict[Tuple[int, int], Tuple[int, int]]] = (cols, {})
+        self._pending: List[Dict[str, np.ndarray]] = []
+        self._lock = threading.Lock()
+
+    def params(self) -> Dict[str, Any]:
+        # o que precisa bater para juntar agregados
+        return {"resolutions": list(self.resolutions), "rel_accuracy": self.rel_accuracy}
+
+    def __len__(self) -> int:
+        # nº de anúncios contados (na resolução mais fina)
+        cols, _ = self._compacted()
+        fine = cell_resolution(cols["cell"]) == self.resolutions[0]
+        return int(cols["count"][fine].sum())
+
+    def _bins(self, ppm2: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(ppm2) / self._log_gamma).astype(np.int32)
+
+    def _values(self, bins: np.ndarray) -> np.ndarray:
+        # representante da faixa (γ^(i-1), γ^i]: erro relativo <= rel_accuracy
+        return 2.0 * np.power(self._gamma, bins.astype(float)) / (self._gamma + 1.0)
+
+    def _type_code(self, name: str) -> int:
+        if name not in self._codes:
+            self._codes[name] = len(self.types)
+            self.types.append(name)
+        return self._codes[name]
+
+    def add_table(self, table: CompTable, now: Optional[datetime] = None, chunk: int = 200_000) -> int:
+        """
+        Conta os anúncios da tabela (em memória ou snapshot) com coordenadas,
+        tipo, finalidade e R$/m² (informado ou total/área). Sem data de
+        publicação, conta no mês de `now` (chegada). Retorna quantos entraram.
+        """
+        remap = np.array([self._type_code(v) for v in table.vocab.get("property_type", [])] + [-1], dtype=np.int64)
+        added = 0
+        for a in range(0, len(table), chunk):
+            b = min(a + chunk, len(table))
+            cols = {k: np.asarray(table[k][a:b]) for k in
+                    ("lat", "lon", "price_per_m2", "price_total", "built_area_m2", "is_rental",
+                     "posted_at", "property_type")}
+            ppm2 = ppm2_columns(cols["price_per_m2"], cols["price_total"], cols["built_area_m2"])
+            code = remap[cols["property_type"]]
+            ok = (~np.isnan(cols["lat"]) & ~np.isnan(cols["lon"]) & (ppm2 > 0)
+                  & (cols["is_rental"] >= 0) & (code >= 0))
+            sel = np.flatnonzero(ok)
+            if not len(sel):
+                continue
+            posted = cols["posted_at"][sel]
+            month = np.where(np.isnat(posted), month_index(now),
+                             posted.astype("datetime64[M]").astype(np.int64)).astype(np.int32)
+            group = (code[sel] * 2 + cols["is_rental"][sel]).astype(np.int32)
+            bins = self._bins(ppm2[sel])
+            fine = np.fromiter((int(h3.geo_to_h3(la, lo, self.resolutions[0]), 16)
+                                for la, lo in zip(cols["lat"][sel].tolist(), cols["lon"][sel].tolist())),
+                               dtype=np.uint64, count=len(sel))
+            # células mais grossas pelos pais das células distintas (poucas)
+            uniq, inv = np.unique(fine, return_inverse=True)
+            hexes = [format(int(c), "x") for c in uniq.tolist()]
+            for res in self.resolutions:
+                if res == self.resolutions[0]:
+                    cells = fine
+                else:
+                    parents = np.array([int(h3.h3_to_parent(h, res), 16) for h in hexes], dtype=np.uint64)
+                    cells = parents[inv]
+                self._push({"cell": cells, "group": group, "month": month, "bin": bins,
+                            "count": np.ones(len(sel), dtype=np.int64)})
+            added += len(sel)
+        return added
+
+    def add(self, records: Sequence[Dict[str, Any]], now: Optional[datetime] = None) -> int:
+        # registros de anúncio (dicts ou Comp), como `add_table`
+        return self.add_table(CompTable.from_records(records, keep_objects=False), now) if records else 0
+
+    def merge(self, other: "MarketAggregates") -> None:
+        # soma os sketches de `other` (mesmas resoluções e precisão)
+        if other.params() != self.params():
+            raise ValueError(f"Agregados incompatíveis: {other.params()} != {self.params()}")
+        remap = np.array([self._type_code(t) for t in other.types] or [0], dtype=np.int32)
+        cols = dict(other._compacted()[0])
+        cols["group"] = remap[cols["group"] // 2] * 2 + cols["group"] % 2
+        self._push(cols)
+
+    def _push(self, part: Dict[str, np.ndarray]) -> None:
+        # sob o lock: um lote não se perde enquanto `_compact` consolida
+        with self._lock:
+            self._pending.append(part)
+
+    def _compacted(self) -> Tuple[Dict[str, np.ndarray], Dict[Tuple[int, int], Tuple[int, int]]]:
+        # (colunas, índice) consolidados, lidos de uma vez
+        self._compact()
+        return self._data
+
+    def _compact(self) -> None:
+        # junta pendentes: uma linha por (célula, grupo, mês, faixa), ordenadas
+        if not self._pending:
+            return
+        with self._lock:
+            if not self._pending:
+                return
+            parts = [self._data[0]] + self._pending
+            cols = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+            order = np.lexsort(tuple(cols[k] for k in reversed(_KEYS)))
+            cols = {k: v[order] for k, v in cols.items()}
+            new = np.ones(len(order), dtype=bool)
+            if len(order):
+                new[1:] = np.any([cols[k][1:] != cols[k][:-1] for k in _KEYS], axis=0)
+            starts = np.flatnonzero(new)
+            out = {k: cols[k][starts] for k in _KEYS}
+            out["count"] = np.add.reduceat(cols["count"], starts) if len(starts) else cols["count"][:0]
+            # trechos por (célula, grupo)
+            cg = np.ones(len(starts), dtype=bool)
+            if len(starts):
+                cg[1:] = (out["cell"][1:] != out["cell"][:-1]) | (out["group"][1:] != out["group"][:-1])
+            bounds = np.r_[np.flatnonzero(cg), len(starts)]
+            index = {(c, g): (a, b) for c, g, a, b in zip(
+                out["cell"][bounds[:-1]].tolist(), out["group"][bounds[:-1]].tolist(),
+                bounds[:-1].tolist(), bounds[1:].tolist())}
+            self._data = (out, index)
+            self._pending = []
+
+    def _group(self, property_type: str, is_rental: bool) -> Optional[int]:
+        code = self._codes.get(property_type)
+        return None if code is None else code * 2 + int(bool(is_rental))
+
+    def estimate(self, lat: float, lon: float, property_type: str, is_rental: bool,
+                 months: int = 12, min_count: int = 1, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Quantis (p25/p50/p75) de R$/m² dos anúncios publicados nos últimos
+        `months` meses na célula que contém o ponto, da resolução mais fina
+        para a mais grossa, parando na primeira com pelo menos `min_count`.
+        Retorna {"low", "p50", "high", "n", "cell", "resolution", "months"} ou None.
+        """
+        group = self._group(property_type, is_rental)
+        if group is None:
+            return None
+        cols, index = self._compacted()
+        first = month_index(now) - months + 1
+        fine = h3.geo_to_h3(lat, lon, self.resolutions[0])
+        for res in self.resolutions:
+            cell = fine if res == self.resolutions[0] else h3.h3_to_parent(fine, res)
+            span = index.get((int(cell, 16), group))
+            if span is None:
+                continue
+            a, b = span
+            recent = cols["month"][a:b] >= first
+            counts = cols["count"][a:b][recent]
+            n = int(counts.sum())
+            if n < max(min_count, 1):
+                continue
+            low, p50, high = weighted_quantiles(self._values(cols["bin"][a:b][recent]), counts,
+                                                QUANTILES).tolist()
+            return {"low": low, "p50": p50, "high": high, "n": n, "cell": cell,
+                    "resolution": res, "months": months}
+        return None
+
+    def heatmap(self, property_type: str, is_rental: bool, resolution: Optional[int] = None,
+                months: int = 12, min_count: int = 1, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Uma linha por célula da resolução (padrão: a mais fina) com pelo menos
+        `min_count` anúncios nos últimos `months` meses: {"cell", "lat", "lon",
+        "n", "low", "p50", "high"} (centro da célula; quantis de R$/m²).
+        """
+        resolution = self.resolutions[0] if resolution is None else resolution
+        if resolution not in self.resolutions:
+            raise ValueError(f"Resolução {resolution} não agregada (disponíveis: {list(self.resolutions)})")
+        group = self._group(property_type, is_rental)
+        if group is None:
+            return []
+        c, _ = self._compacted()
+        sel = np.flatnonzero((c["group"] == group) & (c["month"] >= month_index(now) - months + 1)
+                             & (cell_resolution(c["cell"]) == resolution))
+        cells, cell_id = np.unique(c["cell"][sel], return_inverse=True)
+        counts = c["count"][sel]
+        n = np.bincount(cell_id, weights=counts, minlength=len(cells)).astype(np.int64)
+        ids, q = grouped_weighted_quantiles(self._values(c["bin"][sel]), counts, cell_id, QUANTILES)
+        out = []
+        for i, (low, p50, high) in zip(ids.tolist(), q.tolist()):
+            if n[i] < min_count:
+                continue
+            cell = format(int(cells[i]), "x")
+            lat, lon = h3.h3_to_geo(cell)
+            out.append({"cell": cell, "lat": lat, "lon": lon, "n": int(n[i]),
+                        "low": low, "p50": p50, "high": high})
+        return out
+
+    def state(self) -> Dict[str, np.ndarray]:
+        # colunas consolidadas, vocabulário de tipos e parâmetros (o que `from_state` lê)
+        out = dict(self._compacted()[0])
+        out["types"] = np.array(self.types, dtype=str)
+        out["params"] = np.array([self.rel_accuracy] + list(self.resolutions), dtype=float)
+        return out
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray]) -> "MarketAggregates":
+        params = np.asarray(state["params"]).tolist()
+        agg = cls([int(r) for r in params[1:]], params[0])
+        for t in np.asarray(state["types"]).tolist():
+            agg._type_code(t)
+        agg._pending.append({k: np.asarray(state[k]) for k in _KEYS + ("count",)})
+        agg._compact()
+        return agg
+
+    def save(self, path: str) -> str:
+        os.makedirs(path, exist_ok=True)
+        for name, arr in self.state().items():
+            np.save(os.path.join(path, f"{STATE_PREFIX}{name}.npy"), arr)
+        return path
+
+    @classmethod
+    def open(cls, path: str) -> "MarketAggregates":
+        # diretório com market_*.npy (gravado por `save` ou pelo ingest, no snapshot)
+        return cls.from_state({k: np.load(os.path.join(path, f"{STATE_PREFIX}{k}.npy")) for k in _STATE})
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(os.path.join(path, f"{STATE_PREFIX}{k}.npy")) for k in _STATE)
+
+_markets: Dict[str, Tuple[float, MarketAggregates]] = {}
+_lock = threading.Lock()
+
+def market_mtime(path: str) -> Optional[float]:
+    # versão dos agregados do diretório (None se não há agregados)
+    path = os.path.abspath(path)
+    if not MarketAggregates.exists(path):
+        return None
+    return os.path.getmtime(os.path.join(path, f"{STATE_PREFIX}count.npy"))
+
+def load_market(path: str) -> Optional[MarketAggregates]:
+    """
+    Agregados do diretório, carregados uma vez por processo e recarregados
+    só se mudarem (mtime); None se o diretório não tem agregados.
+    """
+    path = os.path.abspath(path)
+    mtime = market_mtime(path)
+    if mtime is None:
+        return None
+    with _lock:
+        hit = _markets.get(path)
+        if hit is None or hit[0] != mtime:
+            hit = (mtime, MarketAggregates.open(path))
+            _markets[path] = hit
+        return hit[1]
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("sources", nargs="+", help="JSON de anúncios ou diretórios de snapshot")
+    ap.add_argument("--out", required=True, help="diretório dos agregados (recalculados das fontes, substituídos)")
+    ap.add_argument("--resolutions", default="7,6,5,4", help="resoluções H3, separadas por vírgula")
+    ap.add_argument("--rel-accuracy", type=float, default=0.02, help="erro relativo máximo dos quantis")
+    args = ap.parse_args()
+    # sempre das fontes: somar ao --out existente contaria de novo o que já estava lá
+    agg = MarketAggregates([int(r) for r in args.resolutions.split(",") if r.strip()], args.rel_accuracy)
+    for src in args.sources:
+        table = CompTable.open(src) if os.path.isdir(src) else CompStore.from_json(src).table
+        n = agg.add_table(table)
+        print(f"{src}: {n} de {len(table)} anúncios agregados")
+    agg.save(args.out)
+    print(json.dumps({"out": args.out, "listings": len(agg), **agg.params()}, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Modelo hedônico treinado (scikit-learn): regressão por quantis do R$/m²
+(p25/p50/p75, em log) com HistGradientBoostingRegressor, um conjunto de
+modelos para aluguel e outro para venda. Atributos: áreas, posição, idade
+do anúncio, tipo e os industriais (pé-direito, energia, docas; nos anúncios
+vêm de `extras`: "ceiling", "kva", "docks"). Ausentes ficam NaN (o modelo
+trata). Treinado offline sobre o CompStore e gravado com joblib sem
+compressão: `load_model` abre com mmap, e processos que abrem o mesmo
+arquivo dividem as páginas dos arrays. `predict_batch` prevê N imóveis
+numa chamada por modelo.
+
+Uso:
+  python -m app.model.regression data/snapshot --out data/hedonic_model.joblib
+"""
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from datetime import datetime
+import argparse, json, math, os, threading, time
+import numpy as np
+import joblib
+from sklearn.ensemble import HistGradientBoostingRegressor
+from app.comps.store import load_store
+from app.comps.table import CompTable
+from app.comps.record import industrial, to_float
+from app.model.hedonic import ppm2_columns, months_since_dates, QUANTILES
+
+MODEL_VERSION = 1
+FEATURES = ("built_area_m2", "land_area_m2", "lat", "lon", "months", "property_type",
+            "ceiling_height_m", "energy_capacity_kva", "dock_doors")
+KINDS = ("rental", "sale")
+
+class HedonicRegressor:
+    """
+    Quantis de R$/m² por finalidade a partir de FEATURES. `types` é o
+    vocabulário de property_type (código = posição; desconhecido = NaN).
+    """
+
+    def __init__(self, quantiles: Sequence[float] = QUANTILES, max_iter: int = 200,
+                 learning_rate: float = 0.1, min_samples_leaf: int = 20, random_state: int = 0):
+        self.quantiles = tuple(quantiles)
+        self.params = {"max_iter": max_iter, "learning_rate": learning_rate,
+                       "min_samples_leaf": min_samples_leaf, "random_state": random_state}
+        self.types: List[str] = []
+        self.models: Dict[str, List[HistGradientBoostingRegressor]] = {}
+        self.info: Dict[str, Any] = {}
+
+    def _type_codes(self, names: Sequence[Optional[str]]) -> np.ndarray:
+        codes = {t: i for i, t in enumerate(self.types)}
+        return np.array([codes.get(n, math.nan) if n is not None else math.nan for n in names], dtype=float)
+
+    def table_features(self, table: CompTable, now: Optional[datetime] = None) -> np.ndarray:
+        # FEATURES dos anúncios da tabela [n, len(FEATURES)]
+        n = len(table)
+        X = np.full((n, len(FEATURES)), math.nan)
+        for j, f in enumerate(FEATURES[:4]):
+            X[:, j] = np.asarray(table[f], dtype=float)
+        X[:, 4] = months_since_dates(table["posted_at"], now)
+        vocab = table.vocab.get("property_type", [])
+        codes = np.asarray(table["property_type"])
+        X[:, 5] = np.append(self._type_codes(vocab), math.nan)[codes]
+        # atributos industriais só existem nos registros completos
+        X[:, 6:] = np.array([industrial(table.record(i)) for i in range(n)], dtype=float).reshape(n, 3)
+        return X
+
+    def features(self, subjects: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """
+        FEATURES de imóveis a avaliar (dicts no formato de PropertyInput, com
+        "lat"/"lon" já geocodificados): anúncio de hoje (idade 0).
+        """
+        X = np.full((len(subjects), len(FEATURES)), math.nan)
+        for i, s in enumerate(subjects):
+            X[i, :4] = [to_float(s.get(f)) for f in FEATURES[:4]]
+            X[i, 4] = 0.0
+            X[i, 6:] = industrial(s)
+        X[:, 5] = self._type_codes([s.get("property_type") for s in subjects])
+        return X
+
+    def fit(self, table: CompTable, now: Optional[datetime] = None, min_rows: int = 200,
+            max_rows: Optional[int] = 500_000, seed: int = 0) -> "HedonicRegressor":
+        """
+        Treina os modelos de cada finalidade com pelo menos `min_rows` anúncios
+        com preço (até `max_rows`, amostrados). Finalidade sem dados suficientes
+        fica sem modelo (predict_batch devolve NaN).
+        """
+        self.types = list(table.vocab.get("property_type", []))
+        ppm2 = ppm2_columns(np.asarray(table["price_per_m2"]), np.asarray(table["price_total"]),
+                            np.asarray(table["built_area_m2"]))
+        rental = np.asarray(table["is_rental"])
+        rng = np.random.default_rng(seed)
+        X_all = self.table_features(table, now)
+        cat = np.array([f == "property_type" for f in FEATURES])
+        self.models, counts = {}, {}
+        for kind, flag in zip(KINDS, (1, 0)):
+            rows = np.flatnonzero((rental == flag) & (ppm2 > 0))
+            if max_rows and len(rows) > max_rows:
+                rows = np.sort(rng.choice(rows, max_rows, replace=False))
+            counts[kind] = int(len(rows))
+            if len(rows) < min_rows:
+                continue
+            X, y = X_all[rows], np.log(ppm2[rows])
+            self.models[kind] = [
+                HistGradientBoostingRegressor(loss="quantile", quantile=q, categorical_features=cat,
+                                              **self.params).fit(X, y)
+                for q in self.quantiles]
+        self.info = {"version": MODEL_VERSION, "trained_at": (now or datetime.now()).isoformat(timespec="seconds"),
+                     "rows": counts, "features": list(FEATURES), "source": table.path}
+        return self
+
+    def predict_batch(self, X: np.ndarray, kind: str) -> np.ndarray:
+        """
+        Quantis de R$/m² [n, len(quantiles)] para as linhas de X (FEATURES),
+        em ordem crescente por linha; NaN se a finalidade não tem modelo.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        models = self.models.get(kind)
+        if not models:
+            return np.full((len(X), len(self.quantiles)), math.nan)
+        # quantis estimados em separado podem se cruzar: ordena por linha
+        return np.sort(np.exp(np.column_stack([m.predict(X) for m in models])), axis=1)
+
+    def save(self, path: str) -> str:
+        # sem compressão: os arrays dos modelos ficam abríveis com mmap
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}"
+        joblib.dump(self, tmp)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "HedonicRegressor":
+        model = joblib.load(path, mmap_mode="r" if mmap else None)
+        if not isinstance(model, cls) or model.info.get("version") != MODEL_VERSION:
+            raise ValueError(f"Modelo {path}: formato não suportado")
+        return model
+
+_models: Dict[str, Tuple[float, HedonicRegressor]] = {}
+_lock = threading.Lock()
+
+def model_mtime(path: str) -> Optional[float]:
+    # versão do arquivo do modelo (None se não existe)
+    path = os.path.abspath(path)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+def load_model(path: str) -> Optional[HedonicRegressor]:
+    """
+    Modelo do arquivo (mmap), carregado uma vez por processo e recarregado só
+    se o arquivo mudar (mtime); None se não existe.
+    """
+    path = os.path.abspath(path)
+    mtime = model_mtime(path)
+    if mtime is None:
+        return None
+    with _lock:
+        hit = _models.get(path)
+        if hit is None or hit[0] != mtime:
+            hit = (mtime, HedonicRegressor.load(path))
+            _models[path] = hit
+        return hit[1]
+
+def _holdout_report(table: CompTable, test_share: float = 0.2, seed: int = 0) -> Dict[str, Any]:
+    # treino em 80% e, nos 20% restantes: cobertura p25–p75 e erro relativo do p50
+    rng = np.random.default_rng(seed)
+    test = rng.random(len(table)) < test_share
+    model = HedonicRegressor().fit(table.subset(np.flatnonzero(~test)))
+    held = table.subset(np.flatnonzero(test))
+    X = model.table_features(held)
+    ppm2 = ppm2_columns(np.asarray(held["price_per_m2"]), np.asarray(held["price_total"]),
+                        np.asarray(held["built_area_m2"]))
+    out = {}
+    for kind, flag in zip(KINDS, (1, 0)):
+        rows = np.flatnonzero((np.asarray(held["is_rental"]) == flag) & (ppm2 > 0))
+        if kind not in model.models or not len(rows):
+            continue
+        q = model.predict_batch(X[rows], kind)
+        y = ppm2[rows]
+        out[kind] = {"n": int(len(rows)),
+                     "coverage_p25_p75": float(np.mean((y >= q[:, 0]) & (y <= q[:, -1]))),
+                     "median_abs_pct_error_p50": float(np.median(np.abs(q[:, 1] / y - 1.0)))}
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("store", help="JSON de anúncios ou diretório de snapshot")
+    ap.add_argument("--out", required=True, help="arquivo .joblib do modelo")
+    ap.add_argument("--max-iter", type=int, default=200)
+    ap.add_argument("--max-rows", type=int, default=500_000, help="anúncios por finalidade (amostra)")
+    ap.add_argument("--holdout", action="store_true", help="mede cobertura/erro em 20%% separados antes de treinar")
+    args = ap.parse_args()
+    table = load_store(args.store).table
+    if args.holdout:
+        print(json.dumps({"holdout": _holdout_report(table)}, indent=2))
+    t0 = time.perf_counter()
+    model = HedonicRegressor(max_iter=args.max_iter).fit(table, max_rows=args.max_rows)
+    model.save(args.out)
+    print(json.dumps({"out": args.out, **model.info, "seconds": round(time.perf_counter() - t0, 1)},
+                     ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import numpy as np
 from app.schemas import PropertyInput
 from app.config import AppConfig
 from app.geo.geocode import geocode
-from app.comps.aggregator import get_comps
-from app.utils.filters import filter_comps
-from app.model.hedonic import estimate_from_comps
-from app.vision.features import photos_score
+from app.comps.aggregator import fetch_frame, afetch_frame
+from app.comps.table import CompFrame
+from app.comps.similarity import SimilarityIndex
+from app.utils.filters import filter_mask
+from app.model.hedonic import estimate_from_frame
+from app.model.market import load_market
+from app.model.regression import load_model, KINDS
+from app.vision.features import photos_score, photo_sources
+from app.utils.concurrency import cpu_pool
+from app.utils import metrics
 from datetime import datetime
 
 def _adjust_by_image(ppm2: float, img_score: float) -> float:
@@ -13,56 +21,169 @@ def _adjust_by_image(ppm2: float, img_score: float) -> float:
     factor = (img_score - 0.5) * 0.10
     return ppm2 * (1.0 + factor)
 
-def assess(payload: Dict[str, Any]) -> Dict[str, Any]:
-    cfg = AppConfig()
-    subject = PropertyInput(**payload)
-    # Geocodificação (simplificada)
-    latlon = geocode(subject.address, subject.city, subject.state, subject.country)
-    lat, lon = (latlon if latlon else (None, None))
+def _expand_radius(comps: CompFrame, cfg: AppConfig) -> Tuple[CompFrame, float, List[float]]:
+    """
+    Amplia o raio em passos de 5 km (de default_radius_km até max_radius_km) até
+    haver min_comps. `comps` vem de uma única busca no raio máximo, ordenada por
+    distância (sem distância no fim): cada passo é só um corte no frame.
+    Retorna (comps_no_raio, raio_final, raios_tentados).
+    """
+    n_dist = int(np.count_nonzero(~np.isnan(comps.distance_km)))
+    dists = comps.distance_km[:n_dist]
+    n_nodist = len(comps) - n_dist
 
-    # Fotografia -> score
-    photo_paths = [p.path for p in (subject.photos or []) if p.path]
-    img_score = photos_score(photo_paths)
+    def _count(r: float) -> int:
+        return int(np.searchsorted(dists, r, side="right")) + n_nodist
+
+    radius = cfg.default_radius_km
+    tried = [radius]
+    while _count(radius) < cfg.min_comps and radius < cfg.max_radius_km:
+        radius = min(radius + 5.0, cfg.max_radius_km)
+        tried.append(radius)
+    k = int(np.searchsorted(dists, radius, side="right"))
+    return comps.take(np.r_[0:k, n_dist:len(comps)]), radius, tried
 
-    # Consulta de comparáveis (conectores) — início com raio padrão
-    query = {
+def _query(subject: PropertyInput) -> Dict[str, Any]:
+    return {
         "city": subject.city,
         "state": subject.state,
         "country": subject.country,
         "property_type": subject.property_type,
     }
-    comps_all = get_comps(query, lat, lon, cfg.default_radius_km)
 
+def _area_band(subject: PropertyInput) -> Tuple[float, float]:
     # Filtros básicos por área (~0.5x a 2.0x do assunto)
-    min_built = subject.built_area_m2 * 0.5
-    max_built = subject.built_area_m2 * 2.0
-    comps_all = filter_comps(comps_all, property_type=subject.property_type, min_built=min_built, max_built=max_built)
+    return subject.built_area_m2 * 0.5, subject.built_area_m2 * 2.0
 
-    # Se insuficiente, ampliar raio
-    radius = cfg.default_radius_km
-    while len(comps_all) < cfg.min_comps and radius < cfg.max_radius_km:
-        radius = min(radius + 5.0, cfg.max_radius_km)
-        comps_all = get_comps(query, lat, lon, radius)
-        comps_all = filter_comps(comps_all, property_type=subject.property_type, min_built=min_built, max_built=max_built)
+def _similar(cfg: AppConfig, subject: PropertyInput, lat: Optional[float],
+             lon: Optional[float]) -> Optional[Dict[str, Any]]:
+    # pedido de seleção por semelhança aos conectores (None = busca por raio)
+    if cfg.comp_selection != "knn":
+        return None
+    subj = dict(subject.model_dump(exclude={"photos"}), lat=lat, lon=lon)
+    return {"subject": subj, "k": cfg.knn_k, "scales": cfg.knn_scales or None}
+
+def _select(subject: PropertyInput, lat: Optional[float], lon: Optional[float],
+            candidates: CompFrame, cfg: AppConfig) -> Tuple[CompFrame, float, List[float]]:
+    """
+    Comps da estimativa, ordenados por distância (sem distância no fim). Com
+    comp_selection="knn", os knn_k mais parecidos de cada finalidade entre os
+    candidatos (que cada conector já mandou pelos seus índices) e raio = do
+    mais distante; no padrão, faixa de área e raio ampliado até min_comps.
+    Retorna (comps, raio, raios_tentados).
+    """
+    if cfg.comp_selection == "knn":
+        with metrics.span("select"):
+            subj = dict(subject.model_dump(exclude={"photos"}), lat=lat, lon=lon)
+            comps = SimilarityIndex(candidates, cfg.knn_scales or None).select(subj, cfg.knn_k)
+            # empates de distância na ordem das linhas de origem (como o lote)
+            comps = comps.take(np.lexsort((comps.row, comps.part)))
+            comps = comps.take(comps.distance_order())
+            dist = comps.distance_km[~np.isnan(comps.distance_km)]
+            radius = float(dist.max()) if len(dist) else 0.0
+        return comps, radius, [radius]
+    with metrics.span("filter"):
+        candidates = candidates.take(candidates.distance_order())
+        min_built, max_built = _area_band(subject)
+        keep = filter_mask(candidates, property_type=subject.property_type, min_built=min_built, max_built=max_built)
+        candidates = candidates.take(np.flatnonzero(keep))
+    # Se insuficiente, ampliar raio (cortes sobre os candidatos, sem nova busca)
+    with metrics.span("radius_expansion"):
+        return _expand_radius(candidates, cfg)
 
-    # Divide em aluguel vs venda
-    comps_rental = [c for c in comps_all if c.get("is_rental") is True]
-    comps_sale   = [c for c in comps_all if c.get("is_rental") is False]
+def _bootstrap(cfg: AppConfig) -> Optional[Dict[str, Any]]:
+    # parâmetros de `bootstrap_bands` (None = sem bandas de confiança)
+    if not cfg.uncertainty:
+        return None
+    return {"resamples": cfg.bootstrap_resamples, "level": cfg.bootstrap_level, "seed": cfg.bootstrap_seed}
 
-    subj_dict = subject.model_dump()
-    subj_dict.update({"lat": lat, "lon": lon})
+def _confidence(ranges: Dict[str, Any], img_score: float, built: float) -> Optional[Dict[str, Any]]:
+    # intervalos [inf, sup] de cada faixa, com o mesmo ajuste por fotos
+    bands = ranges.get("bands")
+    if not bands:
+        return None
+    out = {}
+    for key, name in (("low", "low"), ("p50", "target"), ("high", "high")):
+        lo, hi = (_adjust_by_image(x, img_score) for x in bands[key])
+        out[f"per_m2_{name}"] = [lo, hi]
+        out[f"total_{name}"] = [lo * built, hi * built]
+    return out
 
-    # Avalia aluguel
-    rent_ranges, comps_r_w = estimate_from_comps(
-        subj_dict, comps_rental,
-        cfg.alpha_distance, cfg.alpha_recency, cfg.alpha_area_diff
-    )
+def _with_uncertainty(cfg: AppConfig, uncertainty: Optional[bool]) -> AppConfig:
+    if uncertainty is not None:
+        cfg.uncertainty = uncertainty
+    return cfg
 
-    # Avalia venda
-    sale_ranges, comps_s_w = estimate_from_comps(
-        subj_dict, comps_sale,
-        cfg.alpha_distance, cfg.alpha_recency, cfg.alpha_area_diff
-    )
+def _market_priors(cfg: AppConfig, subject: PropertyInput, lat: Optional[float], lon: Optional[float],
+                   counts: Dict[str, Optional[int]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Para "rental"/"sale" com menos de min_comps comps (contagem conhecida), a
+    faixa dos agregados de mercado na célula H3 do imóvel (ver
+    app/model/market.py), com `weight`: peso dela na combinação, 1 - n/min_comps.
+    """
+    short = {k: n for k, n in counts.items() if n is not None and n < cfg.min_comps}
+    if not short or lat is None or lon is None or not cfg.market_path:
+        return {}
+    market = load_market(cfg.market_path)
+    if market is None:
+        return {}
+    out = {}
+    for key, n in short.items():
+        prior = market.estimate(lat, lon, subject.property_type, key == "rental",
+                                cfg.market_months, cfg.min_comps)
+        if prior:
+            prior["weight"] = 1.0 - n / cfg.min_comps
+            out[key] = prior
+    return out
+
+def _blend(ranges: Dict[str, Any], other: Dict[str, Any], w: float) -> Dict[str, Any]:
+    # (1 - w)·faixa + w·outra; bandas de confiança (dos comps) seguem a mesma conta
+    out = {q: (1.0 - w) * ranges[q] + w * other[q] for q in ("low", "p50", "high")}
+    out["n"] = ranges.get("n")
+    if ranges.get("bands"):
+        out["bands"] = {q: [(1.0 - w) * x + w * other[q] for x in ranges["bands"][q]] for q in ("low", "p50", "high")}
+    return out
+
+def _model_ranges(cfg: AppConfig, subjects: List[PropertyInput],
+                  coords: List[Optional[Tuple[float, float]]]) -> List[Dict[str, Dict[str, float]]]:
+    """
+    Faixas do modelo hedônico treinado (ver app/model/regression.py) para cada
+    imóvel, {"rental": {...}, "sale": {...}}, numa chamada por modelo para
+    todos; dict vazio sem modelo (ou sem modelo para a finalidade).
+    """
+    model = load_model(cfg.model_path) if cfg.model_path else None
+    if model is None or not subjects:
+        return [{} for _ in subjects]
+    rows = [dict(s.model_dump(exclude={"photos"}), lat=c[0] if c else None, lon=c[1] if c else None)
+            for s, c in zip(subjects, coords)]
+    X = model.features(rows)
+    preds = {kind: model.predict_batch(X, kind).tolist() for kind in KINDS}
+    out = []
+    for i in range(len(subjects)):
+        out.append({kind: dict(zip(("low", "p50", "high"), q[i])) for kind, q in preds.items()
+                    if not np.isnan(q[i][1])})
+    return out
+
+def _build_result(subject: PropertyInput, lat: Optional[float], lon: Optional[float], img_score: float,
+                  rent_ranges: Dict[str, float], sale_ranges: Dict[str, float],
+                  comps_used: List[Dict[str, Any]], cfg: AppConfig,
+                  radius: float, radii_tried: List[float],
+                  sources: Optional[Dict[str, List[str]]] = None,
+                  model: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[str, Any]:
+    min_built, max_built = _area_band(subject)
+    ranges = {"rental": rent_ranges, "sale": sale_ranges}
+
+    # Poucos comps: faixa puxada para a do mercado local (agregados H3)
+    market = _market_priors(cfg, subject, lat, lon, {k: r.get("n") for k, r in ranges.items()})
+    for key, prior in market.items():
+        ranges[key] = _blend(ranges[key], prior, prior["weight"])
+    # Modelo treinado (`model`, de _model_ranges): combinado com os comps, ou sozinho sem comps nem mercado
+    model_weights = {}
+    for key, pred in (model or {}).items():
+        alone = ranges[key].get("n") == 0 and key not in market
+        model_weights[key] = 1.0 if alone else cfg.model_weight
+        ranges[key] = _blend(ranges[key], pred, model_weights[key])
+    rent_ranges, sale_ranges = ranges["rental"], ranges["sale"]
 
     # Ajuste por qualidade de fotos (leve)
     rent_low, rent_p50, rent_high = [_adjust_by_image(x, img_score) for x in (rent_ranges["low"], rent_ranges["p50"], rent_ranges["high"])]
@@ -77,7 +198,7 @@ def assess(payload: Dict[str, Any]) -> Dict[str, Any]:
             "lat": lat, "lon": lon
         },
         "image_quality_score": img_score,
-        "comps_used": (comps_r_w + comps_s_w),
+        "comps_used": comps_used,
         "rental": {
             "per_m2_low": rent_low,
             "per_m2_target": rent_p50,
@@ -102,13 +223,166 @@ def assess(payload: Dict[str, Any]) -> Dict[str, Any]:
             },
             "filters": {
                 "radius_km": radius,
+                "radii_tried": radii_tried,
                 "min_built": min_built,
                 "max_built": max_built,
+            } if cfg.comp_selection != "knn" else {
+                "selection": "knn",
+                "k": cfg.knn_k,
+                "radius_km": radius,
+                "radii_tried": radii_tried,
             },
+            "sources": sources or {},
             "notes": [
                 "Faixas baseadas em quantis ponderados (25/50/75%).",
                 "Ajuste leve por qualidade das fotos (±5% máx.).",
             ]
         }
     }
+    for key, ranges in (("rental", rent_ranges), ("sale", sale_ranges)):
+        conf = _confidence(ranges, img_score, built)
+        if conf:
+            result[key]["confidence"] = conf
+    if cfg.comp_selection == "knn":
+        result["explainability"]["notes"].append(
+            f"Comps escolhidos por semelhança: os {cfg.knn_k} mais parecidos de cada finalidade "
+            "(posição, áreas, atributos industriais, data).")
+    if cfg.uncertainty:
+        result["explainability"]["bootstrap"] = {"resamples": cfg.bootstrap_resamples,
+                                                 "level": cfg.bootstrap_level, "seed": cfg.bootstrap_seed}
+        result["explainability"]["notes"].append(
+            f"Bandas de confiança ({cfg.bootstrap_level:.0%}) por bootstrap ponderado dos comps.")
+    if market:
+        result["explainability"]["market"] = market
+        for key, prior in market.items():
+            result["explainability"]["notes"].append(
+                f"Poucos comps de {'aluguel' if key == 'rental' else 'venda'}: faixa combinada ({prior['weight']:.0%}) "
+                f"com o mercado da célula H3 {prior['cell']} ({prior['n']} anúncios, {prior['months']} meses).")
+    if model_weights:
+        result["explainability"]["model"] = {key: dict(model[key], weight=w) for key, w in model_weights.items()}
+        result["explainability"]["notes"].append(
+            "Faixas combinadas com o modelo hedônico treinado (peso "
+            + ", ".join(f"{'aluguel' if k == 'rental' else 'venda'} {w:.0%}" for k, w in model_weights.items()) + ").")
+    unavailable = [n for k in ("timed_out", "failed", "skipped") for n in (sources or {}).get(k, [])]
+    if unavailable:
+        result["explainability"]["notes"].append(f"Resultado parcial: fontes indisponíveis ({', '.join(unavailable)}).")
     return result
+
+def _estimate_stage(subject: PropertyInput, lat: Optional[float], lon: Optional[float],
+                    candidates: CompFrame, cfg: AppConfig):
+    """
+    Do frame de candidatos às faixas: seleciona os comps (`_select`) e estima
+    aluguel/venda. Função de módulo para poder rodar num pool de processos.
+    Retorna (faixas_aluguel, faixas_venda, comps_usados, raio, raios_tentados).
+    """
+    comps_all, radius, radii_tried = _select(subject, lat, lon, candidates, cfg)
+
+    with metrics.span("estimate"):
+        # Divide em aluguel vs venda
+        kind = comps_all.column("is_rental")
+        comps_rental = comps_all.take(np.flatnonzero(kind == 1))
+        comps_sale   = comps_all.take(np.flatnonzero(kind == 0))
+
+        subj_dict = subject.model_dump()
+        subj_dict.update({"lat": lat, "lon": lon})
+
+        # Avalia aluguel
+        rent_ranges, comps_r_w = estimate_from_frame(
+            subj_dict, comps_rental,
+            cfg.alpha_distance, cfg.alpha_recency, cfg.alpha_area_diff, _bootstrap(cfg)
+        )
+
+        # Avalia venda
+        sale_ranges, comps_s_w = estimate_from_frame(
+            subj_dict, comps_sale,
+            cfg.alpha_distance, cfg.alpha_recency, cfg.alpha_area_diff, _bootstrap(cfg)
+        )
+    return rent_ranges, sale_ranges, comps_r_w + comps_s_w, radius, radii_tried
+
+def _estimate_stage_timed(*args):
+    # para o pool de processos: devolve também os tempos medidos lá dentro
+    with metrics.collect_timings() as t:
+        stage = _estimate_stage(*args)
+    return stage, t
+
+def _observe(candidates: CompFrame, radii_tried: List[float]) -> None:
+    metrics.COMPS_RETRIEVED.observe(len(candidates))
+    metrics.RADIUS_EXPANSIONS.inc(len(radii_tried) - 1)
+
+def assess(payload: Dict[str, Any], uncertainty: Optional[bool] = None,
+           image_score: Optional[float] = None) -> Dict[str, Any]:
+    # uncertainty: liga/desliga as bandas de confiança (None = AppConfig.uncertainty);
+    # image_score: score das fotos já calculado por quem chama (as do payload são ignoradas)
+    cfg = _with_uncertainty(AppConfig(), uncertainty)
+    subject = PropertyInput(**payload)
+    # Geocodificação (simplificada)
+    with metrics.span("geocode"):
+        latlon = geocode(subject.address, subject.city, subject.state, subject.country)
+    lat, lon = (latlon if latlon else (None, None))
+
+    # Fotografia -> score
+    if image_score is None:
+        photo_paths, photo_urls = photo_sources(subject.photos)
+        with metrics.span("photos"):
+            img_score = photos_score(photo_paths, urls=photo_urls)
+    else:
+        img_score = image_score
+
+    # Consulta de comparáveis (conectores): uma única busca no raio máximo
+    with metrics.span("comps_fetch"):
+        candidates, sources = fetch_frame(_query(subject), lat, lon, cfg.max_radius_km, cfg=cfg,
+                                          similar=_similar(cfg, subject, lat, lon))
+
+    rent_ranges, sale_ranges, comps_used, radius, radii_tried = _estimate_stage(subject, lat, lon, candidates, cfg)
+    with metrics.span("model"):
+        model = _model_ranges(cfg, [subject], [latlon])[0]
+    _observe(candidates, radii_tried)
+    return _build_result(subject, lat, lon, img_score, rent_ranges, sale_ranges,
+                         comps_used, cfg, radius, radii_tried, sources, model)
+
+async def assess_async(payload: Dict[str, Any], uncertainty: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Mesmo resultado de `assess`, sem bloquear o event loop: conectores são
+    aguardados em paralelo com o scoring das fotos, e as etapas CPU-bound
+    (fotos, estimativa com muitos comps) vão para o pool de processos.
+    """
+    cfg = _with_uncertainty(AppConfig(), uncertainty)
+    subject = PropertyInput(**payload)
+    with metrics.span("geocode"):
+        latlon = geocode(subject.address, subject.city, subject.state, subject.country)
+    lat, lon = (latlon if latlon else (None, None))
+
+    pool = cpu_pool(cfg.cpu_workers)
+    photo_paths, photo_urls = photo_sources(subject.photos)
+
+    async def _photos() -> float:
+        with metrics.span("photos"):
+            if not photo_paths and not photo_urls:
+                return photos_score([])
+            # downloads/hash/cache numa thread; fotos faltantes calculadas no pool de processos
+            return await asyncio.to_thread(photos_score, photo_paths, pool, photo_urls)
+
+    async def _fetch():
+        with metrics.span("comps_fetch"):
+            return await afetch_frame(_query(subject), lat, lon, cfg.max_radius_km, cfg=cfg,
+                                      similar=_similar(cfg, subject, lat, lon))
+
+    async def _model():
+        with metrics.span("model"):
+            return (await asyncio.to_thread(_model_ranges, cfg, [subject], [latlon]))[0]
+
+    (candidates, sources), img_score, model = await asyncio.gather(_fetch(), _photos(), _model())
+
+    # com bandas de confiança o bootstrap já pesa mais que a ida ao pool
+    if len(candidates) >= cfg.cpu_offload_min_comps or (cfg.uncertainty and len(candidates)):
+        loop = asyncio.get_running_loop()
+        # o frame vai compacto: só as linhas candidatas, copiadas (inclusive de snapshots)
+        stage, timings = await loop.run_in_executor(pool, _estimate_stage_timed, subject, lat, lon,
+                                                    candidates.compact(), cfg)
+        metrics.merge_timings(timings)
+    else:
+        stage = _estimate_stage(subject, lat, lon, candidates, cfg)
+    rent_ranges, sale_ranges, comps_used, radius, radii_tried = stage
+    _observe(candidates, radii_tried)
+    return _build_result(subject, lat, lon, img_score, rent_ranges, sale_ranges,
+                         comps_used, cfg, radius, radii_tried, sources, model)
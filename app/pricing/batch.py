@@ -0,0 +1,282 @@
+from typing import Dict, Any, List, Optional, Tuple
+import math
+import numpy as np
+from pydantic import ValidationError
+from sklearn.neighbors import BallTree
+from app.schemas import PropertyInput
+from app.config import AppConfig
+from app.geo.geocode import geocode, haversine_km_vec
+from app.comps.aggregator import fetch_frame
+from app.comps.table import CompFrame
+from app.comps.store import EARTH_RADIUS_KM
+from app.comps.similarity import SimilarityIndex
+from app.model.hedonic import frame_arrays, comp_weights, grouped_weighted_quantiles, bootstrap_bands, QUANTILES
+from app.vision.features import photos_score_many, photo_sources
+from app.pricing.assessor import _query, _area_band, _build_result, _bootstrap, _with_uncertainty, _model_ranges
+from app.utils import metrics
+
+# pares assunto×comp por bloco (limita a memória dentro de um grupo)
+MAX_PAIRS = 2_000_000
+
+class _Pool:
+    """
+    Comps de um grupo (mesma consulta aos conectores) em colunas NumPy, com um
+    BallTree haversine sobre os que têm coordenadas.
+    """
+
+    def __init__(self, comps: CompFrame, property_type: Optional[str]):
+        self.comps = comps
+        n = len(comps)
+        self.lat = comps.column("lat")
+        self.lon = comps.column("lon")
+        self.area = comps.column("built_area_m2")
+        kept, cols = frame_arrays(comps)
+        self.ppm2 = np.full(n, np.nan)
+        self.ppm2[kept] = cols["ppm2"]
+        self.months = np.ones(n)
+        self.months[kept] = cols["months"]
+        rental = comps.column("is_rental")
+        self.kind = np.where(rental == 1, 0, np.where(rental == 0, 1, -1)).astype(np.int8)
+        # mesmo critério de filter_comps: tipo igual e área conhecida
+        ok = ~np.isnan(self.area)
+        if property_type:
+            ok &= comps.category_mask("property_type", property_type)
+        geo = ~(np.isnan(self.lat) | np.isnan(self.lon))
+        self.type_idx = np.flatnonzero(comps.category_mask("property_type", property_type)) \
+            if property_type else np.arange(n)
+        self._similar: Optional[SimilarityIndex] = None
+        self.all_idx = np.flatnonzero(ok)
+        self.geo_idx = np.flatnonzero(ok & geo)
+        self.nogeo_idx = np.flatnonzero(ok & ~geo)
+        self.tree = None
+        if len(self.geo_idx):
+            pts = np.radians(np.column_stack([self.lat[self.geo_idx], self.lon[self.geo_idx]]))
+            self.tree = BallTree(pts, metric="haversine")
+
+    def similarity(self, scales: Optional[Dict[str, float]]) -> SimilarityIndex:
+        # índice de semelhança dos comps do tipo (posições em type_idx), no primeiro uso
+        if self._similar is None:
+            self._similar = SimilarityIndex(self.comps.take(self.type_idx), scales)
+        return self._similar
+
+    def similar_pairs(self, subjects: List[Dict[str, Any]], lat: np.ndarray, lon: np.ndarray,
+                      k: int, scales: Optional[Dict[str, float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # pares (assunto, comp, distância_km) com os k mais parecidos de cada finalidade
+        sel = self.similarity(scales).select_many(subjects, k)
+        s_id = np.repeat(np.arange(len(subjects)), [len(p) for p, _ in sel])
+        c_id = self.type_idx[np.concatenate([p for p, _ in sel]).astype(np.intp)]
+        return s_id, c_id, haversine_km_vec(lat[s_id], lon[s_id], self.lat[c_id], self.lon[c_id])
+
+    def pair_counts(self, lat: np.ndarray, lon: np.ndarray, radius_km: float) -> np.ndarray:
+        # nº de pares candidatos por assunto, sem materializá-los
+        has_geo = ~(np.isnan(lat) | np.isnan(lon))
+        counts = np.where(has_geo, len(self.nogeo_idx), len(self.all_idx))
+        geo_s = np.flatnonzero(has_geo)
+        if len(geo_s) and self.tree is not None:
+            q = np.radians(np.column_stack([lat[geo_s], lon[geo_s]]))
+            counts[geo_s] += self.tree.query_radius(q, r=radius_km / EARTH_RADIUS_KM, count_only=True)
+        return counts
+
+    def pairs(self, lat: np.ndarray, lon: np.ndarray, radius_km: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pares (assunto, comp, distância_km) candidatos: comps no raio do assunto
+        e comps sem coordenadas (distância NaN). Assunto sem coordenadas recebe
+        todos os comps, sem distância, como em get_comps.
+        """
+        s_parts, c_parts, d_parts = [], [], []
+        has_geo = ~(np.isnan(lat) | np.isnan(lon))
+        geo_s = np.flatnonzero(has_geo)
+        if len(geo_s) and self.tree is not None:
+            q = np.radians(np.column_stack([lat[geo_s], lon[geo_s]]))
+            ind, dist = self.tree.query_radius(q, r=radius_km / EARTH_RADIUS_KM, return_distance=True)
+            lens = np.fromiter((len(x) for x in ind), dtype=np.intp, count=len(ind))
+            s_parts.append(np.repeat(geo_s, lens))
+            c_parts.append(self.geo_idx[np.concatenate(ind).astype(np.intp)] if lens.sum() else np.empty(0, np.intp))
+            d_parts.append(np.concatenate(dist) * EARTH_RADIUS_KM if lens.sum() else np.empty(0))
+        if len(geo_s) and len(self.nogeo_idx):
+            s_parts.append(np.repeat(geo_s, len(self.nogeo_idx)))
+            c_parts.append(np.tile(self.nogeo_idx, len(geo_s)))
+            d_parts.append(np.full(len(geo_s) * len(self.nogeo_idx), np.nan))
+        nogeo_s = np.flatnonzero(~has_geo)
+        if len(nogeo_s) and len(self.all_idx):
+            s_parts.append(np.repeat(nogeo_s, len(self.all_idx)))
+            c_parts.append(np.tile(self.all_idx, len(nogeo_s)))
+            d_parts.append(np.full(len(nogeo_s) * len(self.all_idx), np.nan))
+        if not s_parts:
+            return np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0)
+        return np.concatenate(s_parts), np.concatenate(c_parts), np.concatenate(d_parts)
+
+def _radii(cfg: AppConfig) -> List[float]:
+    # mesma sequência de _expand_radius: passos de 5 km até o raio máximo
+    radius = cfg.default_radius_km
+    seq = [radius]
+    while radius < cfg.max_radius_km:
+        radius = min(radius + 5.0, cfg.max_radius_km)
+        seq.append(radius)
+    return seq
+
+def _band_pairs(pool: _Pool, lat: np.ndarray, lon: np.ndarray, bands: np.ndarray, cfg: AppConfig
+                ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, List[List[float]]]:
+    """
+    Pares (assunto, comp, distância) na faixa de área de cada assunto, no
+    menor raio da sequência de _expand_radius com min_comps. Retorna também
+    o raio final e os raios tentados por assunto.
+    """
+    S = len(lat)
+    # raio por assunto: passos de 5 km só para quem ainda não tem min_comps
+    # candidatos (na faixa de área); mercados densos param no raio padrão
+    radii = _radii(cfg)
+    has_geo = ~(np.isnan(lat) | np.isnan(lon))
+    radius = np.empty(S)
+    k = np.empty(S, dtype=np.intp)
+    parts = []
+    pending = np.arange(S)
+    for step, r in enumerate(radii):
+        s_id, c_id, dist = pool.pairs(lat[pending], lon[pending], r)
+        s_id = pending[s_id]
+        a = pool.area[c_id]
+        keep = (a >= bands[s_id, 0]) & (a <= bands[s_id, 1])
+        s_id, c_id, dist = s_id[keep], c_id[keep], dist[keep]
+        enough = np.bincount(s_id, minlength=S)[pending] >= cfg.min_comps
+        # sem coordenadas o raio não muda nada: decide já (como o laço de assess)
+        last = (step == len(radii) - 1) | ~has_geo[pending]
+        done = enough | last
+        k[pending[done]] = np.where(enough[done], step, len(radii) - 1)
+        radius[pending[done]] = np.asarray(radii)[k[pending[done]]]
+        fin = np.zeros(S, dtype=bool)
+        fin[pending[done]] = True
+        keep = fin[s_id]
+        parts.append((s_id[keep], c_id[keep], dist[keep]))
+        pending = pending[~done]
+        if not len(pending):
+            break
+    s_id, c_id, dist = (np.concatenate(x) for x in zip(*parts))
+    return s_id, c_id, dist, radius, [radii[:x + 1] for x in k.tolist()]
+
+def _assess_chunk(pool: _Pool, items: List[Tuple[int, PropertyInput, float]],
+                  coords: List[Optional[Tuple[float, float]]],
+                  cfg: AppConfig, include_comps: bool,
+                  sources: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    S = len(items)
+    subjects = [s for _, s, _ in items]
+    lat = np.array([c[0] if c else np.nan for c in coords], dtype=float)
+    lon = np.array([c[1] if c else np.nan for c in coords], dtype=float)
+    bands = np.array([_area_band(s) for s in subjects], dtype=float)
+    built = np.array([s.built_area_m2 or 1.0 for s in subjects], dtype=float)
+
+    if cfg.comp_selection == "knn":
+        # os knn_k mais parecidos por finalidade; raio = do comp mais distante
+        rows = [dict(s.model_dump(exclude={"photos"}), lat=c[0] if c else None, lon=c[1] if c else None)
+                for s, c in zip(subjects, coords)]
+        s_id, c_id, dist = pool.similar_pairs(rows, lat, lon, cfg.knn_k, cfg.knn_scales or None)
+        radius = np.zeros(S)
+        has = ~np.isnan(dist)
+        np.maximum.at(radius, s_id[has], dist[has])
+        tried = [[r] for r in radius.tolist()]
+    else:
+        s_id, c_id, dist, radius, tried = _band_pairs(pool, lat, lon, bands, cfg)
+    keep = ~np.isnan(pool.ppm2[c_id]) & (pool.kind[c_id] >= 0)
+    s_id, c_id, dist = s_id[keep], c_id[keep], dist[keep]
+
+    # ordem de assess: por assunto, aluguel antes de venda, por distância (sem distância no fim)
+    kind = pool.kind[c_id].astype(np.intp)
+    order = np.lexsort((c_id, np.where(np.isnan(dist), np.inf, dist), kind, s_id))
+    s_id, c_id, dist, kind = s_id[order], c_id[order], dist[order], kind[order]
+
+    # todos os pesos assunto×comp numa passada
+    weights = comp_weights(np.nan_to_num(dist, nan=0.0), pool.months[c_id], pool.area[c_id], built[s_id],
+                           cfg.alpha_distance, cfg.alpha_recency, cfg.alpha_area_diff)
+    seg_ids, q = grouped_weighted_quantiles(pool.ppm2[c_id], weights, s_id * 2 + kind, QUANTILES)
+    ranges = np.zeros((S, 2, len(QUANTILES)))
+    ranges[seg_ids // 2, seg_ids % 2] = q
+    boot = _bootstrap(cfg)
+    conf: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    if boot:
+        # bandas por segmento assunto×tipo (contíguos na ordem acima)
+        seg = s_id * 2 + kind
+        starts, ends = np.searchsorted(seg, seg_ids, "left"), np.searchsorted(seg, seg_ids, "right")
+        for g, a, b in zip(seg_ids.tolist(), starts, ends):
+            bands = bootstrap_bands(pool.ppm2[c_id[a:b]], weights[a:b], QUANTILES, **boot).tolist()
+            conf[divmod(g, 2)] = {"bands": dict(zip(("low", "p50", "high"), bands))}
+
+    # modelo treinado: todos os assuntos do bloco numa chamada por modelo
+    model = _model_ranges(cfg, subjects, coords)
+    n_seg = np.bincount(s_id * 2 + kind, minlength=2 * S).reshape(S, 2).tolist()
+    bounds = np.searchsorted(s_id, np.arange(S + 1))
+    if include_comps:
+        d_list, w_list, m_list = dist.tolist(), weights.tolist(), pool.months[c_id].tolist()
+    out = []
+    for j, (i, subject, img_score) in enumerate(items):
+        comps_used = []
+        if include_comps:
+            # dicts só aqui, para a saída
+            comps_used = pool.comps.records(c_id[bounds[j]:bounds[j + 1]])
+            for t, c2 in zip(range(bounds[j], bounds[j + 1]), comps_used):
+                c2["distance_km"] = None if math.isnan(d_list[t]) else d_list[t]
+                c2["weight"] = w_list[t]
+                c2["months_since"] = m_list[t]
+        rent = dict(zip(("low", "p50", "high"), ranges[j, 0].tolist()), n=n_seg[j][0], **conf.get((j, 0), {}))
+        sale = dict(zip(("low", "p50", "high"), ranges[j, 1].tolist()), n=n_seg[j][1], **conf.get((j, 1), {}))
+        la, lo = (coords[j] if coords[j] else (None, None))
+        result = _build_result(subject, la, lo, img_score, rent, sale, comps_used, cfg,
+                               float(radius[j]), tried[j], sources, model[j])
+        out.append({"index": i, "ok": True, "result": result, "error": None})
+    return out
+
+def _assess_group(pool: _Pool, items: List[Tuple[int, PropertyInput, float]],
+                  cfg: AppConfig, include_comps: bool,
+                  sources: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    coords = [geocode(s.address, s.city, s.state, s.country) for _, s, _ in items]
+    lat = np.array([c[0] if c else np.nan for c in coords], dtype=float)
+    lon = np.array([c[1] if c else np.nan for c in coords], dtype=float)
+    # blocos de assuntos com até ~MAX_PAIRS pares candidatos no raio padrão
+    cum = np.cumsum(pool.pair_counts(lat, lon, cfg.default_radius_km))
+    out, a = [], 0
+    while a < len(items):
+        base = cum[a - 1] if a else 0
+        b = max(int(np.searchsorted(cum, base + MAX_PAIRS, side="right")), a + 1)
+        out.extend(_assess_chunk(pool, items[a:b], coords[a:b], cfg, include_comps, sources))
+        a = b
+    return out
+
+def assess_batch(payloads: List[Dict[str, Any]], include_comps: bool = True,
+                 uncertainty: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """
+    Avalia N imóveis de uma vez, com o mesmo resultado de `assess` item a item.
+    Os assuntos são agrupados pela consulta aos conectores (cidade/UF/país/tipo),
+    de modo que cada grupo busca seu conjunto de comps uma única vez; distâncias,
+    pesos e quantis de todos os assuntos do grupo são calculados em lote.
+    Retorna, na ordem de entrada, {"index", "ok", "result", "error"} por item.
+    """
+    cfg = _with_uncertainty(AppConfig(), uncertainty)
+    out: List[Optional[Dict[str, Any]]] = [None] * len(payloads)
+    subjects: List[Tuple[int, PropertyInput]] = []
+    for i, payload in enumerate(payloads):
+        try:
+            subjects.append((i, PropertyInput(**payload)))
+        except (ValidationError, TypeError) as e:
+            out[i] = {"index": i, "ok": False, "result": None, "error": str(e)}
+
+    # Fotografias de todos os imóveis num único lote
+    with metrics.span("batch.photos"):
+        photos = [photo_sources(s.photos) for _, s in subjects]
+        scores = photos_score_many([paths for paths, _ in photos], [urls for _, urls in photos])
+
+    groups: Dict[Tuple, List[Tuple[int, PropertyInput, float]]] = {}
+    for (i, s), sc in zip(subjects, scores):
+        groups.setdefault(tuple(_query(s).items()), []).append((i, s, sc))
+
+    for key, items in groups.items():
+        query = dict(key)
+        try:
+            with metrics.span("batch.comps_fetch"):
+                comps, sources = fetch_frame(query, cfg=cfg)
+            with metrics.span("batch.estimate"):
+                pool = _Pool(comps, query["property_type"])
+                for r in _assess_group(pool, items, cfg, include_comps, sources):
+                    out[r["index"]] = r
+        except Exception as e:
+            for i, _, _ in items:
+                if out[i] is None:
+                    out[i] = {"index": i, "ok": False, "result": None, "error": f"{type(e).__name__}: {e}"}
+    return out
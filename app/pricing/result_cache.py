@@ -0,0 +1,156 @@
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple, Union
+from collections import OrderedDict
+import asyncio, hashlib, json, threading, time
+from app.config import AppConfig
+from app.schemas import PropertyFields
+from app.comps import aggregator
+from app.comps.cache import normalize_query
+from app.comps.store import store_mtime
+from app.model.market import market_mtime
+from app.model.regression import model_mtime
+from app.vision.features import file_digest
+from app.utils import metrics
+
+# campos ecoados no resultado (address_geocoded): vêm do pedido, não do cache
+ECHOED = ("address", "city", "state", "country")
+
+def _photo_key(photo) -> str:
+    # conteúdo da foto local (mesmo arquivo com outro nome = mesma foto); URL como veio
+    if photo.path:
+        try:
+            return "sha:" + file_digest(photo.path)
+        except OSError:
+            return "path:" + photo.path
+    return "url:" + (photo.url or "")
+
+def fingerprint(subject: PropertyFields, uncertainty: bool) -> str:
+    """
+    Impressão digital do pedido: campos normalizados (sem caixa e espaços
+    extras, ausentes = omitidos), hashes do conteúdo das fotos (sem ordem: o
+    score é a média) e as bandas de confiança. Lê as fotos: com fotos, chamar
+    fora do event loop.
+    """
+    fields = normalize_query(subject.model_dump(exclude={"photos"}))
+    photos = sorted(_photo_key(p) for p in (getattr(subject, "photos", None) or []))
+    raw = json.dumps([fields, photos, bool(uncertainty)], ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+def data_version(cfg: AppConfig) -> Tuple:
+    # o que muda o resultado sem mudar o pedido: stores locais, agregados de mercado e modelo
+    stores = []
+    for conn in aggregator.CONNECTORS:
+        path = getattr(conn, "path", None)
+        try:
+            stores.append(store_mtime(path) if path else None)
+        except OSError:
+            stores.append(None)
+    return (tuple(stores),
+            market_mtime(cfg.market_path) if cfg.market_path else None,
+            model_mtime(cfg.model_path) if cfg.model_path else None)
+
+def with_subject(result: Dict[str, Any], subject: PropertyFields) -> Dict[str, Any]:
+    # cópia rasa com o endereço do pedido (a impressão digital ignora caixa/espaços)
+    geo = dict(result["address_geocoded"], **{k: getattr(subject, k) for k in ECHOED})
+    return {**result, "address_geocoded": geo, "explainability": dict(result["explainability"])}
+
+class ResultCache:
+    """
+    Resultados de avaliação por impressão digital do pedido. Pedidos iguais
+    em andamento dividem um só cálculo (single-flight, no event loop); os
+    prontos ficam num LRU com TTL (`ttl_s` 0 = só single-flight), esvaziado
+    quando a versão dos dados (`data_version`) muda. Os resultados em cache
+    são compartilhados: quem for alterar usa `with_subject` (cópia rasa).
+    """
+
+    def __init__(self, ttl_s: float = 300.0, max_entries: int = 1024):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._mem: "OrderedDict[str, Tuple[float, float, Dict[str, Any]]]" = OrderedDict()
+        self._version: Optional[Tuple] = None
+        # em andamento por (impressão digital, versão): pedido com dados novos não junta com cálculo velho
+        self._inflight: Dict[Tuple[str, Tuple], "asyncio.Future[Dict[str, Any]]"] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+
+    def _count(self, kind: str) -> None:
+        self._stats[kind] += 1
+        metrics.CACHE_REQUESTS.inc(cache="assess_result", result=kind)
+
+    def _check_version(self, version: Tuple) -> None:
+        # dados novos: tudo o que está em cache ficou velho
+        if version != self._version:
+            if self._mem:
+                self._count("invalidations")
+            self._mem.clear()
+            self._version = version
+
+    def get(self, key: str, version: Tuple) -> Optional[Tuple[Dict[str, Any], float]]:
+        # (resultado, idade em segundos) ou None
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            hit = self._mem.get(key)
+            if hit is None:
+                return None
+            if hit[0] <= now:
+                del self._mem[key]
+                return None
+            self._mem.move_to_end(key)
+            return hit[2], now - hit[1]
+
+    def set(self, key: str, version: Tuple, result: Dict[str, Any]) -> None:
+        if self.ttl_s <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            # cálculo começado antes de os dados mudarem: resultado velho, descartado
+            if version != self._version:
+                return
+            self._mem[key] = (now + self.ttl_s, now, result)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    async def get_or_compute(self, key: str, version: Tuple,
+                             compute: Callable[[], Awaitable[Dict[str, Any]]]
+                             ) -> Tuple[Dict[str, Any], str, float]:
+        """
+        (resultado, situação, idade): "hit" do cache; "coalesced" se outro
+        pedido igual já estava calculando (espera o mesmo resultado ou erro);
+        "miss" calcula. O cálculo roda numa task própria: cliente que desiste
+        não cancela os outros que esperam.
+        """
+        hit = self.get(key, version)
+        if hit is not None:
+            with self._lock:
+                self._count("hits")
+            return hit[0], "hit", hit[1]
+        task = self._inflight.get((key, version))
+        status = "coalesced" if task is not None else "miss"
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, version, compute))
+            # erro sem ninguém esperando não vira aviso de exceção não lida
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[(key, version)] = task
+        with self._lock:
+            self._count("misses" if status == "miss" else status)
+        return await asyncio.shield(task), status, 0.0
+
+    async def _run(self, key: str, version: Tuple,
+                   compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        try:
+            result = await compute()
+            self.set(key, version, result)
+            return result
+        finally:
+            self._inflight.pop((key, version), None)
+
+    def invalidate(self) -> int:
+        with self._lock:
+            n = len(self._mem)
+            self._mem.clear()
+        return n
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._mem), inflight=len(self._inflight))
@@ -0,0 +1,257 @@
+"""
+Reavaliação de carteira: imóveis de arquivos CSV ou JSONL (um por linha,
+campos de PropertyInput; `id` opcional; no CSV, `photos` com caminhos ou URLs
+separados por ";") avaliados em blocos num pool de processos. Cada processo
+abre uma vez o CompStore, os agregados de mercado e o modelo treinado e
+avalia o bloco com `assess_batch` (mesmo resultado de `assess` item a item).
+
+Resultados saem em fluxo, uma linha plana por imóvel, na ordem em que os
+blocos terminam (`index` = posição na entrada):
+  - .jsonl: um arquivo;
+  - .parquet: diretório com uma parte por bloco (pandas.read_parquet lê o diretório).
+O progresso fica em `<saída>.checkpoint`: rodar o mesmo comando de novo
+retoma do que faltou (blocos incompletos são refeitos; --restart recomeça).
+
+Uso:
+  python -m app.pricing.revalue carteira.csv --out reavaliacao.jsonl --workers 4
+  python -m app.pricing.revalue carteira.jsonl --out reavaliacao.parquet --chunk-size 1000
+"""
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import argparse, csv, itertools, json, os, shutil, sys, time
+from app.config import AppConfig
+from app.comps import aggregator
+from app.comps.store import load_store
+from app.model.market import load_market
+from app.model.regression import load_model
+from app.pricing.batch import assess_batch
+
+RESULT_FIELDS = ("per_m2_low", "per_m2_target", "per_m2_high", "total_low", "total_target", "total_high")
+
+def _csv_row(row: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    # célula vazia = campo ausente (PropertyInput converte números em texto)
+    out = {k: v for k, v in row.items() if k and v not in (None, "")}
+    if "photos" in out:
+        out["photos"] = [{"url" if p.strip().startswith(("http://", "https://")) else "path": p.strip()}
+                         for p in out["photos"].split(";") if p.strip()]
+    return out
+
+def read_items(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Imóveis dos arquivos, em ordem. Linha JSONL inválida vira {"_error": ...}
+    (sai como erro daquele item, sem parar a carteira).
+    """
+    for path in paths:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            if path.lower().endswith(".csv"):
+                for row in csv.DictReader(f):
+                    yield _csv_row(row)
+                continue
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError as e:
+                    item = {"_error": f"{path}:{n}: JSON inválido ({e.msg})"}
+                yield item if isinstance(item, dict) else {"_error": f"{path}:{n}: esperado um objeto JSON"}
+
+def count_items(paths: Iterable[str]) -> int:
+    return sum(1 for _ in read_items(paths))
+
+def chunks(paths: Iterable[str], size: int) -> Iterator[Tuple[int, int, List[Dict[str, Any]]]]:
+    # (bloco, índice do primeiro item, itens); a numeração não muda entre execuções
+    items = read_items(paths)
+    for k in itertools.count():
+        block = list(itertools.islice(items, size))
+        if not block:
+            return
+        yield k, k * size, block
+
+def flatten(index: int, item: Dict[str, Any], res: Dict[str, Any]) -> Dict[str, Any]:
+    # uma linha plana (mesmas colunas em todas, para JSONL e Parquet)
+    row = {"index": index, "id": item.get("id"), "ok": res["ok"], "error": res["error"],
+           "address": item.get("address"), "city": item.get("city"),
+           "property_type": item.get("property_type"), "built_area_m2": item.get("built_area_m2")}
+    r = res["result"] or {}
+    geo = r.get("address_geocoded") or {}
+    expl = r.get("explainability") or {}
+    row.update({"lat": geo.get("lat"), "lon": geo.get("lon"), "image_quality_score": r.get("image_quality_score"),
+                "radius_km": (expl.get("filters") or {}).get("radius_km")})
+    for kind in ("rental", "sale"):
+        values = r.get(kind) or {}
+        for f in RESULT_FIELDS:
+            row[f"{kind}_{f}"] = values.get(f)
+        row[f"{kind}_market_weight"] = ((expl.get("market") or {}).get(kind) or {}).get("weight", 0.0)
+        row[f"{kind}_model_weight"] = ((expl.get("model") or {}).get(kind) or {}).get("weight", 0.0)
+    return row
+
+# colunas de `flatten`, na ordem; no Parquet todas as partes saem com os mesmos tipos
+# (um bloco sem erros teria `error` só com None, inferido como nulo)
+FLAT_COLUMNS = tuple(flatten(0, {}, {"ok": False, "error": None, "result": None}))
+_STRING_COLUMNS = ("id", "error", "address", "city", "property_type")
+
+def parquet_frame(rows: List[Dict[str, Any]]):
+    import pandas as pd
+    df = pd.DataFrame(rows, columns=list(FLAT_COLUMNS))
+    for c in FLAT_COLUMNS:
+        if c == "index":
+            df[c] = df[c].astype("int64")
+        elif c == "ok":
+            df[c] = df[c].astype("bool")
+        elif c in _STRING_COLUMNS:
+            df[c] = df[c].astype("string")
+        else:
+            # número em texto (CSV) vira float; inválido vira NaN
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    return df
+
+def _init_worker() -> None:
+    # aquece o processo: stores dos conectores locais, agregados e modelo (uma vez)
+    cfg = AppConfig()
+    for conn in aggregator.CONNECTORS:
+        path = getattr(conn, "path", None)
+        if path and os.path.exists(path):
+            load_store(path)
+    if cfg.market_path:
+        load_market(cfg.market_path)
+    if cfg.model_path:
+        load_model(cfg.model_path)
+
+def run_chunk(chunk: int, start: int, items: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    # avalia um bloco (no processo do pool); itens com erro de leitura não vão para o lote
+    valid = [i for i, it in enumerate(items) if "_error" not in it]
+    results = assess_batch([items[i] for i in valid], include_comps=False)
+    by_pos = dict(zip(valid, results))
+    rows = []
+    for i, item in enumerate(items):
+        res = by_pos.get(i) or {"ok": False, "result": None, "error": item.get("_error")}
+        rows.append(flatten(start + i, item, res))
+    return chunk, rows
+
+class _JsonlSink:
+    def __init__(self, path: str, offset: int):
+        # retomada: corta o que foi escrito depois do último bloco registrado
+        mode = "r+b" if os.path.exists(path) else "wb"
+        self.f = open(path, mode)
+        self.f.truncate(offset)
+        self.f.seek(offset)
+
+    def write(self, chunk: int, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self.f.write(b"".join(json.dumps(r, ensure_ascii=False, default=str).encode("utf-8") + b"\n" for r in rows))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return {"offset": self.f.tell()}
+
+    def close(self) -> None:
+        self.f.close()
+
+class _ParquetSink:
+    def __init__(self, path: str, offset: int):
+        from pandas.io.parquet import get_engine
+        get_engine("auto")  # ImportError já aqui se não há pyarrow/fastparquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, chunk: int, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        name = f"part-{chunk:06d}.parquet"
+        tmp = os.path.join(self.path, f".{name}.tmp")
+        parquet_frame(rows).to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(self.path, name))
+        return {"part": name}
+
+    def close(self) -> None:
+        pass
+
+def _load_checkpoint(path: str, header: Dict[str, Any]) -> Tuple[Dict[int, Dict[str, Any]], int]:
+    # blocos já gravados {bloco: registro} e posição do fim do último (JSONL);
+    # checkpoint novo começa pelo cabeçalho da execução
+    if not os.path.exists(path) or not os.path.getsize(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+        return {}, 0
+    done, offset = {}, 0
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    # linha cortada no fim (queda no meio da escrita) sai do arquivo antes de anexar
+    complete = raw[:raw.rfind("\n") + 1]
+    if complete != raw:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(complete)
+    lines = [json.loads(line) for line in complete.splitlines()]
+    if not lines or lines[0] != header:
+        raise ValueError(f"{path} é de outra execução (entradas/bloco/formato diferentes); use --restart")
+    for entry in lines[1:]:
+        done[entry["chunk"]] = entry
+        offset = max(offset, entry.get("offset", 0))
+    return done, offset
+
+def revalue(paths: List[str], out: str, workers: int = 4, chunk_size: int = 500,
+            restart: bool = False, progress=sys.stderr) -> Dict[str, Any]:
+    """
+    Avalia a carteira em `paths` e grava em `out` (.jsonl ou .parquet),
+    retomando de `<out>.checkpoint` se existir. Retorna o resumo da execução.
+    """
+    fmt = "parquet" if out.lower().endswith(".parquet") else "jsonl"
+    ckpt = f"{out}.checkpoint"
+    if restart:
+        for p in (out, ckpt):
+            if os.path.isdir(p):
+                shutil.rmtree(p)
+            elif os.path.exists(p):
+                os.remove(p)
+    header = {"inputs": [os.path.abspath(p) for p in paths], "chunk_size": chunk_size, "format": fmt}
+    done, offset = _load_checkpoint(ckpt, header)
+    sink = (_ParquetSink if fmt == "parquet" else _JsonlSink)(out, offset)
+    total = count_items(paths)
+    stats = {"items": total, "resumed": sum(e["rows"] for e in done.values()), "evaluated": 0, "errors": 0}
+    t0 = time.perf_counter()
+    with open(ckpt, "a", encoding="utf-8") as log, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = set()
+        todo = (b for b in chunks(paths, chunk_size) if b[0] not in done)
+        for block in itertools.islice(todo, 2 * workers):
+            pending.add(pool.submit(run_chunk, *block))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                chunk, rows = fut.result()
+                entry = {"chunk": chunk, "rows": len(rows), **sink.write(chunk, rows)}
+                log.write(json.dumps(entry) + "\n")
+                log.flush()
+                os.fsync(log.fileno())
+                stats["evaluated"] += len(rows)
+                stats["errors"] += sum(1 for r in rows if not r["ok"])
+                nxt = next(todo, None)
+                if nxt is not None:
+                    pending.add(pool.submit(run_chunk, *nxt))
+            if progress:
+                elapsed = time.perf_counter() - t0
+                rate = stats["evaluated"] / elapsed if elapsed > 0 else 0.0
+                left = total - stats["resumed"] - stats["evaluated"]
+                eta = f"{left / rate:,.0f}s" if rate > 0 else "?"
+                print(f"\r{stats['resumed'] + stats['evaluated']}/{total} imóveis  {rate:,.1f} avaliações/s  "
+                      f"{stats['errors']} erros  faltam ~{eta}   ", end="", file=progress, flush=True)
+    sink.close()
+    if progress:
+        print(file=progress)
+    stats["seconds"] = time.perf_counter() - t0
+    stats["rate"] = stats["evaluated"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="+", help="carteira em CSV ou JSONL")
+    ap.add_argument("--out", required=True, help="saída .jsonl (arquivo) ou .parquet (diretório)")
+    ap.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 8))
+    ap.add_argument("--chunk-size", type=int, default=500, help="imóveis por bloco (unidade de checkpoint)")
+    ap.add_argument("--restart", action="store_true", help="ignora o checkpoint e recomeça do zero")
+    args = ap.parse_args()
+    try:
+        stats = revalue(args.paths, args.out, args.workers, args.chunk_size, args.restart)
+    except (ValueError, ImportError) as e:
+        ap.error(str(e))
+    print(json.dumps(stats, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+import itertools
+import numpy as np
+from app.schemas import PropertyInput
+from app.config import AppConfig
+from app.geo.geocode import geocode
+from app.comps.aggregator import fetch_frame
+from app.comps.table import CompFrame
+from app.model.hedonic import frame_arrays, weighted_quantiles_rows, QUANTILES
+from app.vision.features import photos_score, photo_sources
+from app.pricing.assessor import (_query, _select, _similar, _adjust_by_image, _market_priors, _blend,
+                                  _model_ranges)
+from app.utils import metrics
+
+def _grid_quantiles(comps: CompFrame, built: float, alphas: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    Faixas (p25/p50/p75 de R$/m²) de `comps` para cada linha de `alphas`
+    [P, 3] (distância, recência, área), numa conta só: pesos [P, n_comps].
+    Retorna (faixas[P, 3], nº de comps com preço).
+    """
+    kept, cols = frame_arrays(comps)
+    if not len(kept):
+        return np.zeros((len(alphas), len(QUANTILES))), 0
+    built = built or 1.0
+    area = cols["area"]
+    a_rel = np.where(area > 0, np.abs(area - built) / max(built, 1.0), 0.0)
+    # mesma expressão de comp_weights, com os alphas numa dimensão a mais
+    weights = np.exp(-(alphas[:, 0:1] * cols["distance_km"][None, :]
+                       + alphas[:, 1:2] * cols["months"][None, :]
+                       + alphas[:, 2:3] * a_rel[None, :]))
+    return weighted_quantiles_rows(cols["ppm2"], weights, QUANTILES), len(kept)
+
+def _values(given: Optional[Sequence[float]], default: float) -> List[float]:
+    return [float(x) for x in given] if given else [default]
+
+def sweep(payload: Dict[str, Any],
+          alpha_distance: Optional[Sequence[float]] = None,
+          alpha_recency: Optional[Sequence[float]] = None,
+          alpha_area_diff: Optional[Sequence[float]] = None,
+          built_area_m2: Optional[Sequence[float]] = None,
+          cfg: Optional[AppConfig] = None) -> Dict[str, Any]:
+    """
+    E se...? Busca os comps uma vez e avalia a grade (produto cartesiano) dos
+    valores informados de built_area_m2 e dos alphas; campos omitidos ficam no
+    valor do imóvel / da configuração. Cada ponto dá o mesmo resultado de
+    `assess` com aqueles parâmetros. Por área: filtro, raio e pesos da área;
+    por combinação de alphas: uma linha da matriz de pesos.
+    Retorna {"address_geocoded", "image_quality_score", "sources", "grid"}:
+    `grid` com uma linha (dict plano) por ponto.
+    """
+    cfg = cfg or AppConfig()
+    subject = PropertyInput(**payload)
+    areas = _values(built_area_m2, subject.built_area_m2)
+    if any(a <= 0 for a in areas):
+        raise ValueError("built_area_m2 deve ser > 0")
+    axes = [areas,
+            _values(alpha_distance, cfg.alpha_distance),
+            _values(alpha_recency, cfg.alpha_recency),
+            _values(alpha_area_diff, cfg.alpha_area_diff)]
+    n_points = int(np.prod([len(ax) for ax in axes]))
+    if n_points > cfg.whatif_max_points:
+        raise ValueError(f"Grade com {n_points} pontos; máximo {cfg.whatif_max_points}")
+
+    with metrics.span("geocode"):
+        latlon = geocode(subject.address, subject.city, subject.state, subject.country)
+    lat, lon = (latlon if latlon else (None, None))
+    with metrics.span("photos"):
+        paths, urls = photo_sources(subject.photos)
+        img_score = photos_score(paths, urls=urls)
+    subjects = {area: subject.model_copy(update={"built_area_m2": area}) for area in dict.fromkeys(areas)}
+    with metrics.span("comps_fetch"):
+        if cfg.comp_selection == "knn":
+            # a semelhança depende da área: uma seleção por área
+            frames = {}
+            for area, s in subjects.items():
+                frames[area], sources = fetch_frame(_query(subject), lat, lon, cfg.max_radius_km, cfg=cfg,
+                                                    similar=_similar(cfg, s, lat, lon))
+        else:
+            frame, sources = fetch_frame(_query(subject), lat, lon, cfg.max_radius_km, cfg=cfg)
+            frames = dict.fromkeys(subjects, frame)
+
+    # modelo treinado: uma previsão por área, todas numa chamada
+    with metrics.span("model"):
+        model = dict(zip(subjects, _model_ranges(cfg, list(subjects.values()), [latlon] * len(subjects))))
+
+    grid: List[Dict[str, Any]] = []
+    with metrics.span("whatif"):
+        alphas = np.array(list(itertools.product(*axes[1:])), dtype=float)
+        for area in dict.fromkeys(areas):
+            # seleção (faixa de área e raio, ou semelhança) depende só da área
+            comps, radius, _ = _select(subjects[area], lat, lon, frames[area], cfg)
+            kind = comps.column("is_rental")
+            ranges = {"rental": _grid_quantiles(comps.take(np.flatnonzero(kind == 1)), area, alphas),
+                      "sale": _grid_quantiles(comps.take(np.flatnonzero(kind == 0)), area, alphas)}
+            built = max(area, 1.0)
+            # poucos comps: mesma combinação com os agregados de mercado de `assess`
+            market = _market_priors(cfg, subject, lat, lon, {key: n for key, (_, n) in ranges.items()})
+            for p, (ad, ar, aa) in enumerate(alphas.tolist()):
+                row = {"built_area_m2": area, "alpha_distance": ad, "alpha_recency": ar, "alpha_area_diff": aa,
+                       "radius_km": radius}
+                for key, (q, n) in ranges.items():
+                    row[f"n_comps_{key}"] = n
+                    point = dict(zip(("low", "p50", "high"), q[p].tolist()), n=n)
+                    row[f"{key}_market_weight"] = market[key]["weight"] if key in market else 0.0
+                    if key in market:
+                        point = _blend(point, market[key], market[key]["weight"])
+                    # mesma regra de _build_result: modelo sozinho sem comps nem mercado
+                    w = 0.0
+                    if key in model[area]:
+                        w = 1.0 if n == 0 and key not in market else cfg.model_weight
+                        point = _blend(point, model[area][key], w)
+                    row[f"{key}_model_weight"] = w
+                    low, p50, high = (_adjust_by_image(point[x], img_score) for x in ("low", "p50", "high"))
+                    row.update({
+                        f"{key}_per_m2_low": low, f"{key}_per_m2_target": p50, f"{key}_per_m2_high": high,
+                        f"{key}_total_low": low * built, f"{key}_total_target": p50 * built,
+                        f"{key}_total_high": high * built,
+                    })
+                grid.append(row)
+
+    return {
+        "address_geocoded": {
+            "address": subject.address,
+            "city": subject.city, "state": subject.state, "country": subject.country,
+            "lat": lat, "lon": lon
+        },
+        "image_quality_score": img_score,
+        "sources": sources,
+        "grid": grid,
+    }
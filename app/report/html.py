@@ -1,7 +1,13 @@
-from typing import Dict, Any, List
-from jinja2 import Template
+from typing import Dict, Any, List, Iterable, Iterator, Tuple, Union
+from jinja2 import Environment
+import io, zipfile
 
-TEMPLATE = Template("""
+# pedaços de ~64 KB por escrita no streaming
+CHUNK_CHARS = 64 * 1024
+
+# compilado uma vez, na importação; autoescape porque endereço e títulos dos
+# comps vêm do cliente e dos portais
+TEMPLATE = Environment(autoescape=True).from_string("""
 <!DOCTYPE html>
 <html lang="pt-br">
 <head>
@@ -56,8 +62,8 @@ TEMPLATE = Template("""
         <td>{{ c.title }}</td>
         <td>{{ c.city }}</td>
         <td>{{ c.built_area_m2 }}</td>
-        <td>{{ (c.price_total or c.price_per_m2 * c.built_area_m2) | round(0) }}</td>
-        <td>{{ c.price_per_m2 | round(2) }}</td>
+        <td>{{ (c.price_total or (c.price_per_m2 or 0) * (c.built_area_m2 or 0)) | round(0) }}</td>
+        <td>{{ (c.price_per_m2 or 0) | round(2) }}</td>
         <td>{{ (c.distance_km or 0) | round(1) }}</td>
         <td>{{ c.months_since | round(1) }}</td>
         <td>{{ c.weight | round(3) }}</td>
@@ -73,5 +79,84 @@ TEMPLATE = Template("""
 </html>
 """)
 
+def _ranges(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "low_pm2": r["per_m2_low"], "p50_pm2": r["per_m2_target"], "high_pm2": r["per_m2_high"],
+        "low_total": r["total_low"], "p50_total": r["total_target"], "high_total": r["total_high"],
+    }
+
+def report_context(res: Dict[str, Any], property_type: str, built_area_m2: float) -> Dict[str, Any]:
+    # contexto do template a partir do resultado de `assess`
+    return {
+        "address": res["address_geocoded"]["address"],
+        "city": res["address_geocoded"]["city"],
+        "state": res["address_geocoded"]["state"],
+        "property_type": property_type,
+        "built_area_m2": built_area_m2,
+        "image_score": res["image_quality_score"],
+        "rental": _ranges(res["rental"]),
+        "sale": _ranges(res["sale"]),
+        "comps": res["comps_used"],
+    }
+
 def render_html(context: Dict[str, Any]) -> str:
     return TEMPLATE.render(**context)
+
+def render_html_stream(context: Dict[str, Any], chunk_chars: int = CHUNK_CHARS) -> Iterator[str]:
+    """
+    Mesmo HTML de `render_html`, gerado aos pedaços (`Template.generate`) e
+    agrupado em blocos de ~chunk_chars: o relatório inteiro nunca fica em memória.
+    """
+    buf: List[str] = []
+    size = 0
+    for piece in TEMPLATE.generate(**context):
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_chars:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+class _ZipSink(io.RawIOBase):
+    # destino sem seek para o ZipFile: acumula bytes até serem drenados
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def pending(self) -> int:
+        return len(self._buf)
+
+    def drain(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+def zip_reports(entries: Iterable[Tuple[str, Union[Dict[str, Any], str]]]) -> Iterator[bytes]:
+    """
+    Zip gerado em fluxo: para cada (nome_do_arquivo, contexto ou texto), o
+    relatório é renderizado aos pedaços direto no arquivo compactado e os
+    bytes prontos saem a cada bloco. Texto (ex.: mensagem de erro) entra como está.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in entries:
+            chunks = render_html_stream(content) if isinstance(content, dict) else [content]
+            with zf.open(name, "w", force_zip64=True) as f:
+                for chunk in chunks:
+                    f.write(chunk.encode("utf-8"))
+                    if sink.pending():
+                        yield sink.drain()
+            yield sink.drain()  # descritor de dados do arquivo
+    yield sink.drain()  # diretório central
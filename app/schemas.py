@@ -7,7 +7,8 @@ class PhotoInput(BaseModel):
     path: Optional[str] = None   # caminho local do arquivo (UI)
     url: Optional[str] = None    # opcional: URL remota (conectores online)
 
-class PropertyInput(BaseModel):
+class PropertyFields(BaseModel):
+    # campos escalares do imóvel (também aceitos como query string, ex. GET /report)
     address: str
     city: str
     state: str = "MG"
@@ -21,6 +22,8 @@ class PropertyInput(BaseModel):
     ceiling_height_m: Optional[float] = None # industrial
     energy_capacity_kva: Optional[float] = None # industrial
     dock_doors: Optional[int] = None # industrial
+
+class PropertyInput(PropertyFields):
     photos: Optional[List[PhotoInput]] = []
 
 class AssessmentResult(BaseModel):
@@ -30,3 +33,39 @@ class AssessmentResult(BaseModel):
     rental: Dict[str, Any]
     sale: Dict[str, Any]
     explainability: Dict[str, Any]
+
+class BatchAssessRequest(BaseModel):
+    # itens validados um a um: erro em um não derruba o lote
+    items: List[Dict[str, Any]]
+    include_comps: bool = True
+    uncertainty: Optional[bool] = None  # bandas de confiança (None = padrão da configuração)
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    result: Optional[AssessmentResult] = None
+    error: Optional[str] = None
+
+class BatchAssessResult(BaseModel):
+    results: List[BatchItemResult]
+
+class WhatIfRequest(BaseModel):
+    # grade = produto cartesiano das listas informadas (omitida = valor atual)
+    subject: PropertyInput
+    alpha_distance: Optional[List[float]] = None
+    alpha_recency: Optional[List[float]] = None
+    alpha_area_diff: Optional[List[float]] = None
+    built_area_m2: Optional[List[float]] = None
+
+class WhatIfResult(BaseModel):
+    address_geocoded: Dict[str, Any]
+    image_quality_score: float
+    sources: Dict[str, List[str]]
+    grid: List[Dict[str, Any]]
+
+class MarketHeatmap(BaseModel):
+    property_type: str
+    is_rental: bool
+    resolution: int
+    months: int
+    cells: List[Dict[str, Any]]
@@ -0,0 +1,115 @@
+from typing import Any, Optional
+import json, os, sqlite3, threading, time
+
+class SQLiteCache:
+    """
+    Cache persistente chave→JSON em SQLite, com despejo LRU por número de
+    entradas e por tamanho total (bytes). Seguro para uso entre threads;
+    vários processos podem compartilhar o mesmo arquivo.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000, max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache(last_access)")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def get_many(self, keys) -> dict:
+        # uma consulta para o lote todo; retorna só as chaves encontradas
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        out = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT key, value FROM cache WHERE key IN ({marks})", chunk).fetchall()
+                if rows:
+                    self._conn.executemany("UPDATE cache SET last_access = ? WHERE key = ?",
+                                           [(now, k) for k, _ in rows])
+                for k, v in rows:
+                    out[k] = json.loads(v)
+        return out
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: dict) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for k, v in items.items():
+            s = json.dumps(v, ensure_ascii=False)
+            rows.append((k, s, len(s.encode("utf-8")), now))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache(key, value, size, last_access) VALUES (?, ?, ?, ?)", rows)
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def delete_matching(self, pred) -> None:
+        # varre as chaves (uso raro: invalidação administrativa)
+        with self._lock:
+            keys = [k for (k,) in self._conn.execute("SELECT key FROM cache") if pred(k)]
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _evict(self) -> None:
+        # remove os menos usados recentemente até caber nos limites
+        n, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        excess = max(n - self.max_entries, 0) if self.max_entries else 0
+        if excess:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access LIMIT ?)", (excess,))
+            n -= excess
+        if self.max_bytes and total > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM cache ORDER BY last_access").fetchall()
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            drop = []
+            for k, size in rows:
+                if total <= self.max_bytes:
+                    break
+                drop.append((k,))
+                total -= size
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", drop)
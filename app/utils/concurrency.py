@@ -0,0 +1,47 @@
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+import asyncio, threading
+
+class Saturated(Exception):
+    """Fila de avaliações cheia (a API responde 429)."""
+
+class AdmissionGate:
+    """
+    Limita avaliações simultâneas (`max_concurrent`) e quantas podem esperar
+    na fila (`max_queued`); acima disso, `Saturated` na hora, sem enfileirar.
+    Uso: `async with gate: ...`
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._sem = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+
+    async def __aenter__(self):
+        if self.active >= self.max_concurrent and self.waiting >= self.max_queued:
+            raise Saturated(f"{self.active} em execução, {self.waiting} na fila")
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._sem.release()
+        return False
+
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+def cpu_pool(workers: int) -> ProcessPoolExecutor:
+    # pool de processos compartilhado para etapas CPU-bound (fotos, estimativa)
+    global _cpu_pool
+    with _lock:
+        if _cpu_pool is None:
+            _cpu_pool = ProcessPoolExecutor(max_workers=workers)
+        return _cpu_pool
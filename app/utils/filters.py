@@ -1,4 +1,5 @@
 from typing import List, Dict, Any, Optional
+import numpy as np
 
 def filter_comps(comps: List[Dict[str, Any]],
                  property_type: Optional[str] = None,
@@ -17,3 +18,18 @@ def filter_comps(comps: List[Dict[str, Any]],
             continue
         out.append(c)
     return out
+
+def filter_mask(frame,
+                property_type: Optional[str] = None,
+                min_built: Optional[float] = None,
+                max_built: Optional[float] = None) -> np.ndarray:
+    # mesmo critério de filter_comps, nas colunas de um CompFrame
+    area = frame.column("built_area_m2")
+    ok = ~np.isnan(area)
+    if property_type:
+        ok &= frame.category_mask("property_type", property_type)
+    if min_built is not None:
+        ok &= area >= min_built
+    if max_built is not None:
+        ok &= area <= max_built
+    return ok
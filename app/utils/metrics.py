@@ -0,0 +1,124 @@
+from typing import Dict, Iterable, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from bisect import bisect_left
+import threading, time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000, 50000)
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name, self.help = name, help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0.0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {v:g}")
+        return "\n".join(lines)
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # por rótulo: [contagens por bucket..., +Inf], soma
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cum = 0
+                for b, c in zip(self.buckets + (float("inf"),), counts):
+                    cum += c
+                    le = 'le="+Inf"' if b == float("inf") else f'le="{b:g}"'
+                    lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cum}")
+                lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {cum}")
+        return "\n".join(lines)
+
+STAGE_SECONDS = Histogram("assess_stage_seconds", "Duração das etapas da avaliação.", ["stage"])
+CONNECTOR_SECONDS = Histogram("connector_fetch_seconds", "Duração da busca por conector.", ["source"])
+CONNECTOR_RESULTS = Counter("connector_fetch_total", "Buscas por conector e situação.", ["source", "status"])
+COMPS_RETRIEVED = Histogram("comps_retrieved", "Comps retornados pelos conectores por avaliação.",
+                            buckets=COUNT_BUCKETS)
+RADIUS_EXPANSIONS = Counter("radius_expansions_total", "Passos de ampliação do raio de busca.")
+CACHE_REQUESTS = Counter("cache_requests_total", "Consultas a caches.", ["cache", "result"])
+ASSESSMENTS = Counter("assessments_total", "Avaliações por rota e situação.", ["route", "status"])
+PHOTO_FETCHES = Counter("photo_fetch_total", "Downloads de fotos remotas por situação.", ["status"])
+
+REGISTRY = [STAGE_SECONDS, CONNECTOR_SECONDS, CONNECTOR_RESULTS, COMPS_RETRIEVED,
+            RADIUS_EXPANSIONS, CACHE_REQUESTS, ASSESSMENTS, PHOTO_FETCHES]
+
+# tempos da requisição corrente (etapa -> segundos), quando alguém está coletando
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("timings", default=None)
+
+def record(stage: str, seconds: float, hist: Histogram = STAGE_SECONDS, **labels) -> None:
+    hist.observe(seconds, **(labels or {"stage": stage}))
+    t = _timings.get()
+    if t is not None:
+        t[stage] = t.get(stage, 0.0) + seconds
+
+@contextmanager
+def span(stage: str, hist: Histogram = STAGE_SECONDS, **labels):
+    # mede a etapa: alimenta o histograma e, se houver coleta ativa, os tempos da requisição
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0, hist, **labels)
+
+@contextmanager
+def collect_timings():
+    """
+    Coleta os tempos das etapas executadas dentro do bloco (inclusive em threads
+    que herdam o contexto). Uso: `with collect_timings() as t: ...`
+    """
+    t: Dict[str, float] = {}
+    token = _timings.set(t)
+    try:
+        yield t
+    finally:
+        _timings.reset(token)
+
+def merge_timings(timings: Dict[str, float]) -> None:
+    # tempos medidos em outro processo (pool de CPU) entram aqui
+    for stage, seconds in timings.items():
+        record(stage, seconds)
+
+def render_prometheus() -> str:
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
@@ -1,7 +1,16 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from PIL import Image, ImageStat
 import numpy as np
-import os
+import hashlib, io, os, threading
+from app.config import AppConfig
+from app.utils.cache import SQLiteCache
+from app.utils import metrics
+from app.vision.fetch import PhotoFetcher, get_fetcher
+
+SIZE = (512, 512)
+# versão do algoritmo de score: entra na chave do cache (mudou o score, muda a versão)
+SCORER_VERSION = "v1"
 
 def _brightness(img: Image.Image) -> float:
     # converte para L (grayscale) e calcula média normalizada
@@ -9,51 +18,282 @@ def _brightness(img: Image.Image) -> float:
     stat = ImageStat.Stat(gray)
     return stat.mean[0] / 255.0
 
-def _sharpness(img: Image.Image) -> float:
+def _sobel_buffers(shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    # buffers float32 reaproveitáveis entre fotos do mesmo tamanho
+    return np.empty(shape, dtype=np.float32), np.empty(shape, dtype=np.float32)
+
+def _sobel_xy(gray: np.ndarray,
+              gx: Optional[np.ndarray] = None,
+              gy: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gradientes Sobel separáveis (borda replicada), equivalentes a _convolve2d com
+    kx = [1,2,1]ᵀ·[1,0,-1] e ky = [1,0,-1]ᵀ·[1,2,1]. Se gx/gy forem passados, escreve neles.
+    """
+    h, w = gray.shape
+    p = np.pad(gray, 1, mode='edge')
+    if gx is None or gx.shape != (h, w):
+        gx = np.empty((h, w), dtype=np.float32)
+    if gy is None or gy.shape != (h, w):
+        gy = np.empty((h, w), dtype=np.float32)
+    # gx: suavização vertical [1,2,1] e diferença horizontal [1,0,-1]
+    s = p[1:-1] * 2.0
+    s += p[:-2]
+    s += p[2:]
+    np.subtract(s[:, :-2], s[:, 2:], out=gx)
+    # gy: suavização horizontal [1,2,1] e diferença vertical [1,0,-1]
+    t = p[:, 1:-1] * 2.0
+    t += p[:, :-2]
+    t += p[:, 2:]
+    np.subtract(t[:-2], t[2:], out=gy)
+    return gx, gy
+
+def _sharpness(img: Image.Image,
+               buffers: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> float:
     # aproximar nitidez pela variância do gradiente (Sobel-like)
     gray = np.asarray(img.convert('L'), dtype=np.float32) / 255.0
-    # kernels simples
-    kx = np.array([[1, 0, -1],
-                   [2, 0, -2],
-                   [1, 0, -1]], dtype=np.float32)
-    ky = np.array([[1, 2, 1],
-                   [0, 0, 0],
-                   [-1, -2, -1]], dtype=np.float32)
-    gx = _convolve2d(gray, kx)
-    gy = _convolve2d(gray, ky)
-    mag = np.sqrt(gx*gx + gy*gy)
+    gx, gy = _sobel_xy(gray, *(buffers or (None, None)))
+    # magnitude calculada in-place nos próprios buffers
+    np.multiply(gx, gx, out=gx)
+    np.multiply(gy, gy, out=gy)
+    gx += gy
+    mag = np.sqrt(gx, out=gx)
     return float(np.clip(np.var(mag) * 4.0, 0.0, 1.0))  # normalização simples
 
 def _convolve2d(img: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    # correlação 2D genérica (borda replicada) via janelas deslizantes
     kh, kw = kernel.shape
     pad_h, pad_w = kh//2, kw//2
     padded = np.pad(img, ((pad_h, pad_h), (pad_w, pad_w)), mode='edge')
-    out = np.zeros_like(img)
-    for i in range(img.shape[0]):
-        for j in range(img.shape[1]):
-            region = padded[i:i+kh, j:j+kw]
-            out[i, j] = np.sum(region * kernel)
-    return out
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (kh, kw))
+    return np.einsum('ijkl,kl->ij', windows, kernel.astype(img.dtype, copy=False))
 
-def photo_quality_score(path: str) -> Optional[float]:
+def _load(path: str) -> Image.Image:
+    with Image.open(path) as im:
+        # JPEG: decodifica já reduzido (escala DCT 1/2..1/8), nunca abaixo de SIZE
+        im.draft(im.mode, SIZE)
+        return im.resize(SIZE)
+
+def photo_quality_score(path,
+                        buffers: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Optional[float]:
     try:
-        with Image.open(path) as im:
-            im = im.copy().resize((512, 512))
+        im = _load(path)
         b = _brightness(im)
-        s = _sharpness(im)
+        s = _sharpness(im, buffers)
         # Combinação simples: peso maior para nitidez
         score = 0.35 * b + 0.65 * s
         return float(np.clip(score, 0.0, 1.0))
     except Exception:
         return None
 
-def photos_score(paths: List[str]) -> float:
-    scores = []
+def file_digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def bytes_digest(data: bytes) -> str:
+    # mesmo hash de file_digest: foto local e baixada dividem o cache de scores
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+_worker_buffers = None
+
+def _score_in_worker(path: str) -> Optional[float]:
+    # executado nos processos do pool: buffers alocados uma vez por processo
+    global _worker_buffers
+    if _worker_buffers is None:
+        _worker_buffers = _sobel_buffers(SIZE)
+    return photo_quality_score(path, _worker_buffers)
+
+def _score_bytes_in_worker(data: bytes) -> Optional[float]:
+    global _worker_buffers
+    if _worker_buffers is None:
+        _worker_buffers = _sobel_buffers(SIZE)
+    return photo_quality_score(io.BytesIO(data), _worker_buffers)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_cache: Optional[SQLiteCache] = None
+_lock = threading.Lock()
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool, _pool_workers = ProcessPoolExecutor(max_workers=workers), workers
+        return _pool
+
+def _get_cache(cfg: AppConfig) -> SQLiteCache:
+    global _cache
+    with _lock:
+        if _cache is None or _cache.path != cfg.photo_cache_path:
+            _cache = SQLiteCache(cfg.photo_cache_path, max_entries=cfg.photo_cache_max_entries)
+        return _cache
+
+def score_photos(paths: List[str],
+                 workers: Optional[int] = None,
+                 cache: Optional[SQLiteCache] = None,
+                 use_cache: bool = True,
+                 executor: Optional[Executor] = None) -> List[Optional[float]]:
+    """
+    Scores em lote, na ordem de `paths` (None para arquivo ausente/ilegível).
+    Consulta o cache pelo hash do conteúdo; fotos repetidas são calculadas uma
+    vez e as faltantes são distribuídas num pool de processos (o do módulo ou
+    `executor`, se informado).
+    """
+    cfg = AppConfig()
+    workers = cfg.photo_workers if workers is None else workers
+    if use_cache and cache is None:
+        cache = _get_cache(cfg)
+
+    keys: List[Optional[str]] = []
     for p in paths:
-        if p and os.path.exists(p):
-            sc = photo_quality_score(p)
-            if sc is not None:
-                scores.append(sc)
+        try:
+            keys.append(f"{SCORER_VERSION}:{file_digest(p)}" if p else None)
+        except OSError:
+            keys.append(None)
+
+    found = cache.get_many(k for k in keys if k) if use_cache else {}
+    todo = {}
+    for p, k in zip(paths, keys):
+        if k and k not in found and k not in todo:
+            todo[k] = p
+    if use_cache:
+        metrics.CACHE_REQUESTS.inc(len(found), cache="photo_score", result="hits")
+        metrics.CACHE_REQUESTS.inc(len(todo), cache="photo_score", result="misses")
+
+    if todo:
+        items = list(todo.items())
+        if executor is not None or (workers > 1 and len(items) > 1):
+            pool = executor or _get_pool(workers)
+            results = list(pool.map(_score_in_worker, [p for _, p in items]))
+        else:
+            buffers = _sobel_buffers(SIZE)
+            results = [photo_quality_score(p, buffers) for _, p in items]
+        fresh = {k: sc for (k, _), sc in zip(items, results)}
+        if use_cache:
+            cache.set_many(fresh)
+        found.update(fresh)
+
+    return [found.get(k) if k else None for k in keys]
+
+def score_urls(urls: List[str],
+               workers: Optional[int] = None,
+               cache: Optional[SQLiteCache] = None,
+               use_cache: bool = True,
+               executor: Optional[Executor] = None,
+               fetcher: Optional[PhotoFetcher] = None) -> List[Optional[float]]:
+    """
+    Scores das fotos remotas, na ordem de `urls` (None se o download falhar
+    ou a imagem for ilegível). Downloads concorrentes (app/vision/fetch.py);
+    cada foto vai para o score (cache pelo hash do conteúdo, pool de
+    processos) assim que chega, enquanto as outras ainda baixam.
+    """
+    cfg = AppConfig()
+    workers = cfg.photo_workers if workers is None else workers
+    if use_cache and cache is None:
+        cache = _get_cache(cfg)
+    fetcher = fetcher or get_fetcher(cfg)
+    uniq = list(dict.fromkeys(u for u in urls if u))
+    pool = executor or (_get_pool(workers) if workers > 1 and len(uniq) > 1 else None)
+    buffers = None
+
+    keys: Dict[str, str] = {}
+    found: Dict[str, Any] = {}
+    fresh: Dict[str, Any] = {}
+    running: Dict[str, Future] = {}
+    for i, data in fetcher.fetch_many(uniq):
+        if data is None:
+            continue
+        key = keys[uniq[i]] = f"{SCORER_VERSION}:{bytes_digest(data)}"
+        if key in found or key in fresh or key in running:
+            continue
+        hit = cache.get(key) if use_cache else None
+        if hit is not None:
+            found[key] = hit
+        elif pool is not None:
+            running[key] = pool.submit(_score_bytes_in_worker, data)
+        else:
+            buffers = buffers or _sobel_buffers(SIZE)
+            fresh[key] = photo_quality_score(io.BytesIO(data), buffers)
+    fresh.update((k, f.result()) for k, f in running.items())
+    if use_cache:
+        metrics.CACHE_REQUESTS.inc(len(found), cache="photo_score", result="hits")
+        metrics.CACHE_REQUESTS.inc(len(fresh), cache="photo_score", result="misses")
+        cache.set_many(fresh)
+    found.update(fresh)
+    return [found.get(keys.get(u)) if u else None for u in urls]
+
+def score_bytes(datas: List[bytes],
+                workers: Optional[int] = None,
+                cache: Optional[SQLiteCache] = None,
+                use_cache: bool = True,
+                executor: Optional[Executor] = None) -> List[Optional[float]]:
+    """
+    Scores de fotos já em memória (ex.: uploads), na ordem de `datas`, sem
+    gravar arquivos: mesmo cache pelo hash do conteúdo e mesmo pool de
+    `score_photos`.
+    """
+    cfg = AppConfig()
+    workers = cfg.photo_workers if workers is None else workers
+    if use_cache and cache is None:
+        cache = _get_cache(cfg)
+    keys = [f"{SCORER_VERSION}:{bytes_digest(d)}" for d in datas]
+    found = cache.get_many(keys) if use_cache else {}
+    todo = {}
+    for d, k in zip(datas, keys):
+        if k not in found and k not in todo:
+            todo[k] = d
+    if use_cache:
+        metrics.CACHE_REQUESTS.inc(len(found), cache="photo_score", result="hits")
+        metrics.CACHE_REQUESTS.inc(len(todo), cache="photo_score", result="misses")
+    if todo:
+        if executor is not None or (workers > 1 and len(todo) > 1):
+            pool = executor or _get_pool(workers)
+            results = list(pool.map(_score_bytes_in_worker, list(todo.values())))
+        else:
+            buffers = _sobel_buffers(SIZE)
+            results = [photo_quality_score(io.BytesIO(d), buffers) for d in todo.values()]
+        fresh = dict(zip(todo, results))
+        if use_cache:
+            cache.set_many(fresh)
+        found.update(fresh)
+    return [found.get(k) for k in keys]
+
+def photo_sources(photos) -> Tuple[List[str], List[str]]:
+    # (caminhos locais, URLs das fotos só remotas) de uma lista de PhotoInput
+    photos = photos or []
+    return [p.path for p in photos if p.path], [p.url for p in photos if not p.path and p.url]
+
+def _mean_score(scores: List[Optional[float]]) -> float:
+    scores = [sc for sc in scores if sc is not None]
     if not scores:
         return 0.5  # neutro
     return float(np.clip(sum(scores) / len(scores), 0.0, 1.0))
+
+def photos_score(paths: List[str], executor: Optional[Executor] = None,
+                 urls: Optional[List[str]] = None, images: Optional[List[bytes]] = None) -> float:
+    # média dos scores das fotos locais, das baixadas de `urls` e das já em memória (`images`)
+    valid = [p for p in paths if p and os.path.exists(p)]
+    scores = score_photos(valid, executor=executor)
+    if urls:
+        scores += score_urls(urls, executor=executor)
+    if images:
+        scores += score_bytes(images, executor=executor)
+    return _mean_score(scores)
+
+def photos_score_many(path_lists: List[List[str]],
+                      url_lists: Optional[List[List[str]]] = None) -> List[float]:
+    # vários imóveis num único lote (um pool/cache para todas as fotos, downloads juntos)
+    valid = [[p for p in paths if p and os.path.exists(p)] for paths in path_lists]
+    url_lists = url_lists or [[] for _ in path_lists]
+    flat = score_photos([p for paths in valid for p in paths])
+    remote = score_urls([u for urls in url_lists for u in urls]) if any(url_lists) else []
+    out, i, j = [], 0, 0
+    for paths, urls in zip(valid, url_lists):
+        out.append(_mean_score(flat[i:i + len(paths)] + remote[j:j + len(urls)]))
+        i += len(paths)
+        j += len(urls)
+    return out
@@ -0,0 +1,206 @@
+"""
+Download das fotos remotas (PhotoInput.url) para o score: requisições
+concorrentes numa sessão HTTP com pool keep-alive, no máximo
+`photo_fetch_per_host` por host ao mesmo tempo, corpo lido em fluxo para a
+memória (sem arquivo temporário) e cortado em `photo_max_bytes`. Os bytes
+ficam num cache SQLite por URL; passado `photo_fetch_ttl_s`, a URL é
+revalidada pelo ETag/Last-Modified guardado (304 = usa os bytes do cache).
+
+As URLs vêm do cliente: só hosts de `photo_fetch_allowed_hosts` (quando
+definido) ou, sem lista, hosts que resolvem só para endereços públicos
+(nada de loopback, rede privada ou link-local); nesse caso a conexão vai
+para o endereço verificado (o DNS não é consultado de novo ao conectar).
+Redirecionamentos são seguidos um a um (até MAX_REDIRECTS), com a mesma
+verificação a cada salto.
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urljoin, urlsplit
+import base64, ipaddress, socket, threading, time
+import requests
+from requests.adapters import HTTPAdapter
+from app.config import AppConfig
+from app.utils.cache import SQLiteCache
+from app.utils import metrics
+
+CHUNK = 64 * 1024
+MAX_REDIRECTS = 3
+
+class TooLarge(Exception):
+    pass
+
+class Blocked(Exception):
+    pass
+
+def _host_allowed(host: str, allowed: List[str]) -> bool:
+    # "cdn.portal.com.br" (exato) ou "*.portal.com.br" (subdomínios)
+    return any(host == h or (h.startswith("*.") and host.endswith(h[1:])) for h in allowed)
+
+def _is_public(addr: str) -> bool:
+    return ipaddress.ip_address(addr.split("%")[0]).is_global
+
+def _public_address(host: str, port: int) -> Optional[str]:
+    # um endereço do host, se todos os que ele resolve forem públicos (globais)
+    try:
+        infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return None
+    addrs = [i[4][0] for i in infos]
+    return addrs[0] if addrs and all(_is_public(a) for a in addrs) else None
+
+class _PinnedAdapter(HTTPAdapter):
+    """
+    Resolve e verifica o host na hora de escolher a conexão e conecta no IP
+    verificado (SNI e certificado continuam pelo nome): um DNS que muda de
+    resposta entre a verificação e a conexão não leva a um endereço interno.
+    """
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        host, scheme = host_params["host"], host_params["scheme"]
+        addr = _public_address(host, host_params["port"] or (443 if scheme == "https" else 80))
+        if addr is None:
+            raise Blocked(request.url)
+        if scheme == "https":
+            pool_kwargs["server_hostname"] = host
+            pool_kwargs["assert_hostname"] = host
+        return dict(host_params, host=addr), pool_kwargs
+
+    def add_headers(self, request, **kwargs):
+        # a conexão é com o IP: Host continua sendo o nome da URL
+        request.headers["Host"] = urlsplit(request.url).netloc.rpartition("@")[2]
+
+class PhotoFetcher:
+    """
+    Baixa fotos por URL (http/https). `fetch` devolve os bytes ou None (erro,
+    resposta fora de 2xx/304, acima do limite); `fetch_many` devolve cada foto
+    assim que chega, para o score começar antes do fim dos downloads.
+    """
+
+    def __init__(self, cfg: Optional[AppConfig] = None, cache: Optional[SQLiteCache] = None):
+        cfg = cfg or AppConfig()
+        self.timeout_s = cfg.photo_fetch_timeout_s
+        self.max_bytes = cfg.photo_max_bytes
+        self.ttl_s = cfg.photo_fetch_ttl_s
+        self.per_host = cfg.photo_fetch_per_host
+        self.allowed_hosts = [h.lower() for h in cfg.photo_fetch_allowed_hosts]
+        if cache is None and cfg.photo_fetch_cache_path:
+            cache = SQLiteCache(cfg.photo_fetch_cache_path, max_entries=cfg.photo_fetch_cache_max_entries,
+                                max_bytes=cfg.photo_fetch_cache_max_bytes)
+        self.cache = cache
+        self.session = requests.Session()
+        # conexões por host no máximo iguais ao limite de downloads simultâneos por host;
+        # sem lista de hosts, conexão presa ao endereço público verificado
+        adapter_cls = HTTPAdapter if self.allowed_hosts else _PinnedAdapter
+        adapter = adapter_cls(pool_connections=32, pool_maxsize=self.per_host, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=cfg.photo_fetch_workers, thread_name_prefix="photo-fetch")
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return sem
+
+    def check_url(self, url: str) -> None:
+        # levanta Blocked se a URL não pode ser buscada (esquema, host, endereço)
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise Blocked(url)
+        host = parts.hostname.lower()
+        if self.allowed_hosts:
+            if not _host_allowed(host, self.allowed_hosts):
+                raise Blocked(url)
+        elif _public_address(host, parts.port or (443 if parts.scheme == "https" else 80)) is None:
+            raise Blocked(url)
+
+    @contextmanager
+    def _get(self, url: str, headers: Dict[str, str]) -> Iterator[requests.Response]:
+        # GET em fluxo seguindo redirecionamentos à mão, verificando cada destino;
+        # a vaga do host fica ocupada até o corpo ser lido (fim do `with`)
+        for _ in range(MAX_REDIRECTS + 1):
+            self.check_url(url)
+            with self._host_slot(url):
+                resp = self.session.get(url, headers=headers, timeout=self.timeout_s, stream=True,
+                                        allow_redirects=False)
+                if not resp.is_redirect:
+                    with resp:
+                        yield resp
+                    return
+                resp.close()
+            url = urljoin(url, resp.headers["Location"])
+        raise Blocked("redirecionamentos demais")
+
+    def _read(self, resp: requests.Response) -> bytes:
+        # corpo em fluxo até o limite (Content-Length pode faltar ou mentir)
+        size = resp.headers.get("Content-Length")
+        if size and size.isdigit() and int(size) > self.max_bytes:
+            raise TooLarge(size)
+        buf = bytearray()
+        for chunk in resp.iter_content(CHUNK):
+            buf += chunk
+            if len(buf) > self.max_bytes:
+                raise TooLarge(len(buf))
+        return bytes(buf)
+
+    def _download(self, url: str) -> Tuple[Optional[bytes], str]:
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and time.time() - cached["stored_at"] < self.ttl_s:
+            return base64.b64decode(cached["data"]), "cached"
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        with self._get(url, headers) as resp:
+            if resp.status_code == 304 and cached is not None:
+                self.cache.set(url, dict(cached, stored_at=time.time()))
+                return base64.b64decode(cached["data"]), "revalidated"
+            resp.raise_for_status()
+            data = self._read(resp)
+            etag, modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        if self.cache is not None:
+            self.cache.set(url, {"etag": etag, "last_modified": modified, "stored_at": time.time(),
+                                 "data": base64.b64encode(data).decode("ascii")})
+        return data, "downloaded"
+
+    def fetch(self, url: str) -> Optional[bytes]:
+        try:
+            self.check_url(url)
+            data, status = self._download(url)
+        except Blocked:
+            data, status = None, "blocked"
+        except TooLarge:
+            data, status = None, "too_large"
+        except Exception:
+            data, status = None, "failed"
+        metrics.PHOTO_FETCHES.inc(status=status)
+        return data
+
+    def fetch_many(self, urls: List[str]) -> Iterator[Tuple[int, Optional[bytes]]]:
+        # (posição em urls, bytes ou None), na ordem em que os downloads terminam
+        futures = {self._executor.submit(self.fetch, u): i for i, u in enumerate(urls)}
+        for fut in as_completed(futures):
+            yield futures[fut], fut.result()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+_fetcher: Optional[PhotoFetcher] = None
+_lock = threading.Lock()
+
+def get_fetcher(cfg: Optional[AppConfig] = None) -> PhotoFetcher:
+    # um fetcher (sessão, pool de threads, cache) por processo
+    global _fetcher
+    with _lock:
+        if _fetcher is None:
+            _fetcher = PhotoFetcher(cfg)
+        return _fetcher
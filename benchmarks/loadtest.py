@@ -0,0 +1,254 @@
+"""
+Teste de carga de POST /assess em malha aberta: pedidos disparados na taxa
+alvo (--rps) por --duration segundos, sem esperar os anteriores, com
+latência medida a partir do instante programado (a fila do próprio gerador
+entra na conta). Relatório em JSON: p50/p95/p99, taxa alcançada, erros por
+tipo (429 do limite de admissão, 5xx, timeout/conexão), X-Cache e fontes
+que falharam dentro das respostas.
+
+Sem --url, sobe tudo localmente (sem rede externa): os substitutos dos
+portais (benchmarks/standin.py) e a API (uvicorn, com `create_app`
+apontando OLX/Viva Real/Zap para eles e o cache de buscas com
+--search-cache-ttl, padrão 0 = toda avaliação consulta os portais).
+
+Uso:
+  python -m benchmarks.loadtest --rps 20 --duration 30 --latency-ms 80 --error-rate 0.02 --out load.json
+  python -m benchmarks.loadtest --url http://127.0.0.1:8000 --rps 50 --duration 60 --payloads 200
+"""
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import requests
+from app.config import AppConfig, CITY_CENTERS
+
+# configuração da API de teste (create_app), passada pelo ambiente ao uvicorn
+ENV_PORTALS = "LOADTEST_PORTAL_URLS"
+ENV_CACHE_TTL = "LOADTEST_SEARCH_CACHE_TTL"
+
+def create_app():
+    """
+    App FastAPI com os portais de LOADTEST_PORTAL_URLS (JSON nome -> URL) e
+    o cache de buscas só em memória, com TTL LOADTEST_SEARCH_CACHE_TTL.
+    Uso: uvicorn --factory benchmarks.loadtest:create_app
+    """
+    from app.comps import aggregator
+    from app.comps.cache import SearchCache
+    from app.main import app
+    cfg = AppConfig(portal_urls=json.loads(os.environ.get(ENV_PORTALS, "{}")),
+                    connector_cache_ttl_s=float(os.environ.get(ENV_CACHE_TTL, "0")),
+                    connector_cache_path=None)
+    aggregator.SEARCH_CACHE = SearchCache(cfg.connector_cache_ttl_s, max_entries=cfg.connector_cache_max_entries)
+    aggregator.CONNECTORS = aggregator.build_connectors(cfg, aggregator.SEARCH_CACHE)
+    return app
+
+def make_payloads(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    # imóveis variados (cidade, áreas, atributos industriais) como os da base sintética
+    rng = np.random.default_rng(seed)
+    cities = list(CITY_CENTERS)
+    out = []
+    for i in range(n):
+        area = float(np.clip(np.round(rng.lognormal(np.log(2500.0), 0.6)), 300, 40000))
+        out.append({
+            "address": f"Rua Sintética {int(rng.integers(0, 997))}",
+            "city": cities[int(rng.integers(0, len(cities)))], "state": "MG",
+            "property_type": "galpao",
+            "built_area_m2": area,
+            "land_area_m2": round(area * float(rng.uniform(1.2, 2.5))),
+            "ceiling_height_m": round(float(rng.uniform(6.0, 14.0)), 1),
+            "dock_doors": int(rng.integers(0, 12)),
+        })
+    return out
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None, "mean_ms": None}
+    v = np.asarray(values) * 1000.0
+    p50, p95, p99 = np.percentile(v, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(v.max()), 2), "mean_ms": round(float(v.mean()), 2)}
+
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency_ok: List[float] = []
+        self.latency_all: List[float] = []
+        self.status: Dict[str, int] = {}
+        self.x_cache: Dict[str, int] = {}
+        self.sources: Dict[str, Dict[str, int]] = {}
+
+    def add(self, latency: float, status: str, x_cache: Optional[str] = None,
+            sources: Optional[Dict[str, List[str]]] = None) -> None:
+        with self.lock:
+            self.latency_all.append(latency)
+            if status == "200":
+                self.latency_ok.append(latency)
+            self.status[status] = self.status.get(status, 0) + 1
+            if x_cache:
+                self.x_cache[x_cache] = self.x_cache.get(x_cache, 0) + 1
+            for kind, names in (sources or {}).items():
+                for name in names:
+                    s = self.sources.setdefault(name, {})
+                    s[kind] = s.get(kind, 0) + 1
+
+def run_load(url: str, rps: float, duration: float, payloads: List[Dict[str, Any]],
+             concurrency: int = 256, timeout_s: float = 30.0, seed: int = 0,
+             shuffle: bool = True) -> Dict[str, Any]:
+    """
+    Dispara POST {url}/assess a `rps` por `duration` s (malha aberta, até
+    `concurrency` em voo; o excedente espera e a espera conta na latência).
+    Imóveis sorteados de `payloads` ou, sem `shuffle`, em ordem.
+    """
+    rec = _Recorder()
+    local = threading.local()
+    rng = np.random.default_rng(seed)
+    n = int(rps * duration)
+    order = rng.integers(0, len(payloads), n) if shuffle else np.arange(n) % len(payloads)
+
+    def session() -> requests.Session:
+        # uma sessão keep-alive por thread do gerador
+        if not hasattr(local, "s"):
+            local.s = requests.Session()
+        return local.s
+
+    def one(scheduled: float, payload: Dict[str, Any]) -> None:
+        try:
+            resp = session().post(f"{url}/assess", json=payload, timeout=timeout_s)
+        except requests.Timeout:
+            rec.add(time.perf_counter() - scheduled, "timeout")
+            return
+        except requests.RequestException:
+            rec.add(time.perf_counter() - scheduled, "connection_error")
+            return
+        sources = None
+        if resp.status_code == 200:
+            sources = resp.json().get("explainability", {}).get("sources")
+        rec.add(time.perf_counter() - scheduled, str(resp.status_code), resp.headers.get("X-Cache"), sources)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as pool:
+        for i in range(n):
+            scheduled = start + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, scheduled, payloads[order[i]])
+        sent = time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+
+    total = len(rec.latency_all)
+    errors = total - rec.status.get("200", 0)
+    return {
+        "target_rps": rps, "duration_s": duration, "requests": total,
+        # taxa de disparo (o gerador deu conta?) e tempo até a última resposta
+        "achieved_rps": round(n / sent, 2) if sent else None, "wall_s": round(elapsed, 2),
+        "ok": rec.status.get("200", 0), "errors": errors,
+        "error_rate": round(errors / total, 4) if total else None,
+        "status": dict(sorted(rec.status.items())),
+        "latency_ok": percentiles(rec.latency_ok),
+        "latency_all": percentiles(rec.latency_all),
+        "x_cache": rec.x_cache,
+        "connector_sources": rec.sources,
+    }
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout_s: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"processo saiu antes de responder ({url}), código {proc.returncode}")
+        try:
+            requests.get(url, timeout=1.0)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"sem resposta de {url} em {timeout_s:.0f} s")
+
+def _spawn(args) -> List[subprocess.Popen]:
+    # substitutos dos portais + API apontando para eles (processos separados do gerador)
+    procs = []
+    standin = [sys.executable, "-m", "benchmarks.standin", "--port", str(args.standin_port),
+               "--listings", str(args.listings), "--latency-ms", str(args.latency_ms),
+               "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate),
+               "--hang-rate", str(args.hang_rate), "--hang-s", str(args.hang_s)]
+    procs.append(subprocess.Popen(standin, stdout=subprocess.DEVNULL))
+    base = f"http://127.0.0.1:{args.standin_port}"
+    _wait_ready(f"{base}/health", procs[-1])
+
+    env = dict(os.environ)
+    env[ENV_PORTALS] = json.dumps({p: f"{base}/{p}" for p in ("olx", "vivareal", "zap")})
+    env[ENV_CACHE_TTL] = str(args.search_cache_ttl)
+    api = [sys.executable, "-m", "uvicorn", "--factory", "benchmarks.loadtest:create_app",
+           "--host", "127.0.0.1", "--port", str(args.api_port), "--workers", str(args.workers),
+           "--log-level", "warning", "--no-access-log"]
+    procs.append(subprocess.Popen(api, env=env))
+    _wait_ready(f"http://127.0.0.1:{args.api_port}/metrics", procs[-1])
+    return procs
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="API já no ar (sem isso, sobe substitutos e API locais)")
+    ap.add_argument("--rps", type=float, default=20.0, help="pedidos por segundo (alvo)")
+    ap.add_argument("--duration", type=float, default=30.0, help="segundos de carga")
+    ap.add_argument("--warmup", type=float, default=0.0, help="segundos de carga antes, fora do relatório")
+    ap.add_argument("--payloads", type=int, default=0,
+                    help="imóveis distintos sorteados (0 = um por pedido; poucos = acertos no cache de resultados)")
+    ap.add_argument("--concurrency", type=int, default=256, help="pedidos em voo no máximo")
+    ap.add_argument("--timeout", type=float, default=30.0, help="timeout por pedido (s)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="grava o relatório JSON também aqui")
+    local = ap.add_argument_group("API e substitutos locais (sem --url)")
+    local.add_argument("--api-port", type=int, default=8901)
+    local.add_argument("--workers", type=int, default=1, help="processos do uvicorn")
+    local.add_argument("--standin-port", type=int, default=8900)
+    local.add_argument("--listings", type=int, default=2000, help="anúncios por portal")
+    local.add_argument("--latency-ms", type=float, default=80.0)
+    local.add_argument("--jitter-ms", type=float, default=30.0)
+    local.add_argument("--error-rate", type=float, default=0.0)
+    local.add_argument("--hang-rate", type=float, default=0.0)
+    local.add_argument("--hang-s", type=float, default=30.0)
+    local.add_argument("--search-cache-ttl", type=float, default=0.0, help="TTL do cache de buscas da API (s)")
+    args = ap.parse_args()
+
+    procs: List[subprocess.Popen] = []
+    try:
+        url = args.url
+        if not url:
+            procs = _spawn(args)
+            url = f"http://127.0.0.1:{args.api_port}"
+        url = url.rstrip("/")
+        shuffle = args.payloads > 0
+        warm = int(args.rps * args.warmup)
+        payloads = make_payloads(args.payloads or warm + max(int(args.rps * args.duration), 1), args.seed)
+        if warm:
+            run_load(url, args.rps, args.warmup, payloads if shuffle else payloads[:warm],
+                     args.concurrency, args.timeout, args.seed + 1, shuffle)
+        report = run_load(url, args.rps, args.duration, payloads if shuffle else payloads[warm:],
+                          args.concurrency, args.timeout, args.seed, shuffle)
+        if procs:
+            report["setup"] = {k: getattr(args, k) for k in ("workers", "listings", "latency_ms", "jitter_ms",
+                                                              "error_rate", "hang_rate", "search_cache_ttl")}
+    finally:
+        for p in procs[::-1]:
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    lat = report["latency_ok"]
+    print(f"{report['requests']} pedidos a {report['achieved_rps']}/s; erros {report['error_rate'] or 0:.2%}; "
+          f"p50 {lat['p50_ms']} ms, p95 {lat['p95_ms']} ms, p99 {lat['p99_ms']} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Benchmarks repetíveis sobre dados sintéticos (benchmarks/synthetic.py):
+get_comps, filter_comps, estimate_from_comps, photos_score, render_html,
+assess de ponta a ponta e uma grade what-if de 1.000 pontos, para cada tamanho de base de comps.
+
+Resultados vão para um JSON (--out); com --baseline, cada caso é comparado
+com a linha de base salva e o processo sai com código 1 se algum ficar mais
+lento que a tolerância (ex.: antes do deploy).
+
+Uso:
+  python -m benchmarks.run --sizes 1000,10000 --out bench_results.json
+  python -m benchmarks.run --sizes 1000,10000 --save-baseline benchmarks/baseline.json
+  python -m benchmarks.run --sizes 1000,10000 --baseline benchmarks/baseline.json --tolerance 0.25
+"""
+from typing import Callable, Dict, Any, List, Optional
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from app.comps import aggregator
+from app.comps.aggregator import get_comps
+from app.comps.connectors.sample import SampleConnector
+from app.comps.store import CompStore
+from app.comps.table import CompTable
+from app.config import CITY_CENTERS
+from app.model.hedonic import estimate_from_comps
+from app.pricing.assessor import assess
+from app.pricing.whatif import sweep
+from app.report.html import render_html, report_context
+from app.utils.filters import filter_comps
+from app.vision.features import photos_score, score_photos
+from benchmarks.synthetic import write_listings, write_photos
+
+CITY = "Contagem"
+QUERY = {"city": CITY, "state": "MG", "country": "BR", "property_type": "galpao"}
+SUBJECT = {"address": "Av. João César de Oliveira, 3000", "city": CITY, "state": "MG",
+           "country": "BR", "property_type": "galpao", "built_area_m2": 2500.0, "photos": []}
+
+def measure(fn: Callable[[], Any], min_time: float = 0.5, max_runs: int = 50) -> Dict[str, Any]:
+    # uma chamada de aquecimento; depois repete até min_time (mín. 3 execuções)
+    fn()
+    runs: List[float] = []
+    start = time.perf_counter()
+    while len(runs) < max_runs and (len(runs) < 3 or time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return {"median_s": statistics.median(runs), "min_s": min(runs), "runs": len(runs)}
+
+def measure_once(fn: Callable[[], Any]) -> Dict[str, Any]:
+    # para o que só faz sentido a frio (carga de base)
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    return {"median_s": dt, "min_s": dt, "runs": 1}
+
+@contextmanager
+def sample_only(path: str):
+    # só o conector de amostra, apontando para a base sintética (sem stubs/cache)
+    saved = aggregator.CONNECTORS
+    aggregator.CONNECTORS = [SampleConnector(path)]
+    try:
+        yield
+    finally:
+        aggregator.CONNECTORS = saved
+
+def bench_size(n: int, workdir: str, min_time: float) -> Dict[str, Dict[str, Any]]:
+    path = write_listings(os.path.join(workdir, f"listings_{n}.json"), n)
+    lat, lon = CITY_CENTERS[CITY]
+    out: Dict[str, Dict[str, Any]] = {}
+
+    out["load_store"] = measure_once(lambda: CompStore.from_json(path))
+    snap = os.path.join(workdir, f"snapshot_{n}")
+    CompStore.from_json(path).table.save(snap)
+    out["open_snapshot"] = measure(lambda: CompTable.open(snap), min_time)
+
+    with sample_only(path):
+        out["get_comps"] = measure(lambda: get_comps(QUERY, lat, lon, 35.0), min_time)
+        comps = get_comps(QUERY, lat, lon, 35.0)
+        out["filter_comps"] = measure(
+            lambda: filter_comps(comps, property_type="galpao", min_built=1250.0, max_built=5000.0), min_time)
+        rental = [c for c in filter_comps(comps, "galpao", 1250.0, 5000.0) if c.get("is_rental") is True]
+        out["estimate_from_comps"] = measure(
+            lambda: estimate_from_comps({"built_area_m2": 2500.0}, rental, 0.12, 0.10, 1.0), min_time)
+        out["assess"] = measure(lambda: assess(dict(SUBJECT)), min_time)
+        # grade 10×10×10 dos alphas: deve custar perto de um assess
+        grid = [list(np.linspace(0.0, 0.5, 10)), list(np.linspace(0.0, 0.3, 10)), list(np.linspace(0.0, 2.0, 10))]
+        out["whatif_1000"] = measure(lambda: sweep(dict(SUBJECT), *grid), min_time)
+        res = assess(dict(SUBJECT))
+        ctx = report_context(res, "galpao", 2500.0)
+        out["render_html"] = measure(lambda: render_html(ctx), min_time)
+    out["comps_in_radius"] = {"count": len(comps)}
+    return out
+
+def bench_photos(workdir: str, min_time: float, n: int = 4) -> Dict[str, Dict[str, Any]]:
+    paths = write_photos(os.path.join(workdir, "photos"), n)
+    return {
+        # sem cache, um processo: custo do scoring em si (por lote de n fotos)
+        "photos_score_cold": measure(lambda: score_photos(paths, workers=1, use_cache=False), min_time),
+        # caminho da API: hash do conteúdo + cache persistente já aquecido
+        "photos_score": measure(lambda: photos_score(paths), min_time),
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes: List[int], min_time: float = 0.5, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        if not only or any(o.startswith("photos") for o in only):
+            results.update(bench_photos(workdir, min_time))
+        for n in sizes:
+            for case, r in bench_size(n, workdir, min_time).items():
+                results[f"{case}[n={n}]"] = r
+    if only:
+        results = {k: v for k, v in results.items() if any(k.startswith(o) for o in only)}
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Razão mediana_atual / mediana_base por caso presente nos dois arquivos;
+    `regression` quando a razão passa de 1 + tolerance.
+    """
+    rows = []
+    for case, cur in current["results"].items():
+        base = baseline.get("results", {}).get(case)
+        if not base or "median_s" not in cur or "median_s" not in base:
+            continue
+        ratio = cur["median_s"] / base["median_s"] if base["median_s"] > 0 else float("inf")
+        rows.append({"case": case, "baseline_s": base["median_s"], "current_s": cur["median_s"],
+                     "ratio": ratio, "regression": ratio > 1.0 + tolerance})
+    return rows
+
+def _print_results(results: Dict[str, Dict[str, Any]]) -> None:
+    for case, r in results.items():
+        if "median_s" in r:
+            print(f"{case:40s} {r['median_s']*1000:12.3f} ms  (mín {r['min_s']*1000:.3f}, {r['runs']} execuções)")
+        else:
+            print(f"{case:40s} {r}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000", help="tamanhos da base de comps, separados por vírgula")
+    ap.add_argument("--only", default="", help="prefixos de casos, separados por vírgula (ex.: assess,get_comps)")
+    ap.add_argument("--min-time", type=float, default=0.5, help="tempo mínimo de medição por caso (s)")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--baseline", help="JSON de linha de base para comparar")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="lentidão aceita sobre a base (0.25 = +25%%)")
+    ap.add_argument("--save-baseline", help="grava também os resultados como nova linha de base")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    only = [o.strip() for o in args.only.split(",") if o.strip()]
+    current = run(sizes, args.min_time, only)
+    _print_results(current["results"])
+    for path in filter(None, [args.out, args.save_baseline]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"resultados em {path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.tolerance)
+        print(f"\ncomparação com {args.baseline} (tolerância +{args.tolerance:.0%}):")
+        for r in rows:
+            flag = "REGRESSÃO" if r["regression"] else "ok"
+            print(f"{r['case']:40s} {r['baseline_s']*1000:10.3f} → {r['current_s']*1000:10.3f} ms  "
+                  f"{r['ratio']:6.2f}x  {flag}")
+        if any(r["regression"] for r in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Substitutos locais das buscas dos portais (OLX, Viva Real, Zap) para testes
+de carga sem rede: um servidor HTTP/1.1 (keep-alive) que responde
+GET /{portal}/search?city=&state=&property_type= com anúncios sintéticos
+(benchmarks/synthetic.py, uma base por portal) no formato que
+app/comps/connectors/http_portal.py espera: {"listings": [...]}.
+
+Cada resposta espera uma latência normal (--latency-ms ± --jitter-ms); uma
+fração falha com 503 (--error-rate) e outra fica pendurada por --hang-s antes
+de responder (--hang-rate), para exercitar timeout e disjuntor. Uma fração dos
+anúncios de cada portal repete os do primeiro (--overlap), como o mesmo
+galpão anunciado em mais de um portal.
+
+Uso:
+  python -m benchmarks.standin --port 8900 --listings 2000 --latency-ms 80 --jitter-ms 30 --error-rate 0.02
+  (conector: AppConfig(portal_urls={"olx": "http://127.0.0.1:8900/olx", ...}))
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import json
+import random
+import threading
+import time
+import numpy as np
+from app.geo.gazetteer import normalize
+from benchmarks.synthetic import generate_listings
+
+PORTALS = ("olx", "vivareal", "zap")
+
+def portal_listings(portals=PORTALS, n: int = 2000, seed: int = 0,
+                    overlap: float = 0.1) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    `n` anúncios por portal (bases independentes, ids e URLs próprios); nos
+    portais depois do primeiro, uma fração `overlap` é cópia de anúncios dele.
+    """
+    rng = np.random.default_rng(seed)
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for i, portal in enumerate(portals):
+        items = generate_listings(n, seed + i + 1)
+        for j, it in enumerate(items):
+            it.update(id=f"{portal}{j}", source=portal, url=f"https://{portal}.example/anuncio/{j}")
+        if i and overlap > 0:
+            first = out[portals[0]]
+            for j in rng.choice(n, int(n * overlap), replace=False):
+                items[j] = dict(first[j], id=f"{portal}{j}", source=portal,
+                                url=f"https://{portal}.example/anuncio/{j}")
+        out[portal] = items
+    return out
+
+class StandIn:
+    """
+    Anúncios por portal e o comportamento simulado. As respostas por
+    (portal, cidade, tipo) são serializadas uma vez e reaproveitadas.
+    """
+
+    def __init__(self, listings: Dict[str, List[Dict[str, Any]]], latency_ms: float = 80.0,
+                 jitter_ms: float = 30.0, error_rate: float = 0.0, hang_rate: float = 0.0,
+                 hang_s: float = 30.0, seed: Optional[int] = None):
+        self.listings = listings
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self._rng = random.Random(seed)
+        self._bodies: Dict[Tuple[str, str, str], bytes] = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "hangs": 0}
+
+    def body(self, portal: str, city: str, property_type: str) -> bytes:
+        key = (portal, normalize(city), property_type.strip().casefold())
+        hit = self._bodies.get(key)
+        if hit is None:
+            items = [it for it in self.listings[portal]
+                     if (not key[1] or normalize(it["city"]) == key[1])
+                     and (not key[2] or it["property_type"] == key[2])]
+            hit = json.dumps({"listings": items}, ensure_ascii=False).encode("utf-8")
+            with self._lock:
+                self._bodies[key] = hit
+        return hit
+
+    def outcome(self) -> Tuple[float, str]:
+        # (espera em s, "ok" | "error" | "hang")
+        with self._lock:
+            self.stats["requests"] += 1
+            u = self._rng.random()
+            delay = max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+            if u < self.error_rate:
+                self.stats["errors"] += 1
+                return delay, "error"
+            if u < self.error_rate + self.hang_rate:
+                self.stats["hangs"] += 1
+                return self.hang_s, "hang"
+        return delay, "ok"
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: o conector reaproveita as conexões
+    standin: StandIn
+
+    def _send(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts == ["health"]:
+            return self._send(200, b'{"ok": true}')
+        if len(parts) != 2 or parts[1] != "search" or parts[0] not in self.standin.listings:
+            return self._send(404, b'{"error": "not found"}')
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        delay, status = self.standin.outcome()
+        time.sleep(delay)
+        if status == "error":
+            return self._send(503, b'{"error": "unavailable"}')
+        self._send(200, self.standin.body(parts[0], q.get("city", ""), q.get("property_type", "")))
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(standin: StandIn, host: str = "127.0.0.1", port: int = 8900) -> ThreadingHTTPServer:
+    # servidor pronto (chamar serve_forever, numa thread se for o caso)
+    handler = type("StandInHandler", (_Handler,), {"standin": standin})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--portals", default=",".join(PORTALS), help="portais servidos, separados por vírgula")
+    ap.add_argument("--listings", type=int, default=2000, help="anúncios por portal")
+    ap.add_argument("--overlap", type=float, default=0.1, help="fração repetida do primeiro portal")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--latency-ms", type=float, default=80.0)
+    ap.add_argument("--jitter-ms", type=float, default=30.0, help="desvio-padrão da latência")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas 503")
+    ap.add_argument("--hang-rate", type=float, default=0.0, help="fração de respostas que demoram --hang-s")
+    ap.add_argument("--hang-s", type=float, default=30.0)
+    args = ap.parse_args()
+
+    portals = tuple(p.strip() for p in args.portals.split(",") if p.strip())
+    standin = StandIn(portal_listings(portals, args.listings, args.seed, args.overlap),
+                      args.latency_ms, args.jitter_ms, args.error_rate, args.hang_rate, args.hang_s, args.seed)
+    server = serve(standin, args.host, args.port)
+    print(f"substitutos em http://{args.host}:{args.port}/{{{','.join(portals)}}}/search", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Gerador de anúncios sintéticos de galpões em torno de CITY_CENTERS, para
+benchmarks. Distribuições aproximadas do mercado da RMBH:
+  - área construída log-normal (mediana ~2.500 m², 200 a 60.000 m²);
+  - aluguel ~R$ 20–35/m² por cidade, com desconto para áreas maiores;
+  - venda ~ aluguel × 12 / yield (yield 7,5–10% a.a.);
+  - datas nos últimos 24 meses, mais densas nos recentes;
+  - posição normal em torno do centro da cidade (σ ~6 km).
+Alguns anúncios vêm sem coordenadas ou sem preço por m² (só total), como
+nos portais.
+
+Uso: python -m benchmarks.synthetic --n 100000 --out /tmp/listings.json
+"""
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import numpy as np
+from PIL import Image
+from app.config import CITY_CENTERS
+
+# aluguel mediano (R$/m²/mês) por cidade
+RENT_PM2 = {
+    "Belo Horizonte": 32.0, "Contagem": 28.0, "Betim": 25.0,
+    "Vespasiano": 26.0, "Santa Luzia": 23.0, "Lagoa Santa": 27.0,
+}
+KM_PER_DEG = 111.0
+
+def generate_listings(n: int, seed: int = 0,
+                      cities: Optional[Dict[str, tuple]] = None,
+                      now: Optional[datetime] = None,
+                      rental_share: float = 0.65,
+                      missing_geo: float = 0.03,
+                      total_only: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    `n` anúncios no formato de STANDARD_FIELDS (property_type "galpao").
+    Determinístico para o mesmo `seed` e `now`.
+    """
+    rng = np.random.default_rng(seed)
+    cities = cities or CITY_CENTERS
+    names = list(cities)
+    now = now or datetime(2025, 8, 1)
+
+    city = rng.integers(0, len(names), n)
+    centers = np.array([cities[c] for c in names])
+    sigma_deg = 6.0 / KM_PER_DEG
+    lat = centers[city, 0] + rng.normal(0.0, sigma_deg, n)
+    lon = centers[city, 1] + rng.normal(0.0, sigma_deg, n) / np.cos(np.radians(centers[city, 0]))
+    area = np.clip(np.round(rng.lognormal(np.log(2500.0), 0.7, n)), 200, 60000)
+    land = np.round(area * rng.uniform(1.2, 2.5, n))
+    rent_base = np.array([RENT_PM2.get(c, 25.0) for c in names])[city]
+    # áreas grandes saem mais baratas por m² (elasticidade ~ -0,1)
+    rent_pm2 = rent_base * (area / 2500.0) ** -0.1 * rng.lognormal(0.0, 0.12, n)
+    yield_aa = rng.uniform(0.075, 0.10, n)
+    is_rental = rng.random(n) < rental_share
+    ppm2 = np.where(is_rental, rent_pm2, rent_pm2 * 12.0 / yield_aa)
+    days = np.minimum(rng.exponential(180.0, n), 730).astype(int)
+    no_geo = rng.random(n) < missing_geo
+    no_pm2 = rng.random(n) < total_only
+    docks = rng.integers(0, 12, n)
+    ceiling = np.round(rng.uniform(6.0, 14.0, n), 1)
+
+    out = []
+    for i in range(n):
+        c = names[city[i]]
+        pm2 = round(float(ppm2[i]), 2)
+        out.append({
+            "id": f"syn{i}",
+            "title": f"Galpão {'para alugar' if is_rental[i] else 'à venda'} em {c}",
+            "address": f"Rua Sintética {i % 997}",
+            "city": c, "state": "MG",
+            "lat": None if no_geo[i] else round(float(lat[i]), 6),
+            "lon": None if no_geo[i] else round(float(lon[i]), 6),
+            "url": f"https://example.com/syn{i}",
+            "source": "synthetic",
+            "property_type": "galpao",
+            "built_area_m2": float(area[i]),
+            "land_area_m2": float(land[i]),
+            "bedrooms": 0, "bathrooms": int(1 + area[i] // 2000), "parking": int(2 + area[i] // 1000),
+            "is_rental": bool(is_rental[i]),
+            "price_total": round(pm2 * float(area[i]), 2),
+            "price_per_m2": None if no_pm2[i] else pm2,
+            "date_posted": (now - timedelta(days=int(days[i]))).strftime("%Y-%m-%d"),
+            "extras": {"docks": int(docks[i]), "ceiling": float(ceiling[i])},
+        })
+    return out
+
+def write_listings(path: str, n: int, seed: int = 0) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(generate_listings(n, seed), f, ensure_ascii=False)
+    return path
+
+def synthetic_photo(rng: np.random.Generator, size: int) -> Image.Image:
+    # gradiente suave + ruído + blocos (bordas nítidas)
+    y, x = np.mgrid[0:size, 0:size]
+    base = (x + y) / (2.0 * size) * 180.0
+    noise = rng.normal(0.0, 4.0, (size, size))
+    blocks = ((x // 64 + y // 64) % 2) * 20.0
+    arr = np.clip(base + noise + blocks, 0, 255).astype(np.uint8)
+    return Image.fromarray(np.stack([arr] * 3, axis=-1), mode="RGB")
+
+def write_photos(directory: str, n: int, size: int = 1024, seed: int = 0) -> List[str]:
+    # JPEGs sintéticos (maiores que SIZE, para exercitar o draft/resize)
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(n):
+        p = os.path.join(directory, f"photo_{i}.jpg")
+        synthetic_photo(rng, size).save(p, quality=90)
+        paths.append(p)
+    return paths
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=10_000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+    write_listings(args.out, args.n, args.seed)
+    print(f"{args.n} anúncios em {args.out}")
+
+if __name__ == "__main__":
+    main()
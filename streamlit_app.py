@@ -1,14 +1,62 @@
 import streamlit as st
-from app.schemas import PropertyInput, PhotoInput
+from app.config import AppConfig
+from app.schemas import PropertyInput, PropertyFields
 from app.pricing.assessor import assess
-from app.report.html import render_html
-import os, tempfile, base64, json
+from app.pricing.result_cache import data_version, with_subject
+from app.comps import aggregator
+from app.comps.cache import normalize_query
+from app.comps.store import load_store
+from app.model.market import load_market
+from app.model.regression import load_model
+from app.report.html import render_html, report_context
+from app.vision.features import photos_score, bytes_digest
+import os, json
+
+# relatórios guardados por sessão (os mais recentes primeiro)
+MAX_SESSION_REPORTS = 10
+
+cfg = AppConfig()
+
+def warm_up() -> None:
+    # stores dos conectores locais (com índices), agregados e modelo ficam nos caches
+    # dos próprios loaders (um por arquivo, trocado quando o mtime muda: memória
+    # estável a cada atualização dos dados); aqui só se garante que estejam prontos
+    for conn in aggregator.CONNECTORS:
+        path = getattr(conn, "path", None)
+        if path and os.path.exists(path):
+            store = load_store(path)
+            store.indices(cfg.target_property_type)
+            if cfg.comp_selection == "knn":
+                store.similarity(cfg.target_property_type, cfg.knn_scales or None)
+    if cfg.market_path:
+        load_market(cfg.market_path)
+    if cfg.model_path:
+        load_model(cfg.model_path)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def photo_score(digests: tuple, _images: list) -> float:
+    # score médio das fotos enviadas, direto dos bytes; memo pelos hashes (a ordem não muda a média)
+    return photos_score([], images=_images)
+
+@st.cache_data(max_entries=256, ttl=cfg.result_cache_ttl_s, show_spinner=False)
+def run_assessment(fields_key: str, image_score: float, version: tuple, _fields: dict) -> dict:
+    # memo pela impressão digital dos campos (sem caixa/espaços extras), score das fotos e versão dos dados
+    return assess(_fields, image_score=image_score)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def report_html(key: str, _res: dict, property_type: str, built_area_m2: float) -> str:
+    return render_html(report_context(_res, property_type, built_area_m2))
 
 st.set_page_config(page_title="Avaliador de Imóveis — MVP", layout="centered")
 
 st.title("Avaliador de Imóveis — MVP")
 st.caption("Estimativa rápida de aluguel e venda com base em endereço, fotos e comparáveis (dados de exemplo).")
 
+with st.spinner("Carregando comparáveis..."):
+    warm_up()
+version = data_version(cfg)
+reports = st.session_state.setdefault("reports", [])
+
 with st.form("form"):
     col1, col2 = st.columns(2)
     with col1:
@@ -39,26 +87,31 @@ with st.form("form"):
     submitted = st.form_submit_button("Rodar avaliação")
 
 if submitted:
-    # Salva fotos temporariamente
-    photo_inputs = []
-    if photos_files:
-        tmpdir = tempfile.mkdtemp()
-        for f in photos_files:
-            path = os.path.join(tmpdir, f.name)
-            with open(path, "wb") as out:
-                out.write(f.getbuffer())
-            photo_inputs.append(PhotoInput(path=path))
-    payload = PropertyInput(
+    fields = PropertyInput(
         address=address, city=city, state=state, country=country,
         property_type=property_type, built_area_m2=built_area_m2, land_area_m2=land_area_m2,
         bedrooms=bedrooms, bathrooms=bathrooms, parking=parking,
         ceiling_height_m=ceiling_height_m, energy_capacity_kva=energy_capacity_kva, dock_doors=dock_doors,
-        photos=photo_inputs
-    ).model_dump()
+    ).model_dump(exclude={"photos"})
 
     with st.spinner("Calculando..."):
-        res = assess(payload)
+        # fotos avaliadas em memória, dos buffers do upload (nada vai para o disco)
+        images = [f.getvalue() for f in (photos_files or [])]
+        img_score = photo_score(tuple(sorted(bytes_digest(b) for b in images)), images) if images else photos_score([])
+        res = run_assessment(normalize_query(fields), img_score, version, fields)
+        res = with_subject(res, PropertyFields(**fields))
+        key = json.dumps([fields, img_score, version], ensure_ascii=False, default=str)
+        html = report_html(key, res, property_type, built_area_m2)
 
+    # relatório da sessão: o mesmo pedido de novo não duplica, só volta ao topo
+    reports[:] = [r for r in reports if r["key"] != key]
+    reports.insert(0, {"key": key, "label": f"{address} — {city} ({built_area_m2:.0f} m²)",
+                       "result": res, "html": html})
+    del reports[MAX_SESSION_REPORTS:]
+
+# o último resultado da sessão continua na tela nas novas execuções (ex.: ao baixar o relatório)
+if reports:
+    res = reports[0]["result"]
     st.subheader("Resultado (resumo)")
     c1, c2 = st.columns(2)
     with c1:
@@ -79,36 +132,12 @@ if submitted:
     with st.expander("Comparáveis utilizados"):
         st.write(res["comps_used"])
 
-    # Relatório HTML para download
-    html = render_html({
-        "address": res["address_geocoded"]["address"],
-        "city": res["address_geocoded"]["city"],
-        "state": res["address_geocoded"]["state"],
-        "property_type": property_type,
-        "built_area_m2": built_area_m2,
-        "image_score": res["image_quality_score"],
-        "rental": {
-            "low_pm2": res["rental"]["per_m2_low"],
-            "p50_pm2": res["rental"]["per_m2_target"],
-            "high_pm2": res["rental"]["per_m2_high"],
-            "low_total": res["rental"]["total_low"],
-            "p50_total": res["rental"]["total_target"],
-            "high_total": res["rental"]["total_high"],
-        },
-        "sale": {
-            "low_pm2": res["sale"]["per_m2_low"],
-            "p50_pm2": res["sale"]["per_m2_target"],
-            "high_pm2": res["sale"]["per_m2_high"],
-            "low_total": res["sale"]["total_low"],
-            "p50_total": res["sale"]["total_target"],
-            "high_total": res["sale"]["total_high"],
-        },
-        "comps": res["comps_used"]
-    })
-    fname = "relatorio_avaliacao.html"
-    path = os.path.join(os.getcwd(), fname)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(html)
-
-    st.success("Relatório gerado.")
-    st.download_button("Baixar relatório HTML", data=html, file_name=fname, mime="text/html")
+    # só em memória, por sessão: nada é gravado no diretório corrente (compartilhado)
+    st.download_button("Baixar relatório HTML", data=reports[0]["html"], file_name="relatorio_avaliacao.html",
+                       mime="text/html", key="report_latest")
+
+    if len(reports) > 1:
+        with st.expander(f"Relatórios desta sessão ({len(reports)})"):
+            for i, r in enumerate(reports[1:], start=1):
+                st.download_button(r["label"], data=r["html"], file_name=f"relatorio_avaliacao_{i}.html",
+                                   mime="text/html", key=f"report_{i}")
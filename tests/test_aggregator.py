@@ -0,0 +1,162 @@
+"""
+Busca paralela nos conectores (app/comps/aggregator.py): timeout por fonte,
+prazo global e disjuntor, com conectores falsos locais que dormem ou falham.
+"""
+import asyncio, time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.config import AppConfig
+from app.comps import aggregator
+from app.comps.aggregator import CircuitBreaker, fetch_frame, afetch_frame
+from app.comps.connectors.base import BaseConnector
+
+# folga para agendamento de threads em máquina lenta
+SLACK_S = 0.25
+
+class Sleepy(BaseConnector):
+    def __init__(self, name: str, sleep_s: float, timeout_s=None):
+        self.name = name
+        self.sleep_s = sleep_s
+        self.timeout_s = timeout_s
+
+    def search(self, query: dict):
+        time.sleep(self.sleep_s)
+        return [{"id": f"{self.name}1", "source": self.name, "city": "Contagem", "property_type": "galpao",
+                 "price_per_m2": 25.0, "is_rental": True, "built_area_m2": 1000.0}]
+
+class Failing(BaseConnector):
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+
+    def search(self, query: dict):
+        self.calls += 1
+        raise RuntimeError("portal fora do ar")
+
+def _cfg(**kw) -> AppConfig:
+    base = dict(connector_timeout_s=0.2, comps_deadline_s=0.5, breaker_max_failures=2, breaker_reset_s=0.3)
+    base.update(kw)
+    return AppConfig(**base)
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    aggregator._breakers.clear()
+    yield
+    aggregator._breakers.clear()
+
+def _timed(mode: str, connectors, cfg):
+    # (frame, sources, segundos); no assíncrono o tempo é medido dentro do loop,
+    # pois asyncio.run ainda espera as threads dos conectores abandonados
+    if mode == "sync":
+        t0 = time.monotonic()
+        frame, sources = fetch_frame({"city": "Contagem"}, connectors=connectors, cfg=cfg)
+        return frame, sources, time.monotonic() - t0
+
+    async def run():
+        t0 = time.monotonic()
+        frame, sources = await afetch_frame({"city": "Contagem"}, connectors=connectors, cfg=cfg)
+        return frame, sources, time.monotonic() - t0
+    return asyncio.run(run())
+
+def _fetch(mode: str, connectors, cfg):
+    return _timed(mode, connectors, cfg)[:2]
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_sources_by_status(mode):
+    conns = [Sleepy("fast", 0.0), Sleepy("slow", 1.0), Failing("broken")]
+    frame, sources = _fetch(mode, conns, _cfg())
+    assert sources == {"ok": ["fast"], "timed_out": ["slow"], "failed": ["broken"], "skipped": []}
+    assert [c["source"] for c in frame.comps()] == ["fast"]
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_per_connector_timeout(mode):
+    # timeout_s do conector vale sobre o padrão da configuração
+    conns = [Sleepy("default", 0.3), Sleepy("patient", 0.3, timeout_s=0.45)]
+    _, sources = _fetch(mode, conns, _cfg(connector_timeout_s=0.1, comps_deadline_s=1.0))
+    assert sources["timed_out"] == ["default"] and sources["ok"] == ["patient"]
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_global_deadline_bounds_total_time(mode):
+    cfg = _cfg(connector_timeout_s=5.0, comps_deadline_s=0.3)
+    conns = [Sleepy(f"s{i}", 1.0) for i in range(3)]
+    _, sources, elapsed = _timed(mode, conns, cfg)
+    assert elapsed < cfg.comps_deadline_s + SLACK_S
+    assert sorted(sources["timed_out"]) == ["s0", "s1", "s2"]
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_breaker_skips_failing_source_then_recovers(mode):
+    cfg = _cfg()
+    broken = Failing("flaky")
+    for _ in range(cfg.breaker_max_failures):
+        assert _fetch(mode, [broken], cfg)[1]["failed"] == ["flaky"]
+    assert aggregator.breaker_for("flaky", cfg).state == "open"
+    _, sources = _fetch(mode, [broken], cfg)
+    assert sources["skipped"] == ["flaky"] and broken.calls == cfg.breaker_max_failures
+
+    # passado o reset, uma chamada de teste: a fonte voltou, o disjuntor fecha
+    time.sleep(cfg.breaker_reset_s + 0.05)
+    assert aggregator.breaker_for("flaky", cfg).state == "half_open"
+    _, sources = _fetch(mode, [Sleepy("flaky", 0.0)], cfg)
+    assert sources["ok"] == ["flaky"]
+    assert aggregator.breaker_for("flaky", cfg).state == "closed"
+
+def test_in_flight_limit_skips_busy_source():
+    # chamadas abandonadas no timeout seguem ocupando a vaga até terminarem
+    cfg = _cfg(connector_timeout_s=0.1, connector_max_in_flight=2, breaker_max_failures=10)
+    hung = Sleepy("hung", 0.6)
+    for _ in range(2):
+        assert _fetch("sync", [hung], cfg)[1]["timed_out"] == ["hung"]
+    _, sources = _fetch("sync", [hung, Sleepy("fine", 0.0)], cfg)
+    assert sources["skipped"] == ["hung"] and sources["ok"] == ["fine"]
+    assert aggregator.breaker_for("hung", cfg).failures == 2  # cheio não conta como falha
+    time.sleep(0.7)
+    assert aggregator.breaker_for("hung", cfg).in_flight == 0
+    assert _fetch("sync", [Sleepy("hung", 0.0)], cfg)[1]["ok"] == ["hung"]
+
+def test_in_flight_limit_async():
+    # no mesmo loop (como no servidor): a tarefa abandonada não é cancelada
+    cfg = _cfg(connector_timeout_s=0.1, connector_max_in_flight=2, breaker_max_failures=10)
+    hung = Sleepy("hung", 0.6)
+
+    async def run():
+        for _ in range(2):
+            assert (await afetch_frame({}, connectors=[hung], cfg=cfg))[1]["timed_out"] == ["hung"]
+        _, sources = await afetch_frame({}, connectors=[hung, Sleepy("fine", 0.0)], cfg=cfg)
+        assert sources["skipped"] == ["hung"] and sources["ok"] == ["fine"]
+        await asyncio.sleep(0.7)
+        assert aggregator.breaker_for("hung", cfg).in_flight == 0
+        assert (await afetch_frame({}, connectors=[Sleepy("hung", 0.0)], cfg=cfg))[1]["ok"] == ["hung"]
+    asyncio.run(run())
+
+def test_timeout_starts_when_the_call_runs(monkeypatch):
+    # pool de uma thread: "healthy" espera "hog" na fila; só o tempo rodando conta no timeout dela
+    monkeypatch.setattr(aggregator, "_EXECUTOR", ThreadPoolExecutor(1))
+    conns = [Sleepy("hog", 0.3, timeout_s=0.1), Sleepy("healthy", 0.05, timeout_s=0.2)]
+    _, sources = _fetch("sync", conns, _cfg(comps_deadline_s=1.0))
+    assert sources["timed_out"] == ["hog"] and sources["ok"] == ["healthy"]
+
+def test_queued_past_deadline_is_skipped_not_failed(monkeypatch):
+    monkeypatch.setattr(aggregator, "_EXECUTOR", ThreadPoolExecutor(1))
+    cfg = _cfg(connector_timeout_s=5.0, comps_deadline_s=0.2, breaker_max_failures=1)
+    _, sources, elapsed = _timed("sync", [Sleepy("hog", 0.5), Sleepy("healthy", 0.0)], cfg)
+    assert sources["timed_out"] == ["hog"] and sources["skipped"] == ["healthy"]
+    assert elapsed < cfg.comps_deadline_s + SLACK_S
+    healthy = aggregator.breaker_for("healthy", cfg)
+    assert healthy.state == "closed" and healthy.failures == 0 and healthy.in_flight == 0
+
+def test_breaker_transitions():
+    b = CircuitBreaker(max_failures=2, reset_after_s=0.2)
+    assert b.state == "closed" and b.allow()
+    b.record_failure()
+    assert b.state == "closed"
+    b.record_failure()
+    assert b.state == "open" and not b.allow()
+    time.sleep(0.25)
+    assert b.state == "half_open"
+    assert b.allow() and not b.allow()  # uma só chamada de teste
+    b.record_failure()  # teste falhou: reabre
+    assert b.state == "open"
+    time.sleep(0.25)
+    assert b.allow()
+    b.record_success()
+    assert b.state == "closed" and b.allow() and b.failures == 0
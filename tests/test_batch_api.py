@@ -0,0 +1,27 @@
+"""
+/assess/batch sob o limite de avaliações da API (AdmissionGate) e com
+tamanho máximo de lote.
+"""
+from fastapi.testclient import TestClient
+from app import main
+from app.utils.concurrency import AdmissionGate
+
+ITEM = {"address": "Av. João César de Oliveira, 3000", "city": "Contagem", "state": "MG", "built_area_m2": 1500}
+
+def test_batch_runs_under_the_gate():
+    r = TestClient(main.app).post("/assess/batch", json={"items": [ITEM, {"city": "Contagem"}], "include_comps": False})
+    assert r.status_code == 200
+    assert [x["ok"] for x in r.json()["results"]] == [True, False]
+    assert main.gate.active == 0
+
+def test_batch_saturated_gets_429(monkeypatch):
+    monkeypatch.setattr(main, "gate", AdmissionGate(0, 0))
+    for route in ("/assess/batch", "/report/batch"):
+        r = TestClient(main.app).post(route, json={"items": [ITEM]})
+        assert r.status_code == 429 and r.headers["Retry-After"] == "1"
+
+def test_batch_size_limit(monkeypatch):
+    monkeypatch.setattr(main._cfg, "batch_max_items", 2)
+    for route in ("/assess/batch", "/report/batch"):
+        r = TestClient(main.app).post(route, json={"items": [ITEM] * 3})
+        assert r.status_code == 422 and "máximo 2" in r.json()["detail"]
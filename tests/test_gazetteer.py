@@ -0,0 +1,31 @@
+"""
+Resolução de cidade no gazetteer local e memo do geocode.
+"""
+from app.geo.gazetteer import Gazetteer, load_gazetteer
+from app.geo.geocode import geocode_match
+
+def test_state_is_respected():
+    g = load_gazetteer()
+    assert g.resolve_city("Sao Paulo", "MG") is None
+    assert g.resolve_city("Sao Paulo", "SP")[1]["state"] == "SP"
+    assert g.resolve_city("Contagem", "XX") is None
+    assert geocode_match("Rua X, 1", "Sao Paulo", "MG", "BR") is None
+
+def test_prefix_scores_below_exact():
+    g = load_gazetteer()
+    score, c = g.resolve_city("Lagoa", "MG")
+    assert c["name"] == "Lagoa Santa" and score == len("lagoa") / len("lagoa santa")
+    assert g.resolve_city("Contagem", "mg")[0] == 1.0
+
+def test_state_filter_applies_before_fuzzy_ranking():
+    # seis quase iguais em SP, na frente; a de MA só aparece se o estado filtra antes do top-k
+    names = [(f"Santa Ines{c}", "SP") for c in "abcdef"] + [("Santa Inesz", "MA")]
+    g = Gazetteer([{"kind": "city", "name": n, "city": n, "state": st, "lat": 0.0, "lon": 0.0} for n, st in names])
+    score, c = g.resolve_city("Santa Inesq", "MA")
+    assert c["name"] == "Santa Inesz" and score < 1.0
+
+def test_geocode_returns_fresh_dicts():
+    args = ("Av. João César de Oliveira, 3000", "Contagem", "MG", "BR")
+    first = geocode_match(*args)
+    first["lat"] = 0.0
+    assert geocode_match(*args)["lat"] != 0.0
@@ -0,0 +1,51 @@
+"""
+Agregados de mercado H3: CLI reexecutado sobre as mesmas fontes e consultas
+concorrentes com lotes chegando.
+"""
+import json, sys, threading
+from app.comps.store import CompStore
+from app.model import market
+from app.model.market import MarketAggregates
+
+SAMPLE = "data/sample_listings.json"
+
+def _cli(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["market", *argv])
+    market.main()
+
+def test_cli_rerun_does_not_double_count(tmp_path, monkeypatch, capsys):
+    out = str(tmp_path / "market")
+    _cli(monkeypatch, SAMPLE, "--out", out)
+    first = len(MarketAggregates.open(out))
+    _cli(monkeypatch, SAMPLE, "--out", out)
+    assert first > 0 and len(MarketAggregates.open(out)) == first
+    assert json.loads(capsys.readouterr().out.splitlines()[-1])["listings"] == first
+
+def test_concurrent_adds_and_queries():
+    table = CompStore.from_json(SAMPLE).table
+    agg = MarketAggregates()
+    per = agg.add_table(table)
+    c = table.comp(0)
+    errors = []
+
+    def read():
+        try:
+            for _ in range(200):
+                est = agg.estimate(c["lat"], c["lon"], c["property_type"], c["is_rental"], months=1200)
+                assert est is not None and est["n"] >= 1
+                agg.heatmap(c["property_type"], c["is_rental"], months=1200)
+        except Exception as e:
+            errors.append(e)
+
+    def write():
+        for _ in range(25):
+            agg.add_table(table)
+            len(agg)
+
+    threads = [threading.Thread(target=read) for _ in range(3)] + [threading.Thread(target=write) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len(agg) == per * (1 + 3 * 25)  # nenhum lote perdido durante a consolidação
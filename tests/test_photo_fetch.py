@@ -0,0 +1,166 @@
+"""
+Estágio de download das fotos (app/vision/fetch.py) contra um servidor de
+arquivos estáticos local (http.server, com ETag/If-None-Match).
+"""
+import functools, hashlib, os, socket, threading, time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.config import AppConfig
+from app.utils.cache import SQLiteCache
+from app.vision.features import score_photos, score_urls
+from app.vision import fetch as fetch_mod
+from app.vision.fetch import PhotoFetcher
+from benchmarks.synthetic import write_photos
+
+MAX_BYTES = 2_000_000
+SLOW_S = 0.3
+
+class _Handler(SimpleHTTPRequestHandler):
+    # arquivos do diretório com ETag (hash do conteúdo) e 304 para If-None-Match igual
+    statuses = []
+    hosts = []
+
+    def do_GET(self):
+        name = self.path.split("?")[0].lstrip("/")
+        self.hosts.append(self.headers.get("Host"))
+        if name == "slow":
+            # cabeçalhos já, corpo só depois de SLOW_S
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.flush()
+            time.sleep(SLOW_S)
+            self.wfile.write(b"x" * 1000)
+            return
+        if name == "redirect":
+            self.send_response(302)
+            self.send_header("Location", f"http://localhost:{self.server.server_port}/photo_0.jpg")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        path = os.path.join(self.directory, name)
+        if not os.path.isfile(path):
+            self.statuses.append(404)
+            return self.send_error(404)
+        with open(path, "rb") as f:
+            body = f.read()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.statuses.append(304)
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.statuses.append(200)
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture()
+def server(tmp_path):
+    photos = write_photos(str(tmp_path / "www"), 3, size=600)
+    with open(tmp_path / "www" / "big.bin", "wb") as f:
+        f.write(b"x" * (MAX_BYTES + 1))
+    _Handler.statuses = []
+    _Handler.hosts = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_Handler, directory=str(tmp_path / "www")))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}", photos
+    httpd.shutdown()
+    httpd.server_close()
+
+def _fetcher(tmp_path, **kw) -> PhotoFetcher:
+    cfg = AppConfig(photo_fetch_cache_path=str(tmp_path / "bytes.sqlite"), photo_max_bytes=MAX_BYTES,
+                    photo_fetch_allowed_hosts=["127.0.0.1"], **kw)
+    return PhotoFetcher(cfg)
+
+def test_url_scores_match_local_files(server, tmp_path):
+    base, photos = server
+    urls = [f"{base}/{os.path.basename(p)}" for p in photos]
+    scores = score_urls(urls, workers=1, cache=SQLiteCache(str(tmp_path / "scores.sqlite")),
+                        fetcher=_fetcher(tmp_path))
+    assert scores == score_photos(photos, workers=1, use_cache=False)
+    assert all(s is not None for s in scores)
+
+def test_missing_and_oversized_give_none(server, tmp_path):
+    base, _ = server
+    fetcher = _fetcher(tmp_path)
+    assert fetcher.fetch(f"{base}/nope.jpg") is None
+    assert fetcher.fetch(f"{base}/big.bin") is None
+    assert score_urls([f"{base}/nope.jpg", f"{base}/big.bin"], workers=1, use_cache=False,
+                      fetcher=fetcher) == [None, None]
+
+def test_etag_revalidation_gets_304(server, tmp_path):
+    base, photos = server
+    fetcher = _fetcher(tmp_path, photo_fetch_ttl_s=0.0)  # sempre revalida
+    url = f"{base}/{os.path.basename(photos[0])}"
+    first = fetcher.fetch(url)
+    second = fetcher.fetch(url)
+    assert first is not None and second == first
+    assert _Handler.statuses == [200, 304]
+
+def test_fresh_cache_skips_the_server(server, tmp_path):
+    base, photos = server
+    fetcher = _fetcher(tmp_path)
+    url = f"{base}/{os.path.basename(photos[0])}"
+    assert fetcher.fetch(url) == fetcher.fetch(url)
+    assert _Handler.statuses == [200]
+
+def test_internal_addresses_are_refused(server, tmp_path):
+    base, photos = server
+    # sem lista de hosts: loopback recusado
+    fetcher = PhotoFetcher(AppConfig(photo_fetch_cache_path=None))
+    assert fetcher.fetch(f"{base}/{os.path.basename(photos[0])}") is None
+    assert fetcher.fetch("file:///etc/passwd") is None
+    # redirecionamento para host fora da lista também
+    assert _fetcher(tmp_path).fetch(f"{base}/redirect") is None
+    assert _Handler.statuses == []
+
+def test_host_slot_held_while_reading_body(server, tmp_path):
+    base, _ = server
+    fetcher = _fetcher(tmp_path, photo_fetch_per_host=1, photo_fetch_workers=4)
+    t0 = time.monotonic()
+    got = list(fetcher.fetch_many([f"{base}/slow?{i}" for i in range(4)]))
+    # um download por vez no host: os corpos lentos não se sobrepõem
+    assert time.monotonic() - t0 >= 3 * SLOW_S
+    assert all(data == b"x" * 1000 for _, data in got)
+
+def _fake_dns(monkeypatch, answers):
+    # "photos.test" resolve para answers (um por consulta, o último se repete)
+    real = socket.getaddrinfo
+    seen = []
+
+    def getaddrinfo(host, port, *args, **kw):
+        if host != "photos.test":
+            return real(host, port, *args, **kw)
+        addr = answers[min(len(seen), len(answers) - 1)]
+        seen.append(addr)
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (addr, port))]
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    return seen
+
+def test_connects_to_the_checked_address(server, tmp_path, monkeypatch):
+    base, photos = server
+    port = base.rsplit(":", 1)[1]
+    _fake_dns(monkeypatch, ["127.0.0.1"])
+    monkeypatch.setattr(fetch_mod, "_is_public", lambda addr: True)  # loopback faz o papel do IP público
+    fetcher = PhotoFetcher(AppConfig(photo_fetch_cache_path=None))
+    url = f"http://photos.test:{port}/{os.path.basename(photos[0])}"
+    with open(photos[0], "rb") as f:
+        assert fetcher.fetch(url) == f.read()
+    assert _Handler.hosts == [f"photos.test:{port}"]
+
+def test_dns_rebinding_is_refused(server, tmp_path, monkeypatch):
+    base, photos = server
+    port = base.rsplit(":", 1)[1]
+    # público nas verificações, loopback na consulta seguinte (a da conexão)
+    seen = _fake_dns(monkeypatch, ["93.184.216.34", "93.184.216.34", "127.0.0.1"])
+    fetcher = PhotoFetcher(AppConfig(photo_fetch_cache_path=None))
+    assert fetcher.fetch(f"http://photos.test:{port}/{os.path.basename(photos[0])}") is None
+    assert len(seen) == 3 and _Handler.statuses == []
@@ -0,0 +1,34 @@
+"""
+Relatório HTML (/report): texto do cliente e dos portais sai escapado.
+"""
+from fastapi.testclient import TestClient
+from app.main import app
+from app.comps import aggregator
+from app.comps.connectors.base import BaseConnector
+
+SCRIPT = "<script>alert(1)</script>"
+IMG = "<img src=x onerror=alert(1)>"
+
+class Hostile(BaseConnector):
+    # portal que devolve marcação no título e na cidade
+    name = "hostile"
+
+    def search(self, query: dict):
+        return [{"id": f"h{i}", "source": self.name, "title": IMG, "city": "Contagem" + SCRIPT, "state": "MG",
+                 "property_type": "galpao", "price_per_m2": 25.0 + i, "is_rental": i % 2 == 0,
+                 "built_area_m2": 1000.0 + 10 * i, "lat": -19.93, "lon": -44.05} for i in range(20)]
+
+def test_report_escapes_address_and_comps(monkeypatch):
+    monkeypatch.setattr(aggregator, "CONNECTORS", [Hostile()])
+    client = TestClient(app)
+    r = client.post("/report", json={"address": SCRIPT + " 100", "city": "Contagem", "state": "MG",
+                                     "built_area_m2": 1500})
+    assert r.status_code == 200 and r.text.count("hostile") > 0
+    assert "<script>" not in r.text and "<img" not in r.text
+    assert "&lt;script&gt;alert(1)&lt;/script&gt; 100" in r.text
+    assert "&lt;img src=x onerror=alert(1)&gt;" in r.text
+
+def test_report_get_escapes_query_string():
+    r = TestClient(app).get("/report", params={"address": SCRIPT, "city": "Contagem", "state": "MG",
+                                               "built_area_m2": 1500})
+    assert r.status_code == 200 and "<script>" not in r.text
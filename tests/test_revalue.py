@@ -0,0 +1,36 @@
+"""
+Saída Parquet da reavaliação de carteira: partes de blocos com e sem erros
+com os mesmos tipos de coluna (pandas.read_parquet do diretório).
+"""
+import pytest
+from app.pricing.revalue import FLAT_COLUMNS, _ParquetSink, parquet_frame, run_chunk
+
+GOOD = {"id": 7, "address": "Av. João César de Oliveira, 3000", "city": "Contagem", "state": "MG",
+        "built_area_m2": "1500"}
+
+def _chunks():
+    # bloco 0 só com sucesso (error todo None), bloco 1 só com erros (resultados todos None)
+    _, ok_rows = run_chunk(0, 0, [GOOD])
+    _, bad_rows = run_chunk(1, 1, [{"_error": "linha 2: JSON inválido"}, {"id": "x", "city": "Contagem"}])
+    assert [r["ok"] for r in ok_rows + bad_rows] == [True, False, False]
+    return ok_rows, bad_rows
+
+def test_frames_have_fixed_dtypes():
+    ok_rows, bad_rows = _chunks()
+    ok, bad = parquet_frame(ok_rows), parquet_frame(bad_rows)
+    assert list(ok.columns) == list(FLAT_COLUMNS)
+    assert ok.dtypes.to_dict() == bad.dtypes.to_dict()
+    assert str(ok.dtypes["error"]) == "string" and str(bad.dtypes["rental_per_m2_target"]) == "float64"
+    assert ok["id"].tolist() == ["7"] and ok["built_area_m2"].tolist() == [1500.0]
+
+def test_parquet_parts_read_back_together(tmp_path):
+    pytest.importorskip("pyarrow", exc_type=ImportError)  # pyarrow instalado mas quebrado também pula
+    import pandas as pd
+    ok_rows, bad_rows = _chunks()
+    sink = _ParquetSink(str(tmp_path / "out.parquet"), 0)
+    sink.write(1, bad_rows)
+    sink.write(0, ok_rows)
+    df = pd.read_parquet(str(tmp_path / "out.parquet")).sort_values("index")
+    assert df["index"].tolist() == [0, 1, 2]
+    assert df["error"].tolist()[1] == "linha 2: JSON inválido" and pd.isna(df["error"].tolist()[0])
+    assert df["rental_per_m2_target"].notna().tolist() == [True, False, False]
@@ -0,0 +1,38 @@
+"""
+Snapshots de CompTable enviados a outro processo (pickle) enquanto uma
+ingestão troca o diretório.
+"""
+import pickle
+import numpy as np
+import pytest
+from app.comps.table import CompFrame, CompTable, SnapshotWriter
+
+def _records(tag: str, n: int):
+    return [{"id": f"{tag}{i}", "title": f"{tag} {i}", "city": "Contagem", "property_type": "galpao",
+             "price_per_m2": 20.0 + i, "is_rental": True, "built_area_m2": 1000.0 + i} for i in range(n)]
+
+def _snapshot(path: str, tag: str, n: int) -> str:
+    w = SnapshotWriter(path)
+    w.add(_records(tag, n))
+    return w.close()
+
+def test_compact_frame_survives_snapshot_swap(tmp_path):
+    path = _snapshot(str(tmp_path / "snap"), "old", 50)
+    table = CompTable.open(path)
+    frame = CompFrame.of(table, np.array([40, 3, 17, 3]), np.array([1.0, 2.0, np.nan, 4.0]))
+    payload = pickle.dumps(frame.compact())
+    _snapshot(path, "new", 50)  # ingestão troca o diretório
+
+    got = pickle.loads(payload)
+    assert [c["id"] for c in got.comps()] == ["old40", "old3", "old17", "old3"]
+    assert got.column("price_per_m2").tolist() == [60.0, 23.0, 37.0, 23.0]
+    assert [c["distance_km"] for c in got.comps()] == [1.0, 2.0, None, 4.0]
+
+def test_pickled_snapshot_refuses_a_swapped_directory(tmp_path):
+    path = _snapshot(str(tmp_path / "snap"), "old", 5)
+    table = CompTable.open(path)
+    assert pickle.loads(pickle.dumps(table)).record(2)["id"] == "old2"
+    payload = pickle.dumps(table)
+    _snapshot(path, "new", 5)
+    with pytest.raises(ValueError):
+        pickle.loads(payload)